@@ -1,12 +1,17 @@
 #!/usr/bin/env python3
 """
 Script para buscar contract_id pelo contract_number e preencher na planilha
+Busca todos os pares (contract_number, id) do tenant de uma vez e faz um único merge
 """
 
 import os
 import pandas as pd
 from dotenv import load_dotenv
-from supabase import create_client, Client
+from supabase import ClientOptions, create_client, Client
+
+from src.config import get_http_client
+from src.paginacao import paginar_keyset
+from src.perfil import imprimir_se_ativo
 
 # Carregar variáveis de ambiente
 load_dotenv()
@@ -16,80 +21,99 @@ SUPABASE_URL = os.getenv('SUPABASE_URL')
 SUPABASE_KEY = os.getenv('SUPABASE_SERVICE_KEY') or os.getenv('SUPABASE_KEY')
 TENANT_ID = '8d2888f1-64a5-445f-84f5-2614d5160251'  # Tenant correto baseado nos dados
 
-def get_contract_id(contract_number, supabase_client):
-    """Busca o contract_id pelo contract_number"""
-    try:
-        response = supabase_client.table('contracts').select('id').eq('contract_number', contract_number).eq('tenant_id', TENANT_ID).execute()
-        if response.data and len(response.data) > 0:
-            return response.data[0]['id']
-        return None
-    except Exception as e:
-        print(f"Erro ao buscar contract_id para {contract_number}: {e}")
-        return None
+def normalize_contract_numbers(values: pd.Series) -> pd.Series:
+    """Normaliza CodGE/contract_number para texto ('27868.0' e 27868 viram '27868')"""
+    return (
+        values.astype('string')
+        .str.strip()
+        .str.replace(r'\.0+$', '', regex=True)
+        .fillna('')
+    )
+
+def fetch_contract_ids(supabase_client, tenant_id=TENANT_ID) -> pd.DataFrame:
+    """Busca todos os pares (contract_number, id) do tenant, paginando por id"""
+    rows = []
+    for page in paginar_keyset(
+        supabase_client,
+        'contracts',
+        'id,contract_number',
+        filtros=[('tenant_id', tenant_id)],
+    ):
+        rows.extend(page)
+    contracts = pd.DataFrame(rows, columns=['id', 'contract_number'])
+    contracts['_codge'] = normalize_contract_numbers(contracts['contract_number'])
+    # Em caso de números repetidos no tenant, mantém o primeiro id
+    return (
+        contracts[contracts['_codge'] != '']
+        .drop_duplicates('_codge')
+        .rename(columns={'id': '_contract_id'})[['_codge', '_contract_id']]
+    )
+
+def fill_contract_ids(df: pd.DataFrame, contracts: pd.DataFrame):
+    """Preenche df['contract_id'] com um merge; retorna (df, não encontrados)"""
+    df = df.copy()
+    df['_codge'] = normalize_contract_numbers(df['CodGE'])
+    merged = df.merge(contracts, on='_codge', how='left', indicator=True, validate='many_to_one')
+
+    found = merged['_merge'] == 'both'
+    if 'contract_id' not in merged.columns:
+        merged['contract_id'] = ''
+    merged['contract_id'] = merged['contract_id'].astype('object')
+    merged.loc[found, 'contract_id'] = merged.loc[found, '_contract_id']
+
+    # Anti-join: linhas com CodGE que não existem no banco
+    not_found = merged[(~found) & (merged['_codge'] != '')]
+    not_found = not_found[[c for c in ('CodGE', 'customer_id', 'loja') if c in not_found.columns]]
+
+    filled = merged.drop(columns=['_codge', '_contract_id', '_merge'])
+    return filled, not_found
 
 def main():
     """Função principal"""
     if not SUPABASE_URL or not SUPABASE_KEY:
         print("Erro: SUPABASE_URL e SUPABASE_KEY são obrigatórios")
         return
-    
+
     # Inicializar Supabase
-    supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
-    
+    supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY, options=ClientOptions(httpx_client=get_http_client()))
+
     # Caminho do arquivo
     file_path = "python/contratos_prontos.xlsx"
-    
+
     try:
         # Carregar a planilha
         df = pd.read_excel(file_path)
         print(f"Planilha carregada com {len(df)} linhas")
-        
-        # Verificar se a coluna contract_id já existe, se não, criar
-        if 'contract_id' not in df.columns:
-            df['contract_id'] = ''
-        
-        # Processar cada linha
-        found_count = 0
-        not_found_count = 0
-        
-        for index, row in df.iterrows():
-            contract_number = row['CodGE']
-            
-            # Pular linhas sem contract_number
-            if pd.isna(contract_number) or contract_number == '':
-                continue
-            
-            # Buscar o contract_id
-            contract_id = get_contract_id(contract_number, supabase)
-            
-            if contract_id:
-                df.at[index, 'contract_id'] = contract_id
-                found_count += 1
-                print(f"Linha {index + 1}: Contract {contract_number} -> ID: {contract_id}")
-            else:
-                not_found_count += 1
-                print(f"Linha {index + 1}: Contract {contract_number} -> NÃO ENCONTRADO")
-        
+
+        # Buscar todos os contratos do tenant de uma vez
+        contracts = fetch_contract_ids(supabase)
+        print(f"Contratos carregados do Supabase: {len(contracts)}")
+
+        df, not_found_df = fill_contract_ids(df, contracts)
+        not_found_count = len(not_found_df)
+        found_count = int((normalize_contract_numbers(df['CodGE']) != '').sum()) - not_found_count
+
         # Salvar a planilha atualizada
         output_file = "python/contratos_prontos_with_ids.xlsx"
         df.to_excel(output_file, index=False)
-        
+
         print(f"\nResumo:")
         print(f"- Contratos encontrados: {found_count}")
         print(f"- Contratos não encontrados: {not_found_count}")
         print(f"- Planilha salva em: {output_file}")
-        
+
         # Criar relatório de não encontrados
         if not_found_count > 0:
-            not_found_df = df[df['contract_id'] == ''][['CodGE', 'customer_id', 'loja']].dropna(subset=['CodGE'])
             not_found_file = "python/contract_numbers_not_found.csv"
             not_found_df.to_csv(not_found_file, index=False)
             print(f"- Relatório de não encontrados salvo em: {not_found_file}")
-            
+
     except Exception as e:
         print(f"Erro ao processar planilha: {e}")
         import traceback
         traceback.print_exc()
 
+    imprimir_se_ativo()
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -6,8 +6,18 @@ Script para importar serviços dos contratos do Excel para Supabase
 import openpyxl
 import os
 from datetime import datetime
+import numpy as np
 from dotenv import load_dotenv
-from supabase import create_client, Client
+from supabase import ClientOptions, create_client, Client
+
+from src.config import get_http_client
+from src.escrita import ErroEscrita
+from src.outbox import DrenadorOutbox, outbox_do_ambiente
+from src import memoria
+from src.perfil import imprimir_se_ativo
+from src.rastreamento import iniciar_se_ativo
+from src.planilha import iter_projetado, ler_cabecalho
+from src.vinculos import gravar_vinculos
 
 # Carregar variáveis de ambiente
 load_dotenv()
@@ -32,16 +42,14 @@ SERVICES_MAPPING = {
     'Balanca Auto Servico': None  # Precisa ser descoberto
 }
 
-def get_contract_id_by_number(supabase: Client, contract_number: str, tenant_id: str):
-    """Busca o ID do contrato pelo número"""
-    try:
-        response = supabase.table('contracts').select('id').eq('contract_number', contract_number).eq('tenant_id', tenant_id).execute()
-        if response.data and len(response.data) > 0:
-            return response.data[0]['id']
-        return None
-    except Exception as e:
-        print(f"Erro ao buscar contrato {contract_number}: {e}")
-        return None
+# Colunas fixas da planilha
+CONTRACT_NUMBER_COL = 2  # CodGE
+CUSTOMER_ID_COL = 3
+COST_COL = 10            # Custo
+CONTRACT_ID_COL = 23     # contract_id
+
+# Único serviço que recebe o custo rateado da linha
+COST_SERVICE = 'Gestao'
 
 def parse_service_value(value):
     """Converte valor do serviço para quantidade"""
@@ -51,41 +59,66 @@ def parse_service_value(value):
     if str(value).strip().upper() in ['SIM', 'YES', 'TRUE', '1']:
         return 1
     
-    # Se for número, retorna o número
+    # Se for número, retorna o número (negativos não são quantidade: serviço inativo)
     try:
-        return int(float(str(value)))
+        return max(0, int(float(str(value))))
     except (ValueError, TypeError):
         return 0
 
-def create_contract_service(supabase: Client, contract_id: str, service_id: str, quantity: int, tenant_id: str, cost_price: float = 0.0):
-    """Cria um serviço de contrato no Supabase"""
+def montar_vinculo(contract_id: str, service_id: str, quantity: int, tenant_id: str, cost_price: float = 0.0, agora: str = None):
+    """Registro de contract_services de um serviço da planilha (valores padrão da importação)"""
+    return {
+        'contract_id': contract_id,
+        'service_id': service_id,
+        'quantity': quantity,
+        'unit_price': 35.00,  # Preço padrão por unidade
+        'discount_percentage': 0,
+        'description': 'Serviço importado da planilha',
+        'is_active': True,
+        'tenant_id': tenant_id,
+        'payment_method': 'Boleto',
+        'billing_type': 'Único',
+        'recurrence_frequency': 'Mensal',
+        'installments': 1,
+        'due_type': 'days_after_billing',
+        'due_value': 5,
+        'generate_billing': False,  # FALSE conforme schema
+        'cost_price': cost_price,  # Custo do serviço
+        # created_at fica com o default do banco: o upsert não deve sobrescrevê-lo ao reexecutar
+        'updated_at': agora or datetime.now().isoformat()
+    }
+
+def _por_valor(valores, converter, dtype):
+    """Aplica `converter` uma vez por valor distinto da coluna e devolve o array resultante"""
+    convertidos = {v: converter(v) for v in set(valores)}
+    return np.fromiter((convertidos[v] for v in valores), dtype=dtype, count=len(valores))
+
+def _custo(value):
     try:
-        contract_service_data = {
-            'contract_id': contract_id,
-            'service_id': service_id,
-            'quantity': quantity,
-            'unit_price': 35.00,  # Preço padrão por unidade
-            'discount_percentage': 0,
-            'description': 'Serviço importado da planilha',
-            'is_active': True,
-            'tenant_id': tenant_id,
-            'payment_method': 'Boleto',
-            'billing_type': 'Único',
-            'recurrence_frequency': 'Mensal',
-            'installments': 1,
-            'due_type': 'days_after_billing',
-            'due_value': 5,
-            'generate_billing': False,  # FALSE conforme schema
-            'cost_price': cost_price,  # Custo do serviço
-            'created_at': datetime.now().isoformat(),
-            'updated_at': datetime.now().isoformat()
-        }
-        
-        response = supabase.table('contract_services').insert(contract_service_data).execute()
-        return True, None
-        
-    except Exception as e:
-        return False, str(e)
+        return float(value) if value else 0.0
+    except (ValueError, TypeError):
+        return 0.0
+
+def ratear_custos(quantidades: np.ndarray, custos: np.ndarray) -> np.ndarray:
+    """Custo de cada linha dividido pelo número de serviços ativos (quantidade > 0) da linha"""
+    ativos = (quantidades > 0).sum(axis=1)
+    return np.divide(custos, ativos, out=np.zeros_like(custos), where=ativos > 0)
+
+def montar_vinculos(contract_ids, quantidades, custo_por_servico, service_ids, cost_col_idx, tenant_id):
+    """Todos os registros de contract_services da planilha de uma vez (células com quantidade > 0)"""
+    linhas, colunas = np.nonzero(quantidades > 0)
+    agora = datetime.now().isoformat()
+    return [
+        montar_vinculo(
+            contract_ids[i],
+            service_ids[j],
+            int(quantidades[i, j]),
+            tenant_id,
+            float(custo_por_servico[i]) if j == cost_col_idx else 0.0,
+            agora,
+        )
+        for i, j in zip(linhas.tolist(), colunas.tolist())
+    ]
 
 def main():
     """Função principal"""
@@ -94,7 +127,7 @@ def main():
         return
     
     # Inicializar Supabase
-    supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+    supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY, options=ClientOptions(httpx_client=get_http_client()))
     
     # Carregar Excel
     excel_path = 'python/contratos_prontos_with_ids.xlsx'
@@ -102,92 +135,93 @@ def main():
         print(f"Erro: Arquivo {excel_path} não encontrado")
         return
     
-    wb = openpyxl.load_workbook(excel_path)
+    # Outbox opcional (SUPABASE_OUTBOX): escritas vão para o SQLite local e são enviadas em segundo plano
+    outbox = outbox_do_ambiente()
+    drenador = DrenadorOutbox(outbox, supabase).iniciar() if outbox else None
+    
+    memoria.iniciar_se_ativo()
+    iniciar_se_ativo()
+    etapa = memoria.iniciar_etapa("carregar_planilha")
+    wb = openpyxl.load_workbook(excel_path, read_only=True, data_only=True)
     ws = wb.active
+    etapa.encerrar()
     
     # Identificar colunas de serviços
     service_columns = {}
-    for col in range(1, ws.max_column + 1):
-        header = ws.cell(row=1, column=col).value
-        if header and header.strip() in SERVICES_MAPPING:
+    for col, header in enumerate(ler_cabecalho(ws), start=1):
+        if isinstance(header, str) and header.strip() in SERVICES_MAPPING:
             service_columns[header.strip()] = col
     
     print(f"Serviços encontrados na planilha: {list(service_columns.keys())}")
     
-    # Estatísticas
-    total_linhas = 0
+    # Lê de uma vez só as colunas usadas (linha 3 em diante, pulando cabeçalhos)
+    etapa = memoria.iniciar_etapa("leitura")
+    fixed_cols = [CONTRACT_NUMBER_COL, CUSTOMER_ID_COL, COST_COL, CONTRACT_ID_COL]
+    rows = [valores for _, valores in iter_projetado(ws, fixed_cols + list(service_columns.values()), min_row=3)]
+    wb.close()
+    colunas = list(zip(*rows)) if rows else [()] * (len(fixed_cols) + len(service_columns))
+    contract_numbers, customer_ids, cost_values, contract_ids = colunas[:4]
+    total_linhas = len(rows)
+    etapa.encerrar()
+    
+    # Matriz linhas x serviços com as quantidades; custo rateado entre os serviços ativos de cada linha
+    etapa = memoria.iniciar_etapa("matriz_e_vinculos")
+    quantidades = np.column_stack(
+        [_por_valor(col, parse_service_value, np.int64) for col in colunas[4:]]
+    ) if service_columns else np.zeros((total_linhas, 0), dtype=np.int64)
+    custo_por_servico = ratear_custos(quantidades, _por_valor(cost_values, _custo, np.float64))
+    
+    # Linhas sem contrato, cliente ou contract_id são ignoradas
+    validas = (
+        _por_valor(contract_numbers, bool, bool)
+        & _por_valor(customer_ids, bool, bool)
+        & _por_valor(contract_ids, bool, bool)
+    )
+    for i in np.flatnonzero(~validas)[:20].tolist():
+        print(f"Linha {i + 3}: Ignorada - contrato, cliente ou contract_id vazio")
+    servicos_ignorados = int((quantidades[validas] == 0).sum())
+    
+    # Serviços sem ID conhecido não geram vínculo
+    service_names = list(service_columns)
+    com_id = np.array([SERVICES_MAPPING.get(nome) is not None for nome in service_names], dtype=bool)
+    for j in np.flatnonzero(~com_id).tolist():
+        qtd = int((quantidades[validas, j] > 0).sum())
+        if qtd:
+            print(f"Aviso: ID do serviço '{service_names[j]}' não encontrado ({qtd} linhas)")
+    quantidades[~validas] = 0
+    quantidades[:, ~com_id] = 0
+    
+    vinculos = montar_vinculos(
+        [str(c) for c in contract_ids],
+        quantidades,
+        custo_por_servico,
+        [SERVICES_MAPPING.get(nome) for nome in service_names],
+        service_names.index(COST_SERVICE) if COST_SERVICE in service_names else -1,
+        TENANT_ID,
+    )
+    etapa.encerrar()
+    
+    # Uma única escrita em lote (upsert por contract_id, service_id)
+    etapa = memoria.iniciar_etapa("gravacao")
     servicos_criados = 0
-    servicos_ignorados = 0
     erros = []
-    
-    # Processar cada linha (começando da linha 3, pulando cabeçalhos)
-    for row in range(3, ws.max_row + 1):
-        total_linhas += 1
-        
-        # Obter dados do contrato
-        contract_number = ws.cell(row=row, column=2).value  # CodGE
-        customer_id = ws.cell(row=row, column=3).value
-        cost_value = ws.cell(row=row, column=10).value  # Custo
-        contract_id = ws.cell(row=row, column=23).value  # contract_id
-        
-        if not contract_number or not customer_id or not contract_id:
-            print(f"Linha {row}: Ignorada - contrato, cliente ou contract_id vazio")
-            continue
-        
-        # Calcular custo por serviço (dividir custo total pelos serviços ativos)
-        active_services = 0
-        for service_name, col_idx in service_columns.items():
-            value = ws.cell(row=row, column=col_idx).value
-            quantity = parse_service_value(value)
-            if quantity > 0:
-                active_services += 1
-        
-        cost_per_service = 0.0
-        if active_services > 0 and cost_value:
-            try:
-                cost_per_service = float(cost_value) / active_services
-            except (ValueError, TypeError):
-                cost_per_service = 0.0
-        
-        # Processar cada serviço
-        for service_name, col_idx in service_columns.items():
-            value = ws.cell(row=row, column=col_idx).value
-            quantity = parse_service_value(value)
-            
-            if quantity == 0:
-                servicos_ignorados += 1
-                continue
-            
-            service_id = SERVICES_MAPPING.get(service_name)
-            if not service_id:
-                print(f"Aviso: ID do serviço '{service_name}' não encontrado")
-                continue
-            
-            # Criar serviço do contrato
-            success, error = create_contract_service(
-                supabase, 
-                contract_id, 
-                service_id, 
-                quantity,
-                TENANT_ID,
-                cost_per_service if service_name == 'Gestao' else 0.0
-            )
-            
-            if success:
-                servicos_criados += 1
-                print(f"✓ Contrato {contract_number}: Serviço {service_name} criado (Qtd: {quantity})")
-            else:
-                erros.append(f"Contrato {contract_number}, Serviço {service_name}: {error}")
-                print(f"✗ Contrato {contract_number}: Erro ao criar serviço {service_name}: {error}")
+    try:
+        servicos_criados = gravar_vinculos(supabase, vinculos, outbox=outbox)['registros']
+    except ErroEscrita as e:
+        erros.append(f"Gravação dos vínculos: {e}")
+    etapa.encerrar()
     
     # Relatório final
     print("\n" + "="*60)
     print("RELATÓRIO DE IMPORTAÇÃO DE SERVIÇOS")
     print("="*60)
     print(f"Total de linhas processadas: {total_linhas}")
-    print(f"Serviços criados: {servicos_criados}")
+    print(f"Serviços criados/atualizados: {servicos_criados}")
     print(f"Serviços ignorados (quantidade 0): {servicos_ignorados}")
     print(f"Erros: {len(erros)}")
+    if drenador:
+        drenador.parar()
+        print(drenador.relatorio())
     
     if erros:
         print("\nErros detalhados:")
@@ -196,5 +230,8 @@ def main():
         if len(erros) > 10:
             print(f"  ... e mais {len(erros) - 10} erros")
 
+    imprimir_se_ativo()
+    memoria.imprimir_se_ativo()
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
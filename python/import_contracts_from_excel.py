@@ -4,7 +4,20 @@ from typing import Any, Dict, List, Optional, Tuple
 
 from dotenv import load_dotenv
 from openpyxl import load_workbook
-from supabase import create_client, Client
+from supabase import ClientOptions, create_client, Client
+
+from map_customer_ids import only_digits, strip_leading_zeros
+from src.config import get_http_client
+from src.escrita import ErroEscrita, EscritorLote
+from src.outbox import DrenadorOutbox, Outbox, outbox_do_ambiente
+from src import memoria
+from src.perfil import imprimir_se_ativo
+from src.rastreamento import iniciar_se_ativo, span
+from src.parsing import ColunaData, parse_date
+from src.planilha import iter_projetado, ler_cabecalho
+from src.registros import ContratoLinha, serializar
+from src.shards import NUMERO, Shard, chave_shard
+from src.vinculos import buscar_ids_contratos
 
 
 TENANT_ID_DEFAULT = "8d2888f1-64a5-445f-84f5-2614d5160251"
@@ -33,24 +46,8 @@ def _norm_header(s: Optional[str]) -> str:
     )
 
 
-def _parse_date(value) -> Optional[str]:
-    from datetime import datetime
-    if value is None or (isinstance(value, str) and value.strip() == ""):
-        return None
-    if isinstance(value, datetime):
-        try:
-            return value.date().isoformat()
-        except Exception:
-            pass
-    # tentar dd/mm/yyyy
-    try:
-        return datetime.strptime(str(value), "%d/%m/%Y").date().isoformat()
-    except Exception:
-        # tentar ISO
-        try:
-            return datetime.fromisoformat(str(value)).date().isoformat()
-        except Exception:
-            return None
+def _parse_date(value, conv=parse_date) -> Optional[str]:
+    return conv(value)
 
 
 def _parse_int(value) -> Optional[int]:
@@ -62,22 +59,13 @@ def _parse_int(value) -> Optional[int]:
         return None
 
 
-def _parse_number(value) -> Optional[float]:
-    if value is None or (isinstance(value, str) and value.strip() == ""):
-        return None
-    try:
-        return float(str(value).replace(".", "").replace(",", "."))
-    except Exception:
-        return None
-
-
 def _get_client() -> Client:
     load_dotenv()
     url = os.environ.get("SUPABASE_URL")
     key = os.environ.get("SUPABASE_SERVICE_KEY") or os.environ.get("SUPABASE_KEY")
     if not url or not key:
         raise RuntimeError("Defina SUPABASE_URL e SUPABASE_SERVICE_KEY/SUPABASE_KEY em python/.env")
-    return create_client(url, key)
+    return create_client(url, key, options=ClientOptions(httpx_client=get_http_client()))
 
 
 def _build_row_mapper(headers: List[str]) -> Dict[str, int]:
@@ -87,41 +75,72 @@ def _build_row_mapper(headers: List[str]) -> Dict[str, int]:
     return idx
 
 
-def read_rows(xlsx_path: Path) -> Tuple[List[Dict[str, Any]], List[str]]:
-    wb = load_workbook(xlsx_path, data_only=True)
+# Campos lidos da planilha; os palpites de descrição seguem a ordem de prioridade
+DESCRIPTION_GUESSES = ("descricao", "observacoes", "description", "observacoes_do_contrato")
+READ_FIELDS = (
+    "codge",
+    "customer_id",
+    "data_inicio",
+    "data_fim",
+    "tipo_faturamento",
+    "dia_faturamento",
+    "status",
+) + DESCRIPTION_GUESSES
+
+
+# Mapeamento de colunas do Excel para o banco de dados (cabeçalhos normalizados em `read_rows`)
+SYNONYMS: Dict[str, List[str]] = {
+    # IDs e números
+    "customer_id": ["customer_id", "id_cliente", "cliente_id"],
+    "codge": ["codge", "codigo", "numero_contrato", "contract_number", "CodGE"],
+    
+    # Dados do cliente
+    "cnpj": ["cnpj", "cpf", "cpf_cnpj", "documento"],
+    "grupo_economico": ["grupoeconomico", "grupo_economico", "Grupoeconomico", "Grupo Economico"],
+    "loja": ["loja", "filial", "unidade", "estabelecimento"],
+    "email": ["email", "e_mail", "correio_eletronico"],
+    
+    # Datas
+    "data_inicio": ["data_inicio", "data_inicial", "inicio", "initial_date", "Ativacao"],
+    "data_fim": ["data_fim", "data_final", "fim", "final_date"],
+    
+    # Valores e configurações
+    "tipo_faturamento": ["tipo_faturamento", "faturamento", "billing_type", "TipoNegocioDetalhes", "tipo_negocio"],
+    "dia_faturamento": ["dia_faturamento", "dia_vencimento", "billing_day"],
+    "status": ["status", "situacao", "estado"],
+    "descricao": ["descricao", "descricao_contrato", "description", "observacoes"],
+    
+    # Quantidades
+    "num_equipamentos": ["numequipamentos", "numero_equipamentos", "quantidade_equipamentos", "num_equipamentos"],
+}
+
+
+def read_rows(
+    xlsx_path: Path,
+    min_row: int = 2,
+    clientes: Optional[Dict[str, Dict[str, Any]]] = None,
+    max_row: Optional[int] = None,
+    shard: Optional[Shard] = None,
+) -> Tuple[List[ContratoLinha], List[str]]:
+    """
+    Lê a planilha de contratos e retorna (contratos, erros).
+    Cada contrato é um `ContratoLinha` compacto; use `to_dict(tenant_id)` para o registro completo.
+
+    `min_row` é a primeira linha de dados (3 nas planilhas com os IDs dos serviços na linha 2);
+    com `max_row`, só o intervalo [min_row, max_row] é lido (shards de src/tarefas.py).
+    Com `clientes` (mapa documento -> cliente de `map_customer_ids.fetch_customers_map`),
+    linhas sem customer_id são resolvidas pelo CPF/CNPJ.
+    Com `shard`, só as linhas cujo número do contrato cai na fatia (ver src/shards.py):
+    o mesmo número sempre fica no mesmo shard.
+    """
+    with span("carregar planilha", "planilha", arquivo=Path(xlsx_path).name):
+        wb = load_workbook(xlsx_path, data_only=True, read_only=True)
     ws = wb.active
-    headers = [ws.cell(row=1, column=i).value for i in range(1, ws.max_column + 1)]
+    headers = ler_cabecalho(ws)
     idx = _build_row_mapper(headers)
 
-    # Mapeamento de colunas do Excel para o banco de dados
-    synonyms: Dict[str, List[str]] = {
-        # IDs e números
-        "customer_id": ["customer_id", "id_cliente", "cliente_id"],
-        "codge": ["codge", "codigo", "numero_contrato", "contract_number", "CodGE"],
-        
-        # Dados do cliente
-        "cnpj": ["cnpj", "cpf", "cpf_cnpj", "documento"],
-        "grupo_economico": ["grupoeconomico", "grupo_economico", "Grupoeconomico", "Grupo Economico"],
-        "loja": ["loja", "filial", "unidade", "estabelecimento"],
-        "email": ["email", "e_mail", "correio_eletronico"],
-        
-        # Datas
-        "data_inicio": ["data_inicio", "data_inicial", "inicio", "initial_date", "Ativacao"],
-        "data_fim": ["data_fim", "data_final", "fim", "final_date"],
-        
-        # Valores e configurações
-        "valor_total": ["valor_total", "valor", "total", "total_amount", "Custo", "custo"],
-        "tipo_faturamento": ["tipo_faturamento", "faturamento", "billing_type", "TipoNegocioDetalhes", "tipo_negocio"],
-        "dia_faturamento": ["dia_faturamento", "dia_vencimento", "billing_day"],
-        "status": ["status", "situacao", "estado"],
-        "descricao": ["descricao", "descricao_contrato", "description", "observacoes"],
-        
-        # Quantidades
-        "num_equipamentos": ["numequipamentos", "numero_equipamentos", "quantidade_equipamentos", "num_equipamentos"],
-    }
-
     # normaliza sinônimos
-    synonyms = {k: [_norm_header(v) for v in vs] for k, vs in synonyms.items()}
+    synonyms = {k: [_norm_header(v) for v in vs] for k, vs in SYNONYMS.items()}
 
     def col_index_for(key: str) -> Optional[int]:
         # procura pelo primeiro sinônimo presente
@@ -138,39 +157,42 @@ def read_rows(xlsx_path: Path) -> Tuple[List[Dict[str, Any]], List[str]]:
         "tipo_faturamento",
         "dia_faturamento",
     ]
+    if clientes is not None and col_index_for("cnpj") is not None:
+        required.remove("customer_id")  # resolvido pelo documento
     erros: List[str] = []
     for r in required:
         if col_index_for(r) is None:
             erros.append(f"Cabeçalho obrigatório ausente: {r}")
 
-    registros: List[Dict[str, Any]] = []
+    registros: List[ContratoLinha] = []
 
-    for row in range(2, ws.max_row + 1):
-        # parar em linhas totalmente vazias
-        row_vals = [ws.cell(row=row, column=c).value for c in range(1, ws.max_column + 1)]
-        if all(v is None or (isinstance(v, str) and v.strip() == "") for v in row_vals):
-            continue
+    # Projeção: só as colunas efetivamente usadas são decodificadas
+    campos = {name: col_index_for(name) for name in READ_FIELDS + (("cnpj",) if clientes is not None else ())}
+    campos = {name: col for name, col in campos.items() if col is not None}
+    nomes = list(campos)
+    # Conversores de data por coluna (formato dominante detectado nas primeiras linhas)
+    conv_inicio = ColunaData()
+    conv_fim = ColunaData()
 
-        def get(name: str):
-            col = col_index_for(name)
-            return ws.cell(row=row, column=col).value if col else None
+    for row, valores in iter_projetado(ws, [campos[n] for n in nomes], min_row=min_row, max_row=max_row):
+        vals = dict(zip(nomes, valores))
+        get = vals.get
 
         contract_number = get("codge")
+        if shard is not None and not shard.contem(chave_shard(contract_number, NUMERO)):
+            continue
         customer_id = get("customer_id")
-        initial_date = _parse_date(get("data_inicio"))
-        final_date = _parse_date(get("data_fim"))
+        if not customer_id and clientes is not None:
+            cliente = clientes.get(strip_leading_zeros(only_digits(get("cnpj"))))
+            customer_id = cliente["id"] if cliente else None
+        initial_date = _parse_date(get("data_inicio"), conv_inicio)
+        final_date = _parse_date(get("data_fim"), conv_fim)
         billing_type = get("tipo_faturamento")
         billing_day = _parse_int(get("dia_faturamento"))
 
         # opcionais
-        total_amount = None
-        for guess in ("valor_total", "valor_contrato", "total_amount", "valor"):
-            v = get(guess)
-            if v is not None and str(v).strip() != "":
-                total_amount = _parse_number(v)
-                break
         description = None
-        for guess in ("descricao", "observacoes", "description", "observacoes_do_contrato"):
+        for guess in DESCRIPTION_GUESSES:
             v = get(guess)
             if v is not None and str(v).strip() != "":
                 description = str(v)
@@ -205,52 +227,61 @@ def read_rows(xlsx_path: Path) -> Tuple[List[Dict[str, Any]], List[str]]:
             billing_type = "mensal"
         if billing_day is None:
             billing_day = 1
-        # garantir total_amount = 0
-        total_amount = 0
+        # totais zerados só na inserção (CONTRATO_TOTAIS_INICIAIS); updates preservam os recalculados
 
         registros.append(
-            {
-                "tenant_id": TENANT_ID_DEFAULT,
-                "customer_id": customer_id,
-                "contract_number": str(contract_number),
-                "status": status or "DRAFT",
-                "initial_date": initial_date,
-                "final_date": final_date,
-                "billing_type": str(billing_type),
-                "billing_day": billing_day,
-                "anticipate_weekends": True,
-                "reference_period": None,
-                "installments": 1,
-                "total_amount": total_amount or 0,
-                "total_discount": 0,
-                "total_tax": 0,
-                "stage_id": None,
-                "description": description,
-                "internal_notes": "IMPORTADO POR PLANILHA",
-                "billed": False,
-            }
+            ContratoLinha(
+                customer_id=customer_id,
+                contract_number=str(contract_number),
+                status=status or "DRAFT",
+                initial_date=initial_date,
+                final_date=final_date,
+                billing_type=str(billing_type),
+                billing_day=billing_day,
+                description=description,
+            )
         )
 
+    wb.close()
     return registros, erros
 
 
-def upsert_contracts(client: Client, registros: List[Dict[str, Any]]) -> Tuple[int, int, List[str]]:
-    """Tenta upsert; se não suportado, faz insert com verificação prévia de existência."""
+def upsert_contracts(
+    client: Client,
+    contratos: List[ContratoLinha],
+    tenant_id: str = TENANT_ID_DEFAULT,
+    outbox: Optional[Outbox] = None,
+) -> Tuple[int, int, List[str]]:
+    """
+    Grava os contratos com `gravar_contratos` (existentes atualizados pelo id, novos
+    inseridos); se falhar, faz insert com verificação prévia de existência, linha a linha.
+    Os totais só são enviados na inserção: reimportar não apaga os valores calculados
+    por `recalcular_totais`.
+    Com `outbox`, os ids são resolvidos agora e as escritas apenas enfileiradas
+    localmente: existentes como upsert pelo id, novos como insert (com o id uuid5 da
+    outbox, então reenviar não duplica). Retorna quantos de cada entraram na fila.
+    """
     errors: List[str] = []
 
-    # Tenta upsert em lote
+    if outbox is not None:
+        ids, atualizar, novos = separar_contratos(client, contratos, tenant_id)
+        atualizados = outbox.enfileirar_varios(CONTRACTS_TABLE, "upsert", atualizar, on_conflict="id")
+        inseridos = outbox.enfileirar_varios(CONTRACTS_TABLE, "insert", novos)
+        return inseridos, atualizados, errors
+
     try:
-        resp = client.table(CONTRACTS_TABLE).upsert(registros).execute()
-        # Não dá para distinguir update/insert facilmente aqui
-        inserted = len(resp.data or [])
-        return inserted, 0, errors
-    except Exception as e:
-        errors.append(f"Upsert não suportado ou falhou: {e}")
+        _, updated, inserted = gravar_contratos(
+            client, contratos, tenant_id, comprimir=os.environ.get("SUPABASE_GZIP") == "1"
+        )
+        return inserted, updated, errors
+    except ErroEscrita as e:
+        # O fallback abaixo verifica existência linha a linha, então lotes já gravados não duplicam
+        errors.append(f"Gravação em lote falhou: {e}")
 
     # Fallback: insert somente se não existir (tenant_id, contract_number)
     inserted = 0
     updated = 0
-    for r in registros:
+    for r in serializar(contratos, tenant_id, novos=True):
         try:
             exists = (
                 client
@@ -273,9 +304,6 @@ def upsert_contracts(client: Client, registros: List[Dict[str, Any]]) -> Tuple[i
                     "anticipate_weekends": r["anticipate_weekends"],
                     "reference_period": r["reference_period"],
                     "installments": r["installments"],
-                    "total_amount": r["total_amount"],
-                    "total_discount": r["total_discount"],
-                    "total_tax": r["total_tax"],
                     "stage_id": r["stage_id"],
                     "description": r["description"],
                     "internal_notes": r["internal_notes"],
@@ -291,6 +319,47 @@ def upsert_contracts(client: Client, registros: List[Dict[str, Any]]) -> Tuple[i
     return inserted, updated, errors
 
 
+def separar_contratos(
+    client: Client,
+    contratos: List[ContratoLinha],
+    tenant_id: str = TENANT_ID_DEFAULT,
+) -> Tuple[Dict[str, str], List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """
+    (contract_number -> id dos existentes, registros a atualizar pelo id, registros novos).
+    Contratos não têm chave única em (tenant_id, contract_number), então o id precisa
+    ser resolvido antes de gravar.
+    """
+    # um registro por número (o último visto): o mesmo número duas vezes viraria dois inserts
+    contratos = list({r.contract_number: r for r in contratos}.values())
+    ids = buscar_ids_contratos(client, tenant_id, (r.contract_number for r in contratos))
+    atualizar = [{"id": ids[r.contract_number], **r.to_dict(tenant_id)} for r in contratos if r.contract_number in ids]
+    novos = [r.to_dict(tenant_id, novo=True) for r in contratos if r.contract_number not in ids]
+    return ids, atualizar, novos
+
+
+def gravar_contratos(
+    client: Client,
+    contratos: List[ContratoLinha],
+    tenant_id: str = TENANT_ID_DEFAULT,
+    comprimir: bool = False,
+) -> Tuple[Dict[str, str], int, int]:
+    """
+    Grava os contratos sem duplicar por (tenant, contract_number): os já existentes são
+    atualizados pelo id (upsert, sem os totais) e os demais inseridos com os totais
+    zerados. Pode ser repetido sem efeito extra, o que permite reprocessar um intervalo
+    de linhas (vigia, shards de src/tarefas.py).
+    Retorna (contract_number -> id de todos os contratos, atualizados, inseridos).
+    """
+    ids, atualizar, novos = separar_contratos(client, contratos, tenant_id)
+    # lotes homogêneos: o PostgREST exige as mesmas chaves em todos os objetos de um lote
+    if atualizar:
+        EscritorLote(client, CONTRACTS_TABLE, operacao="upsert", comprimir=comprimir).escrever(atualizar)
+    if novos:
+        EscritorLote(client, CONTRACTS_TABLE, operacao="insert", comprimir=comprimir).escrever(novos)
+        ids.update(buscar_ids_contratos(client, tenant_id, (r["contract_number"] for r in novos)))
+    return ids, len(atualizar), len(novos)
+
+
 def main():
     # caminho padrão relativo ao repo
     base = Path(__file__).resolve().parent
@@ -301,7 +370,10 @@ def main():
     if not xlsx_path.exists():
         raise FileNotFoundError(f"Planilha não encontrada: {xlsx_path}")
 
-    registros, erros = read_rows(xlsx_path)
+    memoria.iniciar_se_ativo()
+    iniciar_se_ativo()
+    with memoria.etapa("read_rows"):
+        registros, erros = read_rows(xlsx_path)
     print(f"Registros válidos: {len(registros)}")
     if erros:
         print("Erros de validação:")
@@ -312,7 +384,14 @@ def main():
         # raise SystemExit(1)
 
     client = _get_client()
-    inserted, updated, write_errors = upsert_contracts(client, registros)
+    # Outbox opcional (SUPABASE_OUTBOX): upserts vão para o SQLite local e são enviados em segundo plano
+    outbox = outbox_do_ambiente()
+    drenador = DrenadorOutbox(outbox, client).iniciar() if outbox else None
+    with memoria.etapa("upsert_contracts"):
+        inserted, updated, write_errors = upsert_contracts(client, registros, outbox=outbox)
+    if drenador:
+        drenador.parar()
+        print(drenador.relatorio())
     print("Resumo de importação:")
     print(f" - Inseridos: {inserted}")
     print(f" - Atualizados: {updated}")
@@ -320,6 +399,8 @@ def main():
         print("Erros de escrita:")
         for e in write_errors:
             print(f" - {e}")
+    imprimir_se_ativo()
+    memoria.imprimir_se_ativo()
 
 
 if __name__ == "__main__":
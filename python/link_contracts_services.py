@@ -11,7 +11,11 @@ import openpyxl
 from dotenv import load_dotenv
 
 # Importa o cliente Supabase diretamente
-from supabase import create_client, Client
+from supabase import ClientOptions, create_client, Client
+
+from src.config import get_http_client
+from src.escrita import ErroEscrita
+from src.vinculos import gravar_vinculos
 
 # Carrega variáveis de ambiente
 load_dotenv()
@@ -19,6 +23,9 @@ load_dotenv()
 # Configuração do tenant
 TENANT_ID = "8d2888f1-64a5-445f-84f5-2614d5160251"
 
+# Campos reenviados em vínculos que já existem; os demais só valem na criação
+CAMPOS_ATUALIZADOS = ('quantity', 'unit_price', 'updated_at')
+
 # Mapeamento de serviços da planilha para IDs do Supabase
 SERVICE_MAPPING = {
     'PDV Legal': 'b8be3fd6-82f9-467a-8673-6fd12e23ff9b',
@@ -113,13 +120,14 @@ def process_contract_services():
         print("❌ Erro: Variáveis SUPABASE_URL e SUPABASE_KEY não configuradas!")
         return
     
-    supabase: Client = create_client(supabase_url, supabase_key)
+    supabase: Client = create_client(supabase_url, supabase_key, options=ClientOptions(httpx_client=get_http_client()))
     
     # Contadores
     total_processado = 0
     servicos_criados = 0
     servicos_ignorados = 0
     erros = 0
+    vinculos = []  # gravados no final com um único upsert em lote
     
     # Mapeamento de colunas (atualizado com base na nova estrutura)
     CONTRACT_ID_COL = 2   # Coluna B (contract_id)
@@ -175,47 +183,22 @@ def process_contract_services():
                 # Calcula valores (total_amount é coluna gerada, não precisa ser inserida)
                 total_amount = quantity * unit_price
                 
-                # Verifica se já existe o vínculo
-                existing = supabase.table('contract_services').select('id').eq('contract_id', contract_id).eq('service_id', service_id).execute()
-                
-                if existing.data:
-                    print(f"ℹ️  Linha {row_num}: Vínculo já existe para contrato {contract_id} e serviço {service_name}, atualizando...")
-                    
-                    # Atualiza o vínculo existente
-                    result = supabase.table('contract_services').update({
-                        'quantity': quantity,
-                        'unit_price': unit_price,
-                        'updated_at': datetime.now().isoformat()
-                    }).eq('id', existing.data[0]['id']).execute()
-                    
-                    if result.data:
-                        servicos_criados += 1
-                        print(f"✅ Linha {row_num}: Vínculo atualizado com sucesso!")
-                    else:
-                        erros += 1
-                        print(f"❌ Linha {row_num}: Erro ao atualizar vínculo")
-                else:
-                    # Cria novo vínculo
-                    result = supabase.table('contract_services').insert({
-                        'contract_id': contract_id,
-                        'service_id': service_id,
-                        'quantity': quantity,
-                        'unit_price': unit_price,
-                        'tenant_id': TENANT_ID,
-                        'is_active': True,
-                        'no_charge': False,
-                        'generate_billing': True,
-                        'due_type': 'days_after_billing',
-                        'due_value': 5,
-                        'installments': 1
-                    }).execute()
-                    
-                    if result.data:
-                        servicos_criados += 1
-                        print(f"✅ Linha {row_num}: Vínculo criado com sucesso!")
-                    else:
-                        erros += 1
-                        print(f"❌ Linha {row_num}: Erro ao criar vínculo")
+                # Vínculo gravado no final por upsert (contract_id, service_id); se já existir,
+                # só CAMPOS_ATUALIZADOS são alterados
+                vinculos.append({
+                    'contract_id': contract_id,
+                    'service_id': service_id,
+                    'quantity': quantity,
+                    'unit_price': unit_price,
+                    'tenant_id': TENANT_ID,
+                    'is_active': True,
+                    'no_charge': False,
+                    'generate_billing': True,
+                    'due_type': 'days_after_billing',
+                    'due_value': 5,
+                    'installments': 1,
+                    'updated_at': datetime.now().isoformat()
+                })
             
             # Progresso a cada 50 linhas
             if total_processado % 50 == 0:
@@ -229,6 +212,12 @@ def process_contract_services():
                 print(f"❌ Erro inesperado na inicialização: {str(e)}")
             continue
     
+    try:
+        servicos_criados = gravar_vinculos(supabase, vinculos, campos_atualizaveis=CAMPOS_ATUALIZADOS)['registros']
+    except ErroEscrita as e:
+        erros += 1
+        print(f"❌ Erro ao gravar vínculos: {e}")
+    
     # Relatório final
     print("\n" + "="*60)
     print("📋 RELATÓRIO FINAL")
@@ -4,6 +4,7 @@ Script corrigido para vincular serviços aos contratos na tabela contract_servic
 Versão correta: Lê IDs dos serviços da linha 2, puxa preços do banco, e usa custo específico
 """
 
+import csv
 import os
 import sys
 from datetime import datetime
@@ -11,7 +12,28 @@ import openpyxl
 from dotenv import load_dotenv
 
 # Importa o cliente Supabase diretamente
-from supabase import create_client, Client
+from supabase import ClientOptions, create_client, Client
+
+from src.catalogo import servico_por_id, servicos_da_planilha
+from src.config import get_http_client
+from src.escrita import ErroEscrita
+from src.outbox import DrenadorOutbox, outbox_do_ambiente
+from src import memoria
+from src.perfil import imprimir_se_ativo
+from src.rastreamento import iniciar_se_ativo
+from src.shards import caminho_do_shard, chave_shard, shard_do_ambiente
+from src.planilha import iter_projetado
+from src.totais import recalcular_totais
+from src.vinculos import (
+    DESATIVAR,
+    EXCLUIR,
+    buscar_tenants_contratos,
+    buscar_vinculos,
+    diferenca_vinculos,
+    gravar_vinculos,
+    remover_vinculos,
+    salvar_diferenca,
+)
 
 # Carrega variáveis de ambiente
 load_dotenv()
@@ -25,49 +47,45 @@ COST_SERVICE_ID = "dbad5192-79b1-41e6-adbd-5218167c738c"
 # Service ID que tem quantity especial (coluna N)
 QUANTITY_SPECIAL_SERVICE_ID = "c1552361-c1db-43ae-ad3a-9a6f8143f668"
 
-def get_service_info(supabase, service_id):
-    """Busca informações do serviço no banco de dados"""
-    try:
-        result = supabase.table('services').select('name, default_price, cost_price').eq('id', service_id).execute()
-        if result.data and len(result.data) > 0:
-            return result.data[0]
-        return None
-    except Exception as e:
-        print(f"❌ Erro ao buscar serviço {service_id}: {e}")
-        return None
+# Colunas fixas da planilha contratos_prontos_with_ids.xlsx
+CONTRACT_ID_COL = 2   # Coluna B (contract_id)
+COST_COL = 11         # Coluna K (Custo)
 
-def get_contract_info(supabase, contract_id):
-    """Busca informações do contrato incluindo tenant_id"""
-    try:
-        result = supabase.table('contracts').select('tenant_id').eq('id', contract_id).execute()
-        if result.data and len(result.data) > 0:
-            return result.data[0]
-        return None
-    except Exception as e:
-        print(f"❌ Erro ao buscar contrato {contract_id}: {e}")
-        return None
+# Campos reenviados em vínculos que já existem (preço e valores fixos da planilha); status,
+# vencimento e parcelas só valem na criação, para não desfazer ajustes feitos depois
+CAMPOS_ATUALIZADOS = (
+    'quantity',
+    'unit_price',
+    'cost_price',
+    'description',
+    'generate_billing',
+    'billing_type',
+    'payment_method',
+    'recurrence_frequency',
+    'updated_at',
+)
+
+# Reconciliação (opcional): RECONCILIAR=desativar|excluir remove os vínculos que a planilha não marca mais;
+# DRY_RUN=1 não grava nada e só gera o relatório de diferenças
+RECONCILIAR = os.getenv('RECONCILIAR', '').strip().lower()
+DRY_RUN = os.getenv('DRY_RUN') == '1'
+DIFF_CSV = 'contract_services_reconciliacao.csv'
+
+# RECALCULAR_TOTAIS=1: ao final, recalcula total_amount/total_discount/total_tax dos contratos da planilha
+RECALCULAR_TOTAIS = os.getenv('RECALCULAR_TOTAIS') == '1'
+
+# Contratos/serviços da planilha que não existem no banco (com --shard i/N, um arquivo por shard)
+NAO_ENCONTRADOS_CSV = 'contract_services_nao_encontrados.csv'
 
-def get_active_services_from_row(sheet, row_num, row_data):
-    """Analisa a linha e retorna lista de serviços ativos com seus IDs"""
+def get_active_services_from_row(service_mapping, row_num, row_data):
+    """Analisa a linha e retorna lista de serviços ativos com seus IDs.
+
+    `service_mapping` vem de `servicos_da_planilha` (IDs da linha 2), lido uma vez por planilha.
+    """
     active_services = []
     
     print(f"\n🔍 Analisando linha {row_num}:")
-    print(f"   Contract ID: {row_data.get(2, 'N/A')}")
-    
-    # Lê os IDs dos serviços da linha 2 (headers com IDs)
-    service_mapping = {}
-    for col_num in range(13, 24):  # Colunas M a X (Gestao até Balanca Auto Servico)
-        service_id = sheet.cell(row=2, column=col_num).value
-        if service_id and isinstance(service_id, str) and len(service_id) == 36:  # UUID válido
-            # Mapeia o nome da coluna para o ID do serviço
-            header_name = sheet.cell(row=1, column=col_num).value
-            service_mapping[col_num] = {
-                'id': service_id,
-                'name': header_name,
-                'col_num': col_num
-            }
-    
-    print(f"   Serviços mapeados na linha 2: {len(service_mapping)}")
+    print(f"   Contract ID: {row_data.get(CONTRACT_ID_COL, 'N/A')}")
     
     # Verifica cada coluna de serviço
     for col_num, service_info in service_mapping.items():
@@ -109,14 +127,84 @@ def get_active_services_from_row(sheet, row_num, row_data):
     
     return active_services
 
+def build_link_record(contract_id, tenant_id, service, service_info, custo_value):
+    """Monta o registro de contract_services de um serviço ativo (valores fixos conforme requisitos).
+
+    É o registro de criação; para vínculos existentes só CAMPOS_ATUALIZADOS são gravados.
+    """
+    quantity = 1  # Padrão
+    unit_price = service_info.get('default_price', 0)  # Preço do banco (coluna default_price)
+    cost_price = 0  # Por padrão não usa cost_price do banco
+    
+    # Define quantity baseado no valor da célula (trata strings numéricas)
+    try:
+        numeric_value = float(str(service['value']).strip())
+        if numeric_value > 0:
+            quantity = int(numeric_value)
+    except (ValueError, TypeError):
+        pass  # Se não for número, mantém quantidade 1 para serviços ativos
+    
+    # Tratamento especial para custo - verifica a coluna Custo
+    if custo_value:
+        try:
+            custo_numerico = float(str(custo_value).strip())
+            if custo_numerico > 0:
+                cost_price = custo_numerico
+        except (ValueError, TypeError):
+            pass  # Ignora se não for número válido
+    
+    return {
+        'contract_id': contract_id,
+        'service_id': service['id'],
+        'quantity': quantity,
+        'unit_price': unit_price,
+        'cost_price': cost_price,
+        'description': 'PDVLegal',  # Descrição padrão
+        'tenant_id': tenant_id,
+        'is_active': True,
+        'no_charge': False,
+        'generate_billing': False,  # Deve ser FALSE
+        'billing_type': 'Único',  # Deve ser "Único"
+        'payment_method': 'Boleto',  # Deve ser "Boleto"
+        'recurrence_frequency': 'Mensal',  # Deve ser "Mensal"
+        'due_type': 'days_after_billing',
+        'due_value': 5,
+        'installments': 1,
+        'updated_at': datetime.now().isoformat(),
+    }
+
 def process_contract_services():
-    """Processa a planilha e cria vínculos na tabela contract_services"""
+    """Processa a planilha e grava os vínculos na tabela contract_services.
+
+    Os vínculos são gravados com upsert pela chave natural (contract_id, service_id), em lote:
+    reexecutar o script (ou rodar vários em paralelo) atualiza os mesmos vínculos sem duplicar,
+    e nos que já existem só os CAMPOS_ATUALIZADOS.
+    Com RECONCILIAR, os vínculos ativos que a planilha não marca mais são desativados/excluídos.
+    """
+    
+    if RECONCILIAR and RECONCILIAR not in (DESATIVAR, EXCLUIR):
+        print(f"❌ Erro: RECONCILIAR deve ser '{DESATIVAR}' ou '{EXCLUIR}'")
+        return 0
+    
+    # --shard i/N (ou SUPABASE_SHARD): só os contratos cujo hash do contract_id cai na fatia i
+    try:
+        shard = shard_do_ambiente()
+    except ValueError as e:
+        print(f"❌ Erro: {e}")
+        return 0
+    if shard:
+        print(f"🧩 Shard {shard}: processando só a fatia correspondente dos contratos")
     
     print("🚀 Iniciando vinculação de serviços aos contratos (VERSÃO CORRIGIDA)...")
     
+    memoria.iniciar_se_ativo()
+    iniciar_se_ativo()
+    
     # Carrega a planilha
-    workbook = openpyxl.load_workbook('contratos_prontos_with_ids.xlsx')
+    etapa = memoria.iniciar_etapa("carregar_planilha")
+    workbook = openpyxl.load_workbook('contratos_prontos_with_ids.xlsx', read_only=True)
     sheet = workbook.active
+    etapa.encerrar()
     
     # Configura o cliente Supabase
     supabase_url = os.getenv('SUPABASE_URL')
@@ -126,7 +214,11 @@ def process_contract_services():
         print("❌ Erro: Variáveis SUPABASE_URL e SUPABASE_KEY não configuradas!")
         return
     
-    supabase: Client = create_client(supabase_url, supabase_key)
+    supabase: Client = create_client(supabase_url, supabase_key, options=ClientOptions(httpx_client=get_http_client()))
+    
+    # Outbox opcional (SUPABASE_OUTBOX): escritas vão para o SQLite local e são enviadas em segundo plano
+    outbox = outbox_do_ambiente()
+    drenador = DrenadorOutbox(outbox, supabase).iniciar() if outbox else None
     
     # Contadores
     total_processado = 0
@@ -134,155 +226,122 @@ def process_contract_services():
     servicos_ignorados = 0
     erros = 0
     
-    # Lê os dados a partir da linha 3 (pulando cabeçalho)
-    # Processa todas as linhas com dados da planilha
-    for row_num in range(3, sheet.max_row + 1):
-        try:
-            # Coleta todos os dados da linha
-            row_data = {}
-            for col_num in range(1, sheet.max_column + 1):
-                row_data[col_num] = sheet.cell(row=row_num, column=col_num).value
-            
-            contract_id = row_data.get(2)  # Coluna B
-            total_processado += 1
-            
-            # Validações
-            if not contract_id:
-                print(f"⚠️  Linha {row_num}: contract_id vazio, ignorando...")
-                servicos_ignorados += 1
-                continue
-            
-            # Verifica se o contrato existe e obtém tenant_id
-            contract_info = get_contract_info(supabase, contract_id)
-            if not contract_info:
-                print(f"⚠️  Linha {row_num}: Contrato {contract_id} não encontrado, ignorando...")
-                servicos_ignorados += 1
-                continue
-            
-            tenant_id = contract_info['tenant_id']
-            print(f"   Tenant ID detectado: {tenant_id}")
-            
-            # Obtém serviços ativos para esta linha
-            active_services = get_active_services_from_row(sheet, row_num, row_data)
-            
-            if not active_services:
-                print(f"ℹ️  Linha {row_num}: Nenhum serviço ativo encontrado, ignorando...")
-                servicos_ignorados += 1
+    # IDs dos serviços (linha 2) lidos uma única vez
+    service_mapping = servicos_da_planilha(sheet)
+    print(f"📋 Serviços mapeados na linha 2: {len(service_mapping)}")
+    
+    # 1) Lê as linhas a partir da linha 3 (pulando cabeçalho)
+    # Projeção: só contract_id, Custo e as colunas de serviço são decodificadas
+    etapa = memoria.iniciar_etapa("1_leitura")
+    needed_cols = [CONTRACT_ID_COL, COST_COL] + list(service_mapping)
+    linhas = []  # (row_num, contract_id, serviços ativos, custo)
+    esperados = {}  # contract_id -> IDs dos serviços marcados na planilha
+    for row_num, valores in iter_projetado(sheet, needed_cols, min_row=3):
+        row_data = dict(zip(needed_cols, valores))
+        contract_id = row_data.get(CONTRACT_ID_COL)
+        if shard and not shard.contem(chave_shard(contract_id)):
+            continue
+        total_processado += 1
+    
+        if not contract_id:
+            print(f"⚠️  Linha {row_num}: contract_id vazio, ignorando...")
+            servicos_ignorados += 1
+            continue
+    
+        active_services = get_active_services_from_row(service_mapping, row_num, row_data)
+        esperados.setdefault(str(contract_id), set()).update(s['id'] for s in active_services)
+        if not active_services:
+            print(f"ℹ️  Linha {row_num}: Nenhum serviço ativo encontrado, ignorando...")
+            servicos_ignorados += 1
+            continue
+    
+        linhas.append((row_num, str(contract_id), active_services, row_data.get(COST_COL)))
+    workbook.close()
+    etapa.encerrar()
+    
+    # 2) Tenant de todos os contratos de uma vez (consultas `in` em blocos, em paralelo)
+    etapa = memoria.iniciar_etapa("2_tenants")
+    tenants = buscar_tenants_contratos(supabase, (contract_id for _, contract_id, _, _ in linhas))
+    print(f"📋 Contratos encontrados no banco: {len(tenants)} de {len({l[1] for l in linhas})}")
+    etapa.encerrar()
+    
+    # 3) Monta todos os vínculos localmente (catálogo do tenant em cache)
+    etapa = memoria.iniciar_etapa("3_montagem")
+    vinculos = []
+    nao_encontrados = []  # (linha, contract_id, service_id, motivo)
+    for row_num, contract_id, active_services, custo_value in linhas:
+        if contract_id not in tenants:
+            print(f"⚠️  Linha {row_num}: Contrato {contract_id} não encontrado, ignorando...")
+            servicos_ignorados += 1
+            nao_encontrados.append((row_num, contract_id, '', 'contrato não encontrado'))
+            continue
+        tenant_id = tenants[contract_id]
+    
+        for service in active_services:
+            service_info = servico_por_id(supabase, tenant_id, service['id'])
+            if not service_info:
+                print(f"⚠️  Serviço {service['id']} não encontrado no banco, ignorando...")
+                nao_encontrados.append((row_num, contract_id, service['id'], 'serviço não encontrado'))
                 continue
-            
-            print(f"   Total de serviços ativos: {len(active_services)}")
-            
-            # Processa cada serviço ativo
-            for service in active_services:
-                service_id = service['id']
-                service_name = service['name']
-                
-                # Busca informações do serviço no banco
-                service_info = get_service_info(supabase, service_id)
-                if not service_info:
-                    print(f"⚠️  Serviço {service_id} não encontrado no banco, ignorando...")
-                    continue
-                
-                # Define valores base
-                quantity = 1  # Padrão
-                unit_price = service_info.get('default_price', 0)  # Preço do banco (coluna default_price)
-                cost_price = 0  # Por padrão não usa cost_price do banco
-                
-                # Define quantity baseado no valor da célula
-                service_value = service['value']
-                
-                # Tenta converter o valor para número (trata strings numéricas)
-                try:
-                    numeric_value = float(str(service_value).strip())
-                    if numeric_value > 0:
-                        quantity = int(numeric_value)
-                        print(f"   📊 Quantidade numérica: {quantity}")
-                except (ValueError, TypeError):
-                    # Se não for número, mantém quantidade 1 para serviços ativos
-                    print(f"   📊 Quantidade padrão (ativa): {quantity}")
-                
-                # Tratamento especial para custo - verifica coluna 11 (Custo)
-                custo_value = row_data.get(11)
-                if custo_value:
-                    try:
-                        custo_numerico = float(str(custo_value).strip())
-                        if custo_numerico > 0:
-                            cost_price = custo_numerico
-                            print(f"   💰 Custo aplicado: R$ {cost_price}")
-                    except (ValueError, TypeError):
-                        pass  # Ignora se não for número válido
-                
-                print(f"   💵 Serviço: {service_info['name']}")
-                print(f"      Quantidade: {quantity}")
-                print(f"      Preço Unitário (default_price): R$ {unit_price}")
-                print(f"      Custo (cost_price): R$ {cost_price}")
-                print(f"      Total: R$ {quantity * unit_price}")
-                
-                # Verifica se já existe o vínculo
-                existing = supabase.table('contract_services').select('id').eq('contract_id', contract_id).eq('service_id', service_id).execute()
-                
-                if existing.data:
-                    print(f"ℹ️  Vínculo já existe para contrato {contract_id} e serviço {service_info['name']}, atualizando...")
-                    
-                    # Atualiza o vínculo existente com valores fixos conforme requisitos
-                    result = supabase.table('contract_services').update({
-                        'quantity': quantity,
-                        'unit_price': unit_price,
-                        'cost_price': cost_price,
-                        'description': 'PDVLegal',  # Descrição padrão
-                        'generate_billing': False,  # Deve ser FALSE
-                        'billing_type': 'Único',  # Deve ser "Único"
-                        'payment_method': 'Boleto',  # Deve ser "Boleto"
-                        'recurrence_frequency': 'Mensal',  # Deve ser "Mensal"
-                        'updated_at': datetime.now().isoformat()
-                    }).eq('id', existing.data[0]['id']).execute()
-                    
-                    if result.data:
-                        servicos_criados += 1
-                        print(f"✅ Vínculo atualizado com sucesso!")
-                    else:
-                        erros += 1
-                        print(f"❌ Erro ao atualizar vínculo")
-                else:
-                    # Cria novo vínculo com valores fixos conforme requisitos
-                    result = supabase.table('contract_services').insert({
-                        'contract_id': contract_id,
-                        'service_id': service_id,
-                        'quantity': quantity,
-                        'unit_price': unit_price,
-                        'cost_price': cost_price,
-                        'description': 'PDVLegal',  # Descrição padrão
-                        'tenant_id': tenant_id,
-                        'is_active': True,
-                        'no_charge': False,
-                        'generate_billing': False,  # Deve ser FALSE
-                        'billing_type': 'Único',  # Deve ser "Único"
-                        'payment_method': 'Boleto',  # Deve ser "Boleto"
-                        'recurrence_frequency': 'Mensal',  # Deve ser "Mensal"
-                        'due_type': 'days_after_billing',
-                        'due_value': 5,
-                        'installments': 1
-                    }).execute()
-                    
-                    if result.data:
-                        servicos_criados += 1
-                        print(f"✅ Vínculo criado com sucesso!")
-                    else:
-                        erros += 1
-                        print(f"❌ Erro ao criar vínculo")
-            
-            # Progresso a cada 10 linhas
-            if total_processado % 10 == 0:
-                print(f"\n📊 Progresso: {total_processado} linhas processadas...")
-                print(f"   Vínculos criados/atualizados: {servicos_criados}")
-                print(f"   Erros: {erros}")
-                print(f"   Ignorados: {servicos_ignorados}")
-                print("-" * 60)
-                
+            vinculos.append(build_link_record(contract_id, tenant_id, service, service_info, custo_value))
+    etapa.encerrar()
+    
+    # 4) Um único upsert em lotes pela chave natural (contract_id, service_id)
+    etapa = memoria.iniciar_etapa("4_gravacao")
+    if DRY_RUN:
+        print(f"\n🧪 DRY_RUN: {len(vinculos)} vínculos seriam gravados (nada enviado)")
+    else:
+        print(f"\n💾 Gravando {len(vinculos)} vínculos (upsert por contract_id, service_id)...")
+        try:
+            resumo = gravar_vinculos(supabase, vinculos, outbox=outbox, campos_atualizaveis=CAMPOS_ATUALIZADOS)
+            servicos_criados = resumo['registros']
+        except ErroEscrita as e:
+            erros += 1
+            print(f"❌ Erro ao gravar vínculos: {e}")
+    etapa.encerrar()
+    
+    # 5) Reconciliação: vínculos ativos no banco que a planilha não marca mais
+    etapa = memoria.iniciar_etapa("5_reconciliacao")
+    if RECONCILIAR or DRY_RUN:
+        # contratos com todos os serviços em NÃO não entram em `linhas`, mas são justamente
+        # os que podem ter vínculos a remover: o tenant deles também é buscado aqui
+        tenants.update(buscar_tenants_contratos(supabase, (c for c in esperados if c not in tenants)))
+        esperados = {c: s for c, s in esperados.items() if c in tenants}
+        servicos_planilha = {s['id'] for s in service_mapping.values()}
+        existentes = buscar_vinculos(supabase, esperados)
+        excedentes, faltantes = diferenca_vinculos(esperados, existentes, servicos_planilha)
+        modo = RECONCILIAR or DESATIVAR
+        diff_csv = caminho_do_shard(DIFF_CSV, shard)
+        salvar_diferenca(diff_csv, excedentes, faltantes, modo)
+        print(f"\n🔁 Reconciliação: {len(excedentes)} vínculos a {modo}, {len(faltantes)} a criar")
+        print(f"   Relatório de diferenças salvo em: {diff_csv}")
+        if RECONCILIAR and not DRY_RUN and excedentes:
+            try:
+                removidos = remover_vinculos(supabase, [v['id'] for v in excedentes], modo=modo)
+                print(f"✅ Vínculos excedentes ({modo}): {removidos}")
+            except Exception as e:
+                erros += 1
+                print(f"❌ Erro ao reconciliar vínculos: {e}")
+    etapa.encerrar()
+    
+    # 6) Totais dos contratos a partir dos vínculos (agregação local + um upsert em lote)
+    etapa = memoria.iniciar_etapa("6_totais")
+    if RECALCULAR_TOTAIS and tenants:
+        try:
+            res_totais = recalcular_totais(supabase, tenants, dry_run=DRY_RUN)
+            print(f"\n🧮 Totais: {res_totais['alterados']} de {res_totais['contratos']} contratos alterados, "
+                  f"{res_totais['gravados']} gravados")
         except Exception as e:
             erros += 1
-            print(f"❌ Linha {row_num}: Erro inesperado: {str(e)}")
-            continue
+            print(f"❌ Erro ao recalcular totais: {e}")
+    etapa.encerrar()
+    
+    # Não encontrados (sempre gravado, mesmo vazio: a mesclagem dos shards confere se todos rodaram)
+    nao_encontrados_csv = caminho_do_shard(NAO_ENCONTRADOS_CSV, shard)
+    with open(nao_encontrados_csv, 'w', newline='', encoding='utf-8') as f:
+        w = csv.writer(f)
+        w.writerow(['shard', 'linha', 'contract_id', 'service_id', 'motivo'])
+        w.writerows((str(shard) if shard else '', *item) for item in nao_encontrados)
     
     # Relatório final
     print("\n" + "="*80)
@@ -292,9 +351,14 @@ def process_contract_services():
     print(f"Vínculos criados/atualizados: {servicos_criados}")
     print(f"Linhas ignoradas: {servicos_ignorados}")
     print(f"Erros: {erros}")
+    print(f"Não encontrados: {len(nao_encontrados)} (detalhes em {nao_encontrados_csv})")
     print("="*80)
+    if drenador:
+        drenador.parar()
+        print(drenador.relatorio())
+    imprimir_se_ativo()
+    memoria.imprimir_se_ativo()
     
-    workbook.close()
     return servicos_criados
 
 def main():
@@ -8,7 +8,13 @@ from openpyxl import load_workbook
 from dotenv import load_dotenv
 
 # Supabase
-from supabase import create_client, Client
+from supabase import ClientOptions, create_client, Client
+
+from src.concorrencia import mapear_paralelo
+from src.config import get_http_client
+from src import memoria
+from src.perfil import imprimir_se_ativo
+from src.rastreamento import iniciar_se_ativo
 
 # Diretório base relativo ao arquivo atual
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -50,23 +56,31 @@ def get_supabase_client() -> Client:
     key = os.getenv('SUPABASE_KEY')
     if not url or not key:
         raise RuntimeError('SUPABASE_URL e SUPABASE_KEY não encontrados no ambiente. Configure o arquivo python/.env.')
-    return create_client(url, key)
+    return create_client(url, key, options=ClientOptions(httpx_client=get_http_client()))
 
 def fetch_customers_map(client: Client, tenant_id: Optional[str] = None) -> Dict[str, Dict[str, Any]]:
     """
     Retorna um mapa de documento -> customer ({id, tenant_id, name, company}).
     Documento é cpf_cnpj vindo como texto (sem zeros à esquerda, pois está salvo como bigint no banco).
     """
-    start = 0
     step = 1000
     mapping: Dict[str, Dict[str, Any]] = {}
     duplicates: Dict[str, int] = {}
-    while True:
-        query = client.table('customers').select('id,tenant_id,name,company,cpf_cnpj').range(start, start + step - 1)
+
+    def fetch_page(start: int, count: Optional[str] = None):
+        query = client.table('customers').select('id,tenant_id,name,company,cpf_cnpj', count=count)
         if tenant_id:
             query = query.eq('tenant_id', tenant_id)
-        resp = query.execute()
-        rows = resp.data or []
+        # ordem estável por id: as páginas são buscadas em paralelo
+        return query.order('id').range(start, start + step - 1).execute()
+
+    # Primeira página traz o total; as demais são buscadas em paralelo (concorrência AIMD)
+    first = fetch_page(0, count='exact')
+    total = first.count if first.count is not None else len(first.data or [])
+    pages = [first.data or []] + [
+        resp.data or [] for resp in mapear_paralelo(fetch_page, range(step, total, step))
+    ]
+    for rows in pages:
         for row in rows:
             doc = row.get('cpf_cnpj')
             if doc is None:
@@ -84,9 +98,6 @@ def fetch_customers_map(client: Client, tenant_id: Optional[str] = None) -> Dict
                     'company': row.get('company'),
                     'raw': doc_str,
                 }
-        if len(rows) < step:
-            break
-        start += step
     if duplicates:
         print('Atenção: Foram detectadas chaves duplicadas em cpf_cnpj (possíveis clientes repetidos em tenants diferentes):', len(duplicates))
         # imprime alguns exemplos
@@ -110,8 +121,12 @@ def detect_document_column(sheet) -> int:
     return 1  # fallback para coluna A
 
 def main():
+    memoria.iniciar_se_ativo()
+    iniciar_se_ativo()
     print('Abrindo arquivo:', INPUT_XLSX)
+    etapa = memoria.iniciar_etapa('carregar_planilha')
     wb = load_workbook(INPUT_XLSX, data_only=True)
+    etapa.encerrar()
     sheet = find_sheet(wb, ['contratos', 'LicencasAtivas'])
     print('Planilha selecionada:', sheet.title)
 
@@ -135,7 +150,9 @@ def main():
     # Supabase
     client = get_supabase_client()
     tenant_id = os.getenv('TENANT_ID')  # opcional
+    etapa = memoria.iniciar_etapa('fetch_customers_map')
     mapping = fetch_customers_map(client, tenant_id=tenant_id)
+    etapa.encerrar()
     print('Clientes carregados do Supabase:', len(mapping))
 
     atualizados = 0
@@ -143,6 +160,7 @@ def main():
     unmatched_rows = []
     exemplos_unmatched = []
 
+    etapa = memoria.iniciar_etapa('casar_documentos')
     for r in range(2, sheet.max_row + 1):
         raw = sheet.cell(row=r, column=doc_col).value
         digits = only_digits(raw)
@@ -174,7 +192,9 @@ def main():
             })
             if len(exemplos_unmatched) < 10:
                 exemplos_unmatched.append((r, raw, digits_stripped, 'sem correspondência'))
+    etapa.encerrar()
 
+    etapa = memoria.iniciar_etapa('salvar_planilha')
     print('Salvando arquivo atualizado em:', OUTPUT_XLSX)
     try:
         wb.save(OUTPUT_XLSX)
@@ -183,6 +203,7 @@ def main():
         alt_output = os.path.join(BASE_DIR, f'contratos_com_ids_{ts}.xlsx')
         print('Arquivo de saída em uso ou sem permissão. Salvando como:', alt_output)
         wb.save(alt_output)
+    etapa.encerrar()
 
     print('Gerando relatório de não casados em:', UNMATCHED_CSV)
     with open(UNMATCHED_CSV, 'w', newline='', encoding='utf-8') as f:
@@ -194,6 +215,8 @@ def main():
     print(' - Linhas atualizadas:', atualizados)
     print(' - Sem correspondência:', sem_match)
     print('Exemplos de não casados:', exemplos_unmatched)
+    imprimir_se_ativo()
+    memoria.imprimir_se_ativo()
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
@@ -0,0 +1,243 @@
+import json
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+
+
+MAIN_PY = Path(__file__).resolve().parent.parent / "main.py"
+
+# Comandos rápidos cujo tempo de inicialização deve ficar na casa das dezenas de ms
+STARTUP_COMMANDS: List[List[str]] = [
+    ["--help"],
+    ["gerar-template-cmd", "--help"],
+    ["importar", "--help"],
+]
+
+
+def medir_startup(
+    comandos: Optional[Sequence[Sequence[str]]] = None,
+    repeticoes: int = 5,
+) -> Dict[str, Dict[str, float]]:
+    """
+    Mede o tempo de inicialização da CLI executando `main.py` em processos novos.
+    Retorna, por comando, o mínimo e a mediana em milissegundos.
+    """
+    resultados: Dict[str, Dict[str, float]] = {}
+    for args in comandos or STARTUP_COMMANDS:
+        tempos: List[float] = []
+        for _ in range(repeticoes):
+            t0 = time.perf_counter()
+            subprocess.run(
+                [sys.executable, str(MAIN_PY), *args],
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+                check=False,
+            )
+            tempos.append((time.perf_counter() - t0) * 1000)
+        resultados[" ".join(args)] = {
+            "min_ms": round(min(tempos), 1),
+            "mediana_ms": round(statistics.median(tempos), 1),
+        }
+    return resultados
+
+
+def medir_baseline_python(repeticoes: int = 5) -> float:
+    """Mediana (ms) de um interpretador vazio, para descontar do tempo da CLI."""
+    tempos: List[float] = []
+    for _ in range(repeticoes):
+        t0 = time.perf_counter()
+        subprocess.run([sys.executable, "-c", "pass"], check=False)
+        tempos.append((time.perf_counter() - t0) * 1000)
+    return round(statistics.median(tempos), 1)
+
+
+# --- Benchmarks dos pipelines (bench compare) ---
+
+BENCHMARKS = ("ler_planilha", "read_rows", "fetch_customers_map", "link")
+
+# Métricas comparadas com a baseline; True = quanto maior, melhor
+METRICAS: Dict[str, bool] = {
+    "linhas_por_s": True,
+    "requisicoes_por_1k": False,
+    "pico_rss_mb": False,
+}
+
+RESULTADOS_PADRAO = "bench_resultados.json"
+
+# Chave aceita pelo servidor local (que não valida assinatura)
+_CHAVE_LOCAL = "eyJhbGciOiJIUzI1NiJ9.eyJyb2xlIjoic2VydmljZV9yb2xlIn0.x"
+
+
+def _gerar_planilhas(pasta: Path, linhas: int, contratos: List[Dict[str, Any]], servicos: List[Dict[str, Any]]) -> None:
+    """Planilhas sintéticas de `linhas` linhas para cada benchmark (modo write-only)."""
+    from datetime import date
+
+    from openpyxl import Workbook
+
+    from .schema import contrato_columns
+
+    def _salvar(nome: str, linhas_planilha) -> None:
+        wb = Workbook(write_only=True)
+        ws = wb.create_sheet()
+        for linha in linhas_planilha:
+            ws.append(linha)
+        wb.save(pasta / nome)
+
+    cols = contrato_columns()
+    _salvar("template.xlsx", [
+        [c["title"] for c in cols],
+        *(
+            [f"C{i}", f"Cliente {i}", f"{10_000_000_000 + i}", date(2024, 1, 1 + i % 28), None, 100.0 + i % 50, "ativo", None]
+            for i in range(linhas)
+        ),
+    ])
+    _salvar("contratos.xlsx", [
+        ["CodGE", "customer_id", "Data Inicio", "Data Fim", "Tipo Faturamento", "Dia Faturamento", "Status"],
+        *(
+            [str(100_000 + i), f"cliente-{i}", f"{1 + i % 28:02d}/01/2024", None, "Mensal", 1 + i % 28, "ativo"]
+            for i in range(linhas)
+        ),
+    ])
+    # formato de contratos_prontos_with_ids.xlsx: contract_id na coluna B, custo na K e
+    # serviços a partir da L (nome na linha 1, UUID na linha 2)
+    nomes = [s["name"] for s in servicos]
+    _salvar("contratos_prontos_with_ids.xlsx", [
+        [None, "contract_id", *[None] * 8, "Custo", *nomes],
+        [None, None, *[None] * 8, None, *[s["id"] for s in servicos]],
+        *(
+            [None, contratos[i % len(contratos)]["id"], *[None] * 8, 10.0 * (i % 5),
+             *("SIM" if (i + j) % 3 == 0 else "NAO" for j in range(len(servicos)))]
+            for i in range(linhas)
+        ),
+    ])
+
+
+def _executar_benchmark(nome: str, pasta: str, linhas: int, url: str) -> Dict[str, Any]:
+    """Roda um benchmark no processo atual (um processo novo por execução, ver `medir_pipelines`)."""
+    import contextlib
+    import os
+
+    os.environ["SUPABASE_URL"] = url
+    os.environ["SUPABASE_KEY"] = _CHAVE_LOCAL
+    os.environ.pop("SUPABASE_SERVICE_KEY", None)
+    from . import perfil
+    from .memoria import pico_rss_mb
+
+    pasta_path = Path(pasta)
+    # a saída dos scripts é descartada (não acumula em memória nem no terminal)
+    with open(os.devnull, "w") as nulo, contextlib.redirect_stdout(nulo):
+        if nome == "ler_planilha":
+            from .import_supabase import ler_planilha
+
+            t0 = time.perf_counter()
+            ler_planilha(str(pasta_path / "template.xlsx"))
+        elif nome == "read_rows":
+            from import_contracts_from_excel import read_rows
+
+            t0 = time.perf_counter()
+            read_rows(pasta_path / "contratos.xlsx")
+        elif nome == "fetch_customers_map":
+            from map_customer_ids import fetch_customers_map, get_supabase_client
+
+            client = get_supabase_client()
+            t0 = time.perf_counter()
+            fetch_customers_map(client)
+        elif nome == "link":
+            os.chdir(pasta_path)
+            import link_contracts_services_corrigido
+
+            t0 = time.perf_counter()
+            link_contracts_services_corrigido.process_contract_services()
+        else:
+            raise ValueError(f"benchmark desconhecido: {nome}")
+        duracao = time.perf_counter() - t0
+    requisicoes = sum(r["requisicoes"] for r in perfil.estatisticas().values())
+    return {
+        "linhas_por_s": round(linhas / duracao, 1),
+        "requisicoes_por_1k": round(1000 * requisicoes / linhas, 2),
+        "pico_rss_mb": pico_rss_mb(),
+    }
+
+
+def medir_pipelines(
+    linhas: int = 5000,
+    repeticoes: int = 3,
+    benchmarks: Sequence[str] = BENCHMARKS,
+) -> Dict[str, Dict[str, Any]]:
+    """
+    Mede os pipelines sobre planilhas sintéticas de `linhas` linhas e um PostgREST local
+    (src/servidor_local.py) com o mesmo volume de clientes/contratos. Cada execução roda em
+    um processo novo, para o pico de RSS ser só daquele pipeline; de `repeticoes` execuções
+    fica o melhor valor de cada métrica.
+    """
+    import multiprocessing
+    import tempfile
+    from concurrent.futures import ProcessPoolExecutor
+
+    from .servidor_local import BancoLocal, ServidorLocal, semear
+
+    banco = BancoLocal()
+    semear(banco, clientes=linhas, vinculos_por_contrato=0)
+    contratos, _ = banco.selecionar("contracts", "id", [], "id", 0, linhas, False)
+    servicos, _ = banco.selecionar("services", "id,name", [], "name", 0, None, False)
+    contexto = multiprocessing.get_context("spawn")
+    resultados: Dict[str, Dict[str, Any]] = {}
+    with tempfile.TemporaryDirectory() as pasta, ServidorLocal(banco) as servidor:
+        _gerar_planilhas(Path(pasta), linhas, contratos, servicos)
+        for nome in benchmarks:
+            execucoes = []
+            for _ in range(repeticoes):
+                with ProcessPoolExecutor(max_workers=1, mp_context=contexto) as pool:
+                    execucoes.append(pool.submit(_executar_benchmark, nome, pasta, linhas, servidor.url).result())
+            melhor: Dict[str, Any] = {}
+            for metrica, maior_melhor in METRICAS.items():
+                valores = [e[metrica] for e in execucoes if e[metrica] is not None]
+                melhor[metrica] = (max if maior_melhor else min)(valores) if valores else None
+            resultados[nome] = melhor
+    return resultados
+
+
+def comparar(
+    atual: Dict[str, Dict[str, Any]],
+    baseline: Dict[str, Dict[str, Any]],
+    limite: float = 0.2,
+) -> List[Dict[str, Any]]:
+    """
+    Compara cada métrica com a baseline. `variacao` é a piora relativa (positiva = pior),
+    `mudanca` a variação relativa do valor e `regrediu` indica piora acima de `limite`
+    (0.2 = 20%). Métricas sem baseline são ignoradas.
+    """
+    linhas: List[Dict[str, Any]] = []
+    for nome, metricas in atual.items():
+        base = baseline.get(nome, {})
+        for metrica, maior_melhor in METRICAS.items():
+            a, b = metricas.get(metrica), base.get(metrica)
+            if a is None or b is None:
+                continue
+            piora = (b - a) if maior_melhor else (a - b)
+            variacao = piora / b if b else (float("inf") if piora > 0 else 0.0)
+            linhas.append({
+                "benchmark": nome,
+                "metrica": metrica,
+                "baseline": b,
+                "atual": a,
+                "variacao": variacao,
+                "mudanca": (a - b) / b if b else 0.0,
+                "regrediu": variacao > limite,
+            })
+    return linhas
+
+
+def carregar_resultados(caminho: str) -> Dict[str, Any]:
+    """Arquivo de resultados ({baseline, ultima}); vazio se ainda não existir."""
+    p = Path(caminho)
+    if not p.exists():
+        return {}
+    return json.loads(p.read_text(encoding="utf-8"))
+
+
+def salvar_resultados(caminho: str, dados: Dict[str, Any]) -> None:
+    Path(caminho).write_text(json.dumps(dados, indent=2, ensure_ascii=False), encoding="utf-8")
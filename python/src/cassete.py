@@ -0,0 +1,202 @@
+import base64
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlencode
+
+import httpx
+
+
+# Modos do cassete (variável SUPABASE_CASSETE_MODO)
+GRAVAR = "gravar"
+REPRODUZIR = "reproduzir"
+
+# Cabeçalhos de resposta que não fazem sentido guardar: o corpo é gravado já decodificado
+CABECALHOS_DESCARTADOS = {"content-encoding", "content-length", "transfer-encoding", "connection", "date"}
+
+
+class ErroCassete(Exception):
+    """Requisição sem resposta correspondente no cassete (o script mudou desde a gravação)."""
+
+
+def _consulta(url: httpx.URL) -> str:
+    # parâmetros ordenados: a mesma consulta casa independentemente da ordem em que foi montada
+    return urlencode(sorted(parse_qsl(url.query.decode("utf-8"), keep_blank_values=True)))
+
+
+def _hash_corpo(corpo: bytes) -> str:
+    return hashlib.sha256(corpo).hexdigest()[:16] if corpo else ""
+
+
+def chaves_requisicao(method: str, url: httpx.URL, corpo: bytes) -> Tuple[tuple, tuple]:
+    """
+    Chaves de casamento, da mais para a menos específica: (método, caminho, consulta, corpo)
+    e (método, caminho, consulta). A consulta (filtros, tenant, `id=in.(...)`) sempre faz
+    parte da chave: sem ela uma requisição receberia a resposta de outra. O host fica de
+    fora, então um cassete gravado em um projeto reproduz com qualquer SUPABASE_URL.
+    """
+    consulta = _consulta(url)
+    return (
+        (method, url.path, consulta, _hash_corpo(corpo)),
+        (method, url.path, consulta),
+    )
+
+
+def _codificar_corpo(conteudo: bytes) -> Dict[str, str]:
+    try:
+        return {"texto": conteudo.decode("utf-8")}
+    except UnicodeDecodeError:
+        return {"base64": base64.b64encode(conteudo).decode("ascii")}
+
+
+def _decodificar_corpo(corpo: Dict[str, str]) -> bytes:
+    if "base64" in corpo:
+        return base64.b64decode(corpo["base64"])
+    return corpo.get("texto", "").encode("utf-8")
+
+
+class TransporteGravacao(httpx.BaseTransport):
+    """
+    Transporte httpx que repassa as requisições ao transporte real e grava cada
+    interação (requisição sem credenciais, resposta e latência) em um arquivo JSON Lines.
+    Cada linha é gravada assim que a resposta chega, então uma execução interrompida
+    deixa um cassete utilizável até aquele ponto.
+
+    O arquivo é aberto em modo append e cada interação sai em uma única escrita: vários
+    processos (shards, workers) podem gravar no mesmo cassete sem apagar as linhas uns dos
+    outros. Para regravar do zero, apague o arquivo antes.
+    """
+
+    def __init__(self, caminho: str, transporte: Optional[httpx.BaseTransport] = None):
+        self.caminho = caminho
+        self.transporte = transporte or httpx.HTTPTransport(retries=0)
+        self._lock = threading.Lock()
+        self._fd = os.open(caminho, os.O_WRONLY | os.O_CREAT | os.O_APPEND | getattr(os, "O_BINARY", 0), 0o644)
+        self._seq = 0
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        corpo = request.read()
+        inicio = time.perf_counter()
+        resposta = self.transporte.handle_request(request)
+        conteudo = resposta.read()
+        latencia = time.perf_counter() - inicio
+        interacao = {
+            "metodo": request.method,
+            "caminho": request.url.path,
+            "consulta": _consulta(request.url),
+            "corpo_hash": _hash_corpo(corpo),
+            "bytes_enviados": len(corpo),
+            "status": resposta.status_code,
+            "cabecalhos": {
+                k: v for k, v in resposta.headers.items() if k.lower() not in CABECALHOS_DESCARTADOS
+            },
+            "corpo": _codificar_corpo(conteudo),
+            "latencia": round(latencia, 6),
+        }
+        with self._lock:
+            # seq e pid só informam a ordem dentro de cada processo; a reprodução usa a linha
+            interacao["seq"] = self._seq
+            interacao["pid"] = os.getpid()
+            self._seq += 1
+            os.write(self._fd, (json.dumps(interacao, ensure_ascii=False) + "\n").encode("utf-8"))
+        return resposta
+
+    def close(self) -> None:
+        with self._lock:
+            if self._fd is not None:
+                os.close(self._fd)
+                self._fd = None
+        self.transporte.close()
+
+
+class TransporteReproducao(httpx.BaseTransport):
+    """
+    Transporte httpx que responde a partir de um cassete gravado, sem rede.
+
+    Cada requisição consome a próxima interação gravada com a chave mais específica
+    disponível (ver `chaves_requisicao`): corpos que mudam a cada execução, como
+    `updated_at`, ainda casam pela consulta; consulta diferente gera `ErroCassete`. A resposta é devolvida após a latência
+    original multiplicada por `escala_latencia` (0 reproduz o mais rápido possível).
+    """
+
+    def __init__(self, caminho: str, escala_latencia: float = 1.0):
+        self.caminho = caminho
+        self.escala_latencia = escala_latencia
+        self._lock = threading.Lock()
+        self._filas: Dict[tuple, Deque[Dict[str, Any]]] = defaultdict(deque)
+        self._consumidas: set = set()
+        self.total = 0
+        with open(caminho, encoding="utf-8") as f:
+            for linha in f:
+                if not linha.strip():
+                    continue
+                interacao = json.loads(linha)
+                # número da linha como identidade: `seq` se repete entre processos gravando juntos
+                interacao["_linha"] = self.total
+                metodo, caminho_url = interacao["metodo"], interacao["caminho"]
+                for chave in (
+                    (metodo, caminho_url, interacao["consulta"], interacao["corpo_hash"]),
+                    (metodo, caminho_url, interacao["consulta"]),
+                ):
+                    self._filas[chave].append(interacao)
+                self.total += 1
+
+    def _proxima(self, request: httpx.Request) -> Dict[str, Any]:
+        with self._lock:
+            for chave in chaves_requisicao(request.method, request.url, request.read()):
+                fila = self._filas.get(chave)
+                while fila:
+                    interacao = fila.popleft()
+                    if interacao["_linha"] not in self._consumidas:
+                        self._consumidas.add(interacao["_linha"])
+                        return interacao
+        raise ErroCassete(f"sem resposta gravada para {request.method} {request.url}")
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        interacao = self._proxima(request)
+        if self.escala_latencia > 0:
+            time.sleep(interacao["latencia"] * self.escala_latencia)
+        return httpx.Response(
+            interacao["status"],
+            headers=interacao["cabecalhos"],
+            content=_decodificar_corpo(interacao["corpo"]),
+            request=request,
+        )
+
+    def restantes(self) -> int:
+        """Interações gravadas que a reprodução ainda não consumiu."""
+        with self._lock:
+            return self.total - len(self._consumidas)
+
+
+def carregar_interacoes(caminho: str) -> List[Dict[str, Any]]:
+    """Interações de um cassete, na ordem em que as respostas chegaram."""
+    with open(caminho, encoding="utf-8") as f:
+        return [json.loads(linha) for linha in f if linha.strip()]
+
+
+def transporte_do_ambiente(
+    transporte: Optional[httpx.BaseTransport] = None,
+) -> Optional[httpx.BaseTransport]:
+    """
+    Transporte de gravação ou reprodução conforme SUPABASE_CASSETE (arquivo) e
+    SUPABASE_CASSETE_MODO (`gravar` ou `reproduzir`); SUPABASE_CASSETE_ESCALA multiplica as
+    latências reproduzidas. Sem SUPABASE_CASSETE retorna `transporte` inalterado.
+    """
+    caminho = os.environ.get("SUPABASE_CASSETE")
+    if not caminho:
+        return transporte
+    modo = os.environ.get("SUPABASE_CASSETE_MODO", REPRODUZIR)
+    if modo == GRAVAR:
+        return TransporteGravacao(caminho, transporte)
+    if modo == REPRODUZIR:
+        try:
+            escala = float(os.environ.get("SUPABASE_CASSETE_ESCALA", 1.0))
+        except ValueError:
+            escala = 1.0
+        return TransporteReproducao(caminho, escala)
+    raise ValueError(f"SUPABASE_CASSETE_MODO deve ser '{GRAVAR}' ou '{REPRODUZIR}'")
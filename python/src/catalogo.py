@@ -0,0 +1,85 @@
+import threading
+from typing import Any, Dict, List, Optional
+
+
+SERVICES_TABLE = "services"
+SERVICES_COLUMNS = "id,name,default_price,cost_price"
+
+# Cache do catálogo por tenant (compartilhado entre threads)
+_cache: Dict[str, List[Dict[str, Any]]] = {}
+_index: Dict[str, Dict[str, Dict[str, Any]]] = {}
+_locks: Dict[str, threading.Lock] = {}
+_locks_guard = threading.Lock()
+
+
+def _lock_for(tenant_id: str) -> threading.Lock:
+    with _locks_guard:
+        lock = _locks.get(tenant_id)
+        if lock is None:
+            lock = _locks[tenant_id] = threading.Lock()
+        return lock
+
+
+def carregar_servicos(client, tenant_id: str, refresh: bool = False) -> List[Dict[str, Any]]:
+    """
+    Retorna o catálogo de serviços do tenant ({id, name, default_price, cost_price}),
+    ordenado por nome. A consulta é feita uma única vez por tenant; chamadas
+    concorrentes para o mesmo tenant aguardam a primeira em vez de repetir a busca.
+    """
+    if not refresh and tenant_id in _cache:
+        return _cache[tenant_id]
+
+    with _lock_for(tenant_id):
+        if not refresh and tenant_id in _cache:
+            return _cache[tenant_id]
+
+        start = 0
+        step = 1000
+        servicos: List[Dict[str, Any]] = []
+        while True:
+            resp = (
+                client.table(SERVICES_TABLE)
+                .select(SERVICES_COLUMNS)
+                .eq("tenant_id", tenant_id)
+                .order("name")
+                .range(start, start + step - 1)
+                .execute()
+            )
+            rows = resp.data or []
+            servicos.extend(rows)
+            if len(rows) < step:
+                break
+            start += step
+
+        _cache[tenant_id] = servicos
+        _index[tenant_id] = {s["id"]: s for s in servicos}
+        return servicos
+
+
+def servico_por_id(client, tenant_id: str, service_id: str) -> Optional[Dict[str, Any]]:
+    """Busca um serviço do catálogo do tenant pelo ID, sem consultar o banco a cada chamada."""
+    if tenant_id not in _index:
+        carregar_servicos(client, tenant_id)
+    return _index[tenant_id].get(service_id)
+
+
+def limpar_cache() -> None:
+    """Descarta o catálogo em cache de todos os tenants."""
+    with _locks_guard:
+        _cache.clear()
+        _index.clear()
+
+
+def servicos_da_planilha(ws, header_row: int = 1, id_row: int = 2) -> Dict[int, Dict[str, Any]]:
+    """
+    Lê uma única vez o mapeamento coluna -> serviço de uma planilha no formato do
+    template por tenant: nome do serviço na linha `header_row` e UUID na linha `id_row`.
+    """
+    headers = next(ws.iter_rows(min_row=header_row, max_row=header_row, values_only=True), ())
+    ids = next(ws.iter_rows(min_row=id_row, max_row=id_row, values_only=True), ())
+    mapping: Dict[int, Dict[str, Any]] = {}
+    for col_num, service_id in enumerate(ids, start=1):
+        if service_id and isinstance(service_id, str) and len(service_id) == 36:  # UUID válido
+            name = headers[col_num - 1] if col_num <= len(headers) else None
+            mapping[col_num] = {"id": service_id, "name": name, "col_num": col_num}
+    return mapping
@@ -1,34 +1,147 @@
+import os
 import typer
 from pathlib import Path
+from typing import List
 
-from .excel_template import gerar_template
-from .config import get_supabase_client
-from .import_supabase import ler_planilha, importar_para_supabase
+from .schema import DEFAULT_ROWS
 
+# Dependências pesadas (openpyxl, supabase, dotenv) são importadas dentro de cada
+# comando, para que `--help` e o autocompletar do shell não paguem esse custo.
+# Pelo mesmo motivo a ajuda usa a formatação simples do click em vez do rich.
 
-app = typer.Typer(help="CLI para geração de planilha e importação de contratos para Supabase")
+
+app = typer.Typer(
+    help="CLI para geração de planilha e importação de contratos para Supabase",
+    rich_markup_mode=None,
+)
+bench_app = typer.Typer(help="Benchmarks da CLI e dos pipelines", rich_markup_mode=None)
+app.add_typer(bench_app, name="bench")
+outbox_app = typer.Typer(help="Fila local (SQLite) de escritas para envio posterior", rich_markup_mode=None)
+app.add_typer(outbox_app, name="outbox")
+tarefas_app = typer.Typer(help="Fila durável (SQLite) de shards processados por vários workers", rich_markup_mode=None)
+app.add_typer(tarefas_app, name="tarefas")
+
+
+@app.callback()
+def principal(
+    ctx: typer.Context,
+    perfil: bool = typer.Option(False, "--perfil", help="Ao final, mostra latência/erros por endpoint do Supabase e o estado do limitador de concorrência"),
+    gravar_cassete: str = typer.Option(None, "--gravar-cassete", help="Grava o tráfego com o Supabase neste arquivo (JSON Lines)"),
+    reproduzir_cassete: str = typer.Option(None, "--reproduzir-cassete", help="Responde às requisições a partir deste cassete, sem rede"),
+    escala_latencia: float = typer.Option(1.0, "--escala-latencia", min=0, help="Multiplica as latências reproduzidas (0 = sem espera)"),
+    trace_memory: bool = typer.Option(False, "--trace-memory", help="Ao final, mostra pico de memória e principais locais de alocação por etapa (tracemalloc)"),
+    trace: str = typer.Option(None, "--trace", help="Grava um trace (formato Chrome trace-event) da execução neste arquivo JSON"),
+):
+    if trace:
+        from .rastreamento import ativar as ativar_trace
+
+        rastro = ativar_trace(trace)
+
+        def _salvar_trace() -> None:
+            typer.echo(f"Trace salvo em: {rastro.salvar()}", err=True)
+
+        ctx.call_on_close(_salvar_trace)
+    if trace_memory:
+        from .memoria import ativar
+
+        ativar()
+
+        def _imprimir_memoria() -> None:
+            from .memoria import relatorio as relatorio_memoria
+
+            typer.echo(relatorio_memoria(), err=True)
+
+        ctx.call_on_close(_imprimir_memoria)
+    # o cliente HTTP é criado sob demanda e lê o cassete do ambiente (ver src/cassete.py)
+    if gravar_cassete and reproduzir_cassete:
+        raise typer.BadParameter("use --gravar-cassete ou --reproduzir-cassete, não os dois")
+    if gravar_cassete or reproduzir_cassete:
+        os.environ["SUPABASE_CASSETE"] = gravar_cassete or reproduzir_cassete
+        os.environ["SUPABASE_CASSETE_MODO"] = "gravar" if gravar_cassete else "reproduzir"
+        os.environ["SUPABASE_CASSETE_ESCALA"] = str(escala_latencia)
+    if perfil:
+        def _imprimir_perfil() -> None:
+            from .perfil import relatorio
+
+            typer.echo(relatorio(), err=True)
+
+        ctx.call_on_close(_imprimir_perfil)
 
 
 @app.command()
-def gerar_template_cmd(output: str = typer.Option("contratos_template.xlsx", "--output", help="Caminho do arquivo de saída")):
+def gerar_template_cmd(
+    output: str = typer.Option("contratos_template.xlsx", "--output", help="Caminho do arquivo de saída"),
+    rows: int = typer.Option(DEFAULT_ROWS, "--rows", min=1, help="Quantidade de linhas cobertas pelas validações"),
+    tenant: List[str] = typer.Option([], "--tenant", help="Gera um template por tenant com as colunas de serviço do catálogo (pode repetir)"),
+    output_dir: str = typer.Option(".", "--output-dir", help="Pasta de saída dos templates por tenant"),
+    workers: int = typer.Option(8, "--workers", min=1, help="Tenants processados em paralelo"),
+):
     """Gera a planilha de contratos configurada."""
-    out = gerar_template(output)
+    from .excel_template import gerar_template, gerar_templates_tenants
+
+    if tenant:
+        from .config import get_supabase_client
+
+        client = get_supabase_client()
+        for out in gerar_templates_tenants(client, tenant, output_dir=output_dir, rows=rows, workers=workers):
+            typer.echo(f"Template gerado em: {out}")
+        return
+    out = gerar_template(output, rows=rows)
     typer.echo(f"Template gerado em: {out}")
 
 
+@app.command()
+def converter_vinculos(
+    xlsx: str = typer.Option(..., "--xlsx", help="Template por tenant preenchido e já importado"),
+    tenant: str = typer.Option(..., "--tenant", help="Tenant dos contratos"),
+    saida: str = typer.Option("contratos_prontos_with_ids.xlsx", "--saida", help="Planilha no layout de link_contracts_services_corrigido.py"),
+):
+    """Converte o template por tenant para a planilha lida pela vinculação de serviços."""
+    from .config import get_supabase_client
+    from .excel_template import gerar_planilha_vinculos
+    from .import_supabase import ler_planilha
+    from .shards import NUMERO, chave_shard
+    from .vinculos import buscar_ids_contratos
+
+    if not Path(xlsx).exists():
+        raise typer.BadParameter(f"Arquivo não encontrado: {xlsx}")
+    registros, _ = ler_planilha(xlsx)
+    numeros = [chave_shard(r["id_contrato"], NUMERO) for r in registros]
+    ids = buscar_ids_contratos(get_supabase_client(), tenant, numeros)
+    res = gerar_planilha_vinculos(xlsx, saida, ids)
+    typer.echo(f"{res['linhas']} linhas em {saida} ({res['sem_id']} sem contrato no banco)")
+    if res["sem_id"]:
+        raise typer.Exit(code=1)
+
+
 @app.command()
 def importar(
     xlsx: str = typer.Option(..., "--xlsx", help="Caminho para a planilha preenchida"),
     tabela: str = typer.Option("contratos", "--tabela", help="Nome da tabela no Supabase"),
     dry_run: bool = typer.Option(False, "--dry-run", help="Somente valida e mostra o resumo"),
+    lote: int = typer.Option(500, "--lote", min=1, help="Tamanho inicial do lote de escrita (ajustado automaticamente)"),
+    gzip: bool = typer.Option(False, "--gzip", help="Envia os lotes comprimidos (requer servidor/proxy que aceite gzip)"),
+    outbox: str = typer.Option(None, "--outbox", help="Arquivo SQLite da outbox: enfileira localmente e envia o que a rede permitir"),
+    shard: str = typer.Option(None, "--shard", help="Processa só a fatia i/N das linhas (ex.: 2/4), escolhida pelo hash da chave"),
+    shard_por: str = typer.Option("numero", "--shard-por", help="Chave do shard: numero (ID do contrato) ou cnpj"),
+    relatorio_erros: str = typer.Option(None, "--relatorio-erros", help="Grava os erros de validação em CSV (com --shard, padrão importar_erros.csv com sufixo do shard)"),
 ):
     """Importa registros da planilha para o Supabase."""
+    from .import_supabase import ler_planilha, importar_para_supabase
+    from .memoria import etapa
+
     path = Path(xlsx)
     if not path.exists():
         raise typer.BadParameter(f"Arquivo não encontrado: {xlsx}")
+    fatia = _opcao_shard(shard, shard_por)
+
+    with etapa("ler_planilha"):
+        registros, erros = ler_planilha(str(path), shard=fatia, shard_por=shard_por)
+    typer.echo(f"Registros lidos: {len(registros)}" + (f" (shard {fatia})" if fatia else ""))
+    if relatorio_erros or fatia:
+        from .shards import salvar_erros
 
-    registros, erros = ler_planilha(str(path))
-    typer.echo(f"Registros lidos: {len(registros)}")
+        typer.echo(f"Relatório de erros: {salvar_erros(relatorio_erros or 'importar_erros.csv', erros, fatia)}")
     if erros:
         typer.echo("Erros de validação:")
         for e in erros:
@@ -40,7 +153,407 @@ def importar(
         typer.echo("Dry-run: nenhum dado enviado para o Supabase.")
         raise typer.Exit(code=0)
 
+    from .config import get_supabase_client
+
     client = get_supabase_client()
-    res = importar_para_supabase(client, registros, tabela)
+    with etapa("importar_para_supabase"):
+        res = importar_para_supabase(client, registros, tabela, tamanho_lote=lote, comprimir=gzip, outbox=_abrir_outbox(outbox))
     typer.echo("Importação concluída.")
-    typer.echo(str(res))
\ No newline at end of file
+    typer.echo(str(res))
+
+
+@app.command()
+def importar_lote(
+    entrada: str = typer.Option(..., "--entrada", help="Pasta ou padrão glob das planilhas (ex.: 'regioes/*.xlsx')"),
+    tabela: str = typer.Option("contratos", "--tabela", help="Nome da tabela no Supabase (formato template)"),
+    formato: str = typer.Option("template", "--formato", help="template (colunas do template) ou contratos (planilha de import_contracts_from_excel.py)"),
+    tenant: str = typer.Option(None, "--tenant", help="Tenant dos contratos (obrigatório com --formato contratos)"),
+    workers: int = typer.Option(0, "--workers", min=0, help="Processos de leitura (0 = um por núcleo)"),
+    dry_run: bool = typer.Option(False, "--dry-run", help="Somente valida e mostra o resumo"),
+    lote: int = typer.Option(500, "--lote", min=1, help="Tamanho inicial do lote de escrita (ajustado automaticamente)"),
+    gzip: bool = typer.Option(False, "--gzip", help="Envia os lotes comprimidos (requer servidor/proxy que aceite gzip)"),
+    outbox: str = typer.Option(None, "--outbox", help="Arquivo SQLite da outbox: enfileira localmente e envia o que a rede permitir"),
+):
+    """Lê várias planilhas em paralelo e importa os registros com um único envio."""
+    from .lote import CONTRATOS, FORMATOS, expandir_entradas, ler_lote
+    from .memoria import etapa
+
+    if formato not in FORMATOS:
+        raise typer.BadParameter(f"--formato deve ser um de: {', '.join(FORMATOS)}")
+    if formato == CONTRATOS and not tenant:
+        raise typer.BadParameter("--formato contratos exige --tenant")
+    arquivos = expandir_entradas(entrada)
+    if not arquivos:
+        raise typer.BadParameter(f"Nenhuma planilha .xlsx encontrada em: {entrada}")
+
+    client = None
+    clientes = None
+    if formato == CONTRATOS:
+        # índice de clientes buscado uma vez aqui e copiado para cada processo de leitura
+        from map_customer_ids import fetch_customers_map
+
+        from .config import get_supabase_client
+
+        client = get_supabase_client()
+        with etapa("carregar_clientes"):
+            clientes = fetch_customers_map(client, tenant_id=tenant)
+
+    # a leitura roda em outros processos: aqui só aparece o custo de juntar os resultados
+    with etapa("ler_lote"):
+        registros, erros, por_arquivo = ler_lote(arquivos, workers=workers or None, formato=formato, clientes=clientes)
+    for arquivo, qtd in por_arquivo.items():
+        typer.echo(f"{arquivo}: {qtd} registros")
+    typer.echo(f"Registros lidos: {len(registros)} em {len(arquivos)} arquivos")
+    if erros:
+        typer.echo("Erros de validação:")
+        for e in erros:
+            typer.echo(f"- {e}")
+        if not dry_run:
+            raise typer.Exit(code=1)
+
+    if dry_run:
+        typer.echo("Dry-run: nenhum dado enviado para o Supabase.")
+        raise typer.Exit(code=0)
+
+    if formato == CONTRATOS:
+        from import_contracts_from_excel import upsert_contracts
+
+        with etapa("upsert_contracts"):
+            inseridos, atualizados, erros_escrita = upsert_contracts(client, registros, tenant, outbox=_abrir_outbox(outbox))
+        typer.echo(f"Importação concluída: {inseridos} inseridos, {atualizados} atualizados.")
+        for e in erros_escrita:
+            typer.echo(f"- {e}")
+        return
+
+    from .config import get_supabase_client
+    from .import_supabase import importar_para_supabase
+
+    client = get_supabase_client()
+    with etapa("importar_para_supabase"):
+        res = importar_para_supabase(client, registros, tabela, tamanho_lote=lote, comprimir=gzip, outbox=_abrir_outbox(outbox))
+    typer.echo("Importação concluída.")
+    typer.echo(str(res))
+
+
+@app.command()
+def recalcular_totais(
+    tenant: str = typer.Option(..., "--tenant", help="Tenant cujos contratos terão os totais recalculados"),
+    dry_run: bool = typer.Option(False, "--dry-run", help="Só calcula e mostra quantos contratos mudariam"),
+    lote: int = typer.Option(500, "--lote", min=1, help="Tamanho inicial do lote de escrita"),
+):
+    """Recalcula total/desconto/imposto dos contratos a partir de contract_services."""
+    from .config import get_supabase_client
+    from .memoria import etapa
+    from .totais import recalcular_totais as _recalcular
+
+    with etapa("recalcular_totais"):
+        res = _recalcular(get_supabase_client(), tenant_id=tenant, dry_run=dry_run, tamanho_lote=lote)
+    typer.echo(str(res))
+
+
+@app.command()
+def exportar(
+    saida: str = typer.Option(..., "--saida", help="Arquivo .xlsx (uma aba por tabela) ou .csv (um arquivo por tabela)"),
+    tabela: List[str] = typer.Option([], "--tabela", help="Tabela exportada (pode repetir; padrão: contracts e contract_services)"),
+    colunas: List[str] = typer.Option([], "--colunas", help="Projeção 'col1,col2' ou 'tabela=col1,col2' (pode repetir; '*' = todas)"),
+    tenant: str = typer.Option(None, "--tenant", help="Só as linhas deste tenant"),
+    filtro: List[str] = typer.Option([], "--filtro", help="Filtro de igualdade coluna=valor (pode repetir)"),
+    formato: str = typer.Option(None, "--formato", help="xlsx ou csv (padrão: extensão de --saida)"),
+    pagina: int = typer.Option(1000, "--pagina", min=1, help="Linhas por requisição (keyset em id)"),
+):
+    """Exporta contratos e vínculos para XLSX/CSV em memória constante, para auditoria."""
+    from .exportacao import TABELAS_PADRAO, exportar as _exportar, formato_da_saida
+
+    try:
+        formato = formato_da_saida(saida, formato)
+    except ValueError as e:
+        raise typer.BadParameter(str(e))
+    tabelas = tabela or list(TABELAS_PADRAO)
+    projecoes = {}
+    for texto in colunas:
+        alvo, sep, cols = texto.partition("=")
+        if sep and alvo.strip() in tabelas:
+            projecoes[alvo.strip()] = cols
+        elif len(tabelas) == 1:
+            projecoes[tabelas[0]] = texto
+        else:
+            raise typer.BadParameter(f"--colunas {texto!r}: com várias tabelas use tabela=col1,col2")
+    filtros = [("tenant_id", tenant)] if tenant else []
+    for texto in filtro:
+        coluna, sep, valor = texto.partition("=")
+        if not sep or not coluna.strip():
+            raise typer.BadParameter(f"--filtro {texto!r}: use coluna=valor")
+        filtros.append((coluna.strip(), valor))
+
+    from .config import get_supabase_client
+    from .memoria import etapa
+
+    with etapa("exportar"):
+        res = _exportar(
+            get_supabase_client(), saida, tabelas, colunas=projecoes, filtros=filtros, formato=formato, tamanho_pagina=pagina
+        )
+    for nome, r in res.items():
+        typer.echo(f"{nome}: {r['linhas']} linhas em {r['paginas']} páginas -> {r['arquivo']}")
+
+
+@app.command()
+def watch(
+    pasta: str = typer.Option(".", "--pasta", help="Pasta vigiada"),
+    tenant: str = typer.Option(..., "--tenant", help="Tenant dos contratos importados"),
+    padrao: str = typer.Option("contratos*.xlsx", "--padrao", help="Padrão dos nomes das planilhas"),
+    workers: int = typer.Option(2, "--workers", min=1, help="Planilhas processadas ao mesmo tempo"),
+    intervalo: float = typer.Option(5.0, "--intervalo", min=0.1, help="Segundos entre varreduras da pasta"),
+    estado: str = typer.Option(".watch.sqlite3", "--estado", help="Arquivo SQLite com os hashes já processados"),
+    ttl_cache: float = typer.Option(600.0, "--ttl-cache", min=0, help="Segundos até recarregar clientes e catálogo"),
+    uma_vez: bool = typer.Option(False, "--uma-vez", help="Processa o que já está na pasta e sai"),
+):
+    """Vigia a pasta e importa/vincula as planilhas novas ou alteradas (só as linhas que mudaram)."""
+    from .vigia import CachesQuentes, EstadoVigia, Vigia
+
+    if not Path(pasta).is_dir():
+        raise typer.BadParameter(f"Pasta não encontrada: {pasta}")
+    with EstadoVigia(estado) as est:
+        vigia = Vigia(
+            pasta,
+            est,
+            CachesQuentes(tenant, ttl=ttl_cache),
+            padrao=padrao,
+            workers=workers,
+            intervalo=intervalo,
+            avisar=typer.echo,
+        )
+        if not uma_vez:
+            typer.echo(f"Vigiando {pasta}/{padrao} a cada {intervalo}s (Ctrl+C para sair)")
+        vigia.executar(uma_vez=uma_vez)
+        if uma_vez:
+            erros = [c for c, e, _ in est.arquivos() if e == "erro"]
+            if erros:
+                raise typer.Exit(code=1)
+
+
+def _opcao_shard(shard, shard_por):
+    if not shard:
+        return None
+    from .shards import CRITERIOS, parse_shard
+
+    if shard_por not in CRITERIOS:
+        raise typer.BadParameter(f"--shard-por deve ser um de: {', '.join(CRITERIOS)}")
+    try:
+        return parse_shard(shard)
+    except ValueError as e:
+        raise typer.BadParameter(str(e))
+
+
+@app.command()
+def mesclar_relatorios(
+    entrada: List[str] = typer.Option(..., "--entrada", help="Relatórios CSV dos shards ou padrão glob (pode repetir)"),
+    saida: str = typer.Option(..., "--saida", help="CSV combinado"),
+):
+    """Junta os relatórios (erros, não encontrados) gerados pelos nós de um --shard i/N."""
+    import glob
+
+    from .shards import mesclar_relatorios as _mesclar
+
+    arquivos = sorted({
+        a for padrao in entrada for a in (glob.glob(padrao) or [padrao])
+        if Path(a).is_file() and Path(a).resolve() != Path(saida).resolve()
+    })
+    if not arquivos:
+        raise typer.BadParameter("nenhum relatório encontrado")
+    res = _mesclar(arquivos, saida)
+    for arquivo, qtd in res["por_arquivo"].items():
+        typer.echo(f"{arquivo}: {qtd} linhas")
+    typer.echo(f"{res['linhas']} linhas em {saida}")
+    if res["faltando"]:
+        typer.echo(f"Shards sem relatório: {', '.join(res['faltando'])}", err=True)
+        raise typer.Exit(code=1)
+
+
+def _abrir_outbox(caminho):
+    if not caminho:
+        return None
+    from .outbox import Outbox
+
+    return Outbox(caminho)
+
+
+@outbox_app.command("status")
+def outbox_status(
+    arquivo: str = typer.Option("outbox.sqlite3", "--arquivo", help="Arquivo SQLite da outbox"),
+):
+    """Mostra quantos itens estão pendentes, enviados e com falha."""
+    from .outbox import Outbox
+
+    with Outbox(arquivo) as ob:
+        for estado, qtd in ob.contar().items():
+            typer.echo(f"{estado}: {qtd}")
+        for tabela, operacao, erro in ob.falhas():
+            typer.echo(f"- {operacao} em {tabela}: {erro}")
+
+
+@outbox_app.command("drenar")
+def outbox_drenar(
+    arquivo: str = typer.Option("outbox.sqlite3", "--arquivo", help="Arquivo SQLite da outbox"),
+    lote: int = typer.Option(500, "--lote", min=1, help="Itens por lote de envio"),
+    reenfileirar_falhas: bool = typer.Option(False, "--reenfileirar-falhas", help="Tenta de novo os itens que falharam definitivamente"),
+):
+    """Envia para o Supabase os itens pendentes da outbox."""
+    from .config import get_supabase_client
+    from .outbox import Outbox
+
+    with Outbox(arquivo) as ob:
+        if reenfileirar_falhas:
+            typer.echo(f"Reenfileirados: {ob.reenfileirar_falhas()}")
+        res = ob.drenar(get_supabase_client(), tamanho_lote=lote)
+    typer.echo(str(res))
+    if res["pendentes"]:
+        raise typer.Exit(code=1)
+
+
+@tarefas_app.command("criar")
+def tarefas_criar(
+    tipo: str = typer.Option(..., "--tipo", help="importar (contratos), vincular (contract_services) ou totais"),
+    arquivo: str = typer.Option(None, "--arquivo", help="Planilha dividida em shards (importar: hash do número; vincular: intervalos de linhas)"),
+    tenant: List[str] = typer.Option([], "--tenant", help="Tenant dos contratos (importar) ou um shard por tenant (totais; pode repetir)"),
+    linhas_por_shard: int = typer.Option(2000, "--linhas-por-shard", min=1, help="Linhas da planilha por shard (aproximado, na importação)"),
+    job: str = typer.Option(None, "--job", help="Nome do job (repetir o nome não duplica os shards)"),
+    fila: str = typer.Option("tarefas.sqlite3", "--fila", help="Arquivo SQLite da fila"),
+):
+    """Divide um pipeline em shards e os enfileira."""
+    from .tarefas import IMPORTAR, TIPOS, TOTAIS, FilaTarefas, shards_por_linhas, shards_por_numero, shards_por_tenant
+
+    if tipo not in TIPOS:
+        raise typer.BadParameter(f"tipos válidos: {', '.join(TIPOS)}")
+    if tipo == TOTAIS:
+        if not tenant:
+            raise typer.BadParameter("informe ao menos um --tenant")
+        shards = shards_por_tenant(tenant)
+    else:
+        if not arquivo or not Path(arquivo).exists():
+            raise typer.BadParameter(f"Arquivo não encontrado: {arquivo}")
+        if tipo == IMPORTAR:
+            # por hash do número: dois shards nunca inserem o mesmo contrato
+            extras = {"tenant": tenant[0]} if tenant else {}
+            shards = shards_por_numero(arquivo, 2, linhas_por_shard, **extras)
+        else:
+            # planilha de vínculos: linha 2 tem os IDs dos serviços; upsert na chave natural
+            shards = shards_por_linhas(arquivo, 3, linhas_por_shard)
+    with FilaTarefas(fila) as f:
+        nome = f.criar_job(tipo, shards, job=job)
+    typer.echo(f"Job {nome}: {len(shards)} shards de {tipo} em {fila}")
+
+
+@tarefas_app.command("trabalhar")
+def tarefas_trabalhar(
+    fila: str = typer.Option("tarefas.sqlite3", "--fila", help="Arquivo SQLite da fila"),
+    workers: int = typer.Option(1, "--workers", min=1, help="Processos worker"),
+    lease: float = typer.Option(60.0, "--lease", min=1, help="Segundos de lease (renovado enquanto o shard roda)"),
+):
+    """Processa os shards da fila até esvaziá-la."""
+    from .tarefas import executar_workers
+
+    for resumo in executar_workers(fila, workers, lease=lease):
+        typer.echo(str(resumo))
+
+
+@tarefas_app.command("status")
+def tarefas_status(
+    fila: str = typer.Option("tarefas.sqlite3", "--fila", help="Arquivo SQLite da fila"),
+    job: str = typer.Option(None, "--job", help="Só este job"),
+    reenfileirar_falhas: bool = typer.Option(False, "--reenfileirar-falhas", help="Devolve à fila os shards em falha"),
+):
+    """Mostra o andamento dos jobs e a soma dos resultados dos shards concluídos."""
+    from .tarefas import FilaTarefas
+
+    with FilaTarefas(fila) as f:
+        if reenfileirar_falhas:
+            typer.echo(f"Reenfileirados: {f.reenfileirar_falhas()}")
+        for nome, estados in f.contar(job).items():
+            typer.echo(f"{nome}: {estados} {f.resultados(nome)}")
+        for nome, shard, tentativas, erro in f.falhas():
+            typer.echo(f"- {nome} shard {shard} ({tentativas} tentativas): {erro}")
+
+
+@app.command()
+def servidor_local(
+    porta: int = typer.Option(54321, "--porta", help="Porta HTTP (SUPABASE_URL=http://127.0.0.1:<porta>)"),
+    banco: str = typer.Option(":memory:", "--banco", help="Arquivo SQLite (padrão: em memória)"),
+    clientes: int = typer.Option(1000, "--clientes", min=0, help="Clientes sintéticos por tenant (um contrato cada)"),
+    tenants: int = typer.Option(1, "--tenants", min=1, help="Tenants sintéticos"),
+    vinculos: int = typer.Option(3, "--vinculos", min=0, help="Serviços vinculados por contrato"),
+    semente: int = typer.Option(0, "--semente", help="Semente dos dados sintéticos"),
+    latencia: float = typer.Option(0.0, "--latencia", min=0, help="Latência injetada por requisição (s)"),
+    variacao: float = typer.Option(0.0, "--variacao", min=0, help="Variação aleatória da latência (± s)"),
+    taxa_erro: float = typer.Option(0.0, "--taxa-erro", min=0, max=1, help="Fração das requisições respondidas com erro"),
+    status_erro: int = typer.Option(503, "--status-erro", help="Status HTTP dos erros injetados"),
+):
+    """Sobe um servidor local compatível com o PostgREST (SQLite) para testes de carga."""
+    from .servidor_local import BancoLocal, ServidorLocal, semear
+
+    db = BancoLocal(banco)
+    if clientes and not db.contar("customers"):
+        info = semear(db, tenants=tenants, clientes=clientes, vinculos_por_contrato=vinculos, semente=semente)
+        typer.echo(f"Dados sintéticos: {info}")
+    srv = ServidorLocal(
+        db, porta=porta, latencia=latencia, variacao=variacao, taxa_erro=taxa_erro, status_erro=status_erro
+    )
+    typer.echo(f"PostgREST local em {srv.url} (Ctrl+C para sair)")
+    srv.servir()
+
+
+@bench_app.command("startup")
+def bench_startup(
+    repeticoes: int = typer.Option(5, "--repeticoes", min=1, help="Execuções por comando"),
+):
+    """Mede o tempo de inicialização dos comandos rápidos da CLI."""
+    from .bench import medir_baseline_python, medir_startup
+
+    base = medir_baseline_python(repeticoes)
+    typer.echo(f"Interpretador vazio: {base} ms")
+    for comando, tempos in medir_startup(repeticoes=repeticoes).items():
+        typer.echo(
+            f"main.py {comando}: mediana {tempos['mediana_ms']} ms "
+            f"(mín {tempos['min_ms']} ms, +{round(tempos['mediana_ms'] - base, 1)} ms sobre o interpretador)"
+        )
+
+
+@bench_app.command("compare")
+def bench_compare(
+    resultados: str = typer.Option("bench_resultados.json", "--resultados", help="Arquivo JSON com a baseline e a última execução"),
+    linhas: int = typer.Option(5000, "--linhas", min=1, help="Linhas das planilhas sintéticas (e clientes/contratos no servidor local)"),
+    repeticoes: int = typer.Option(3, "--repeticoes", min=1, help="Execuções por benchmark (fica a melhor)"),
+    limite: float = typer.Option(0.2, "--limite", min=0, help="Piora relativa tolerada por métrica (0.2 = 20%)"),
+    benchmark: List[str] = typer.Option([], "--benchmark", help="Roda só estes benchmarks (pode repetir)"),
+    salvar_baseline: bool = typer.Option(False, "--salvar-baseline", help="Grava esta execução como nova baseline"),
+):
+    """Mede os pipelines e falha se alguma métrica piorar além do limite em relação à baseline."""
+    from .bench import BENCHMARKS, carregar_resultados, comparar, medir_pipelines, salvar_resultados
+
+    desconhecidos = set(benchmark) - set(BENCHMARKS)
+    if desconhecidos:
+        raise typer.BadParameter(f"benchmarks válidos: {', '.join(BENCHMARKS)}")
+    atual = medir_pipelines(linhas=linhas, repeticoes=repeticoes, benchmarks=benchmark or BENCHMARKS)
+    dados = carregar_resultados(resultados)
+    dados["ultima"] = {"linhas": linhas, "metricas": atual}
+    baseline = dados.get("baseline")
+    if salvar_baseline or not baseline:
+        dados["baseline"] = {"linhas": linhas, "metricas": {**(baseline or {}).get("metricas", {}), **atual}}
+        salvar_resultados(resultados, dados)
+        for nome, metricas in atual.items():
+            typer.echo(f"{nome}: {metricas}")
+        typer.echo(f"Baseline salva em {resultados}")
+        return
+    salvar_resultados(resultados, dados)
+    if baseline.get("linhas") != linhas:
+        typer.echo(f"Aviso: baseline medida com {baseline.get('linhas')} linhas, esta execução com {linhas}")
+    comparacao = comparar(atual, baseline["metricas"], limite=limite)
+    for c in comparacao:
+        marca = "REGRESSÃO" if c["regrediu"] else "ok"
+        typer.echo(
+            f"{c['benchmark']:<20} {c['metrica']:<19} baseline {c['baseline']:>10} atual {c['atual']:>10} "
+            f"({c['mudanca']:+.1%}) {marca}"
+        )
+    regressoes = [c for c in comparacao if c["regrediu"]]
+    if regressoes:
+        typer.echo(f"{len(regressoes)} métrica(s) pioraram mais de {limite:.0%}", err=True)
+        raise typer.Exit(code=1)
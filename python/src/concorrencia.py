@@ -0,0 +1,119 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Callable, Iterable, Iterator, List, TypeVar
+
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+class LimitadorAIMD:
+    """
+    Limita quantas requisições ficam em trânsito ao mesmo tempo, ajustando o limite
+    por AIMD (additive increase / multiplicative decrease):
+
+    - cada resposta saudável (sem erro e com latência até `latencia_alvo`) soma
+      `incremento / limite` — ou seja, +`incremento` a cada janela completa;
+    - erro (429/5xx/falha de rede) ou latência acima do alvo multiplica o limite por
+      `fator`, no máximo uma vez por `intervalo_corte` segundos.
+    """
+
+    def __init__(
+        self,
+        inicial: float = 4,
+        minimo: float = 1,
+        maximo: float = 32,
+        incremento: float = 1.0,
+        fator: float = 0.5,
+        latencia_alvo: float = 2.0,
+        intervalo_corte: float = 1.0,
+    ):
+        self.limite = float(inicial)
+        self.minimo = float(minimo)
+        self.maximo = float(maximo)
+        self.incremento = incremento
+        self.fator = fator
+        self.latencia_alvo = latencia_alvo
+        self.intervalo_corte = intervalo_corte
+        self.em_transito = 0
+        self.pico_em_transito = 0
+        self.cortes = 0
+        self._ultimo_corte = 0.0
+        self._cond = threading.Condition()
+
+    def adquirir(self) -> None:
+        with self._cond:
+            while self.em_transito >= int(self.limite):
+                self._cond.wait()
+            self.em_transito += 1
+            self.pico_em_transito = max(self.pico_em_transito, self.em_transito)
+
+    def liberar(self, latencia: float, erro: bool) -> None:
+        with self._cond:
+            self.em_transito -= 1
+            agora = time.monotonic()
+            if erro or latencia > self.latencia_alvo:
+                if agora - self._ultimo_corte >= self.intervalo_corte:
+                    self.limite = max(self.minimo, self.limite * self.fator)
+                    self._ultimo_corte = agora
+                    self.cortes += 1
+            else:
+                self.limite = min(self.maximo, self.limite + self.incremento / self.limite)
+            self._cond.notify_all()
+
+    @contextmanager
+    def vaga(self) -> Iterator[None]:
+        """Ocupa uma vaga durante o bloco; exceções contam como erro."""
+        self.adquirir()
+        inicio = time.perf_counter()
+        erro = False
+        try:
+            yield
+        except BaseException:
+            erro = True
+            raise
+        finally:
+            self.liberar(time.perf_counter() - inicio, erro)
+
+    def estado(self) -> dict:
+        with self._cond:
+            return {
+                "limite": round(self.limite, 2),
+                "em_transito": self.em_transito,
+                "pico_em_transito": self.pico_em_transito,
+                "cortes": self.cortes,
+            }
+
+
+def _env_float(nome: str, padrao: float) -> float:
+    try:
+        return float(os.environ.get(nome, padrao))
+    except ValueError:
+        return padrao
+
+
+# Limitador único do processo, compartilhado por todos os pipelines (via cliente HTTP)
+LIMITADOR = LimitadorAIMD(
+    inicial=_env_float("SUPABASE_CONCORRENCIA_INICIAL", 4),
+    maximo=_env_float("SUPABASE_CONCORRENCIA_MAX", 32),
+    latencia_alvo=_env_float("SUPABASE_LATENCIA_ALVO", 2.0),
+)
+
+
+def mapear_paralelo(
+    fn: Callable[[T], R],
+    itens: Iterable[T],
+    limitador: LimitadorAIMD = LIMITADOR,
+) -> List[R]:
+    """
+    Aplica `fn` aos itens em threads, preservando a ordem. O número de threads é o teto
+    do limitador; quantas requisições de fato ficam em trânsito é decidido pelo AIMD.
+    """
+    itens = list(itens)
+    if not itens:
+        return []
+    with ThreadPoolExecutor(max_workers=max(1, min(int(limitador.maximo), len(itens)))) as pool:
+        return list(pool.map(fn, itens))
@@ -1,14 +1,38 @@
 import os
-from dotenv import load_dotenv
-from supabase import create_client, Client
+import threading
+from typing import TYPE_CHECKING
 
+if TYPE_CHECKING:  # importado apenas para anotações; o cliente é carregado sob demanda
+    import httpx
+    from supabase import Client
 
-def get_supabase_client() -> Client:
+_http_lock = threading.Lock()
+_http_client = None
+
+
+def get_http_client() -> "httpx.Client":
+    """
+    httpx.Client do processo, compartilhado por todos os clientes Supabase: um único pool
+    de conexões e um único limitador de concorrência (ver src/concorrencia.py).
+    """
+    global _http_client
+    with _http_lock:
+        if _http_client is None:
+            from .transporte import criar_http_client
+
+            _http_client = criar_http_client()
+        return _http_client
+
+
+def get_supabase_client() -> "Client":
     """
     Cria um cliente Supabase priorizando a chave de serviço (SUPABASE_SERVICE_KEY) se disponível,
     caso contrário usa SUPABASE_KEY (anon/publishable). Escrita em tabelas protegidas por RLS
     normalmente requer a service role.
     """
+    from dotenv import load_dotenv
+    from supabase import ClientOptions, create_client
+
     load_dotenv()
     url = os.environ.get("SUPABASE_URL")
     service_key = os.environ.get("SUPABASE_SERVICE_KEY")
@@ -17,4 +41,4 @@ def get_supabase_client() -> Client:
         raise RuntimeError(
             "SUPABASE_URL e SUPABASE_SERVICE_KEY/SUPABASE_KEY devem estar definidos no .env"
         )
-    return create_client(url, key)
\ No newline at end of file
+    return create_client(url, key, options=ClientOptions(httpx_client=get_http_client()))
\ No newline at end of file
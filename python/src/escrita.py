@@ -0,0 +1,262 @@
+import gzip
+import json
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import httpx
+
+from .rastreamento import span
+
+try:  # encoder opcional, bem mais rápido que o json da stdlib
+    import orjson
+except ImportError:  # pragma: no cover - depende do ambiente
+    orjson = None
+
+
+DEFAULT_BATCH_SIZE = 500
+
+# Classificação de falhas de escrita
+DIVIDIR = "dividir"   # lote grande demais ou lento demais: dividir ao meio
+REPETIR = "repetir"   # falha transitória: repetir o mesmo lote após backoff
+FATAL = "fatal"       # erro de dados/permissão: não adianta repetir
+
+# Status HTTP tratados como transitórios
+STATUS_TRANSITORIOS = {429, 500, 502, 503}
+# Status que indicam lote grande/lento demais
+STATUS_DIVIDIR = {408, 413, 504}
+# Código do Postgres para statement timeout (devolvido pelo PostgREST)
+PG_STATEMENT_TIMEOUT = "57014"
+
+
+class ErroEscrita(Exception):
+    """Falha ao gravar um lote; `status_code` é None quando não houve resposta HTTP."""
+
+    def __init__(self, mensagem: str, status_code: Optional[int] = None, lotes_ok: int = 0):
+        super().__init__(mensagem)
+        self.status_code = status_code
+        self.lotes_ok = lotes_ok
+
+
+def classificar_erro(exc: BaseException) -> str:
+    """Decide se uma falha de escrita deve dividir o lote, ser repetida ou abortar."""
+    if isinstance(exc, httpx.TimeoutException):
+        return DIVIDIR
+    if isinstance(exc, httpx.TransportError):
+        return REPETIR
+    # statement timeout chega como HTTP 500 (ErroEscrita) ou APIError do postgrest-py
+    code = str(getattr(exc, "code", "") or "")
+    if code == PG_STATEMENT_TIMEOUT or PG_STATEMENT_TIMEOUT in str(exc):
+        return DIVIDIR
+    status = getattr(exc, "status_code", None)
+    if status is None and code.isdigit():  # APIError sem corpo JSON traz o status HTTP em `code`
+        status = int(code)
+    if status in STATUS_DIVIDIR:
+        return DIVIDIR
+    if status in STATUS_TRANSITORIOS or code.startswith("08"):  # 08xxx: falha de conexão no Postgres
+        return REPETIR
+    return FATAL
+
+
+class AgendadorEscrita:
+    """
+    Controla o tamanho dos lotes e as novas tentativas de escrita:
+
+    - falhas transitórias são repetidas com backoff exponencial com jitter;
+    - payload grande demais ou timeout dividem o lote ao meio (e reduzem o tamanho
+      dos próximos);
+    - após `crescer_apos` sucessos seguidos o tamanho dobra, até `tamanho_maximo`.
+
+    Assim imports grandes convergem para o tamanho de lote que o servidor aguenta.
+    """
+
+    def __init__(
+        self,
+        tamanho_inicial: int = DEFAULT_BATCH_SIZE,
+        tamanho_minimo: int = 1,
+        tamanho_maximo: Optional[int] = None,
+        crescer_apos: int = 5,
+        max_tentativas: int = 5,
+        backoff_base: float = 0.5,
+        backoff_max: float = 30.0,
+        dormir: Callable[[float], None] = time.sleep,
+    ):
+        self.tamanho = tamanho_inicial
+        self.tamanho_minimo = tamanho_minimo
+        self.tamanho_maximo = tamanho_maximo or tamanho_inicial * 4
+        self.crescer_apos = crescer_apos
+        self.max_tentativas = max_tentativas
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.dormir = dormir
+        self._sucessos = 0
+        self.estatisticas = {"sucessos": 0, "repeticoes": 0, "divisoes": 0}
+
+    def backoff(self, tentativa: int) -> float:
+        """Espera da tentativa `tentativa` (0, 1, ...): jitter total sobre o teto exponencial."""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** tentativa)))
+
+    def _sucesso(self) -> None:
+        self.estatisticas["sucessos"] += 1
+        self._sucessos += 1
+        if self._sucessos >= self.crescer_apos:
+            self.tamanho = min(self.tamanho_maximo, self.tamanho * 2)
+            self._sucessos = 0
+
+    def _reduzir(self, tamanho_falhou: int) -> None:
+        self.tamanho = max(self.tamanho_minimo, tamanho_falhou // 2)
+        self._sucessos = 0
+
+    def gravar(self, lote: List[Any], enviar: Callable[[List[Any]], Any]) -> None:
+        """Envia `lote` com `enviar`, dividindo e repetindo conforme a política."""
+        pendentes = [lote]
+        while pendentes:
+            atual = pendentes.pop()
+            tentativa = 0
+            while True:
+                try:
+                    enviar(atual)
+                except Exception as e:
+                    tipo = classificar_erro(e)
+                    if tipo == DIVIDIR and len(atual) > 1:
+                        self.estatisticas["divisoes"] += 1
+                        self._reduzir(len(atual))
+                        meio = len(atual) // 2
+                        pendentes.append(atual[meio:])
+                        pendentes.append(atual[:meio])  # primeira metade sai antes
+                        break
+                    if tipo != FATAL and tentativa < self.max_tentativas:
+                        self.estatisticas["repeticoes"] += 1
+                        self._sucessos = 0
+                        self.dormir(self.backoff(tentativa))
+                        tentativa += 1
+                        continue
+                    raise
+                self._sucesso()
+                break
+
+
+def codificar(registros: List[Dict[str, Any]]) -> bytes:
+    """Serializa os registros em JSON compacto (orjson quando instalado)."""
+    if orjson is not None:
+        return orjson.dumps(registros, default=str)
+    return json.dumps(registros, ensure_ascii=False, separators=(",", ":"), default=str).encode("utf-8")
+
+
+class EscritorLote:
+    """
+    Grava registros em uma tabela via PostgREST em lotes, usando a sessão HTTP e os
+    cabeçalhos de autenticação do cliente Supabase.
+
+    - O corpo de cada lote é serializado com `codificar` e, se `comprimir`, enviado
+      com gzip (`Content-Encoding: gzip`; use apenas se o servidor/proxy aceitar).
+    - Enquanto um lote está em trânsito, o próximo já é serializado em outra thread.
+    - Tamanho dos lotes, divisões e novas tentativas ficam a cargo do `AgendadorEscrita`.
+    """
+
+    def __init__(
+        self,
+        client,
+        tabela: str,
+        operacao: str = "upsert",
+        on_conflict: Optional[str] = None,
+        tamanho_lote: int = DEFAULT_BATCH_SIZE,
+        comprimir: bool = False,
+        agendador: Optional[AgendadorEscrita] = None,
+        ignorar_duplicados: bool = False,
+    ):
+        if operacao not in ("insert", "upsert"):
+            raise ValueError("operacao deve ser 'insert' ou 'upsert'")
+        self.postgrest = client.postgrest
+        self.session = client.postgrest.session
+        # URL absoluta: a sessão pode ser um httpx.Client compartilhado, sem base_url
+        self.url = str(client.postgrest.base_url.joinpath(tabela))
+        self.tabela = tabela
+        self.operacao = operacao
+        self.on_conflict = on_conflict
+        self.comprimir = comprimir
+        # upsert que mantém a linha existente em vez de atualizá-la (ON CONFLICT DO NOTHING)
+        self.ignorar_duplicados = ignorar_duplicados
+        self.agendador = agendador or AgendadorEscrita(tamanho_inicial=tamanho_lote)
+
+    def _headers(self) -> Dict[str, str]:
+        prefer = ["return=minimal"]
+        if self.operacao == "upsert":
+            prefer.insert(0, "resolution=ignore-duplicates" if self.ignorar_duplicados else "resolution=merge-duplicates")
+        headers = {**self.postgrest.headers, "Content-Type": "application/json", "Prefer": ",".join(prefer)}
+        if self.comprimir:
+            headers["Content-Encoding"] = "gzip"
+        return headers
+
+    def _params(self) -> Dict[str, str]:
+        return {"on_conflict": self.on_conflict} if self.on_conflict else {}
+
+    def preparar(self, lote: List[Dict[str, Any]]) -> Optional[Tuple[List[Dict[str, Any]], bytes, int]]:
+        """Retorna (lote, corpo, bytes antes da compressão), ou None se o lote estiver vazio."""
+        if not lote:
+            return None
+        with span(f"serializar {self.tabela}", "escrita", registros=len(lote)):
+            corpo = codificar(lote)
+            tamanho = len(corpo)
+            if self.comprimir:
+                corpo = gzip.compress(corpo, compresslevel=5)
+        return lote, corpo, tamanho
+
+    def enviar(self, corpo: bytes) -> None:
+        resp = self.session.post(
+            self.url,
+            content=corpo,
+            headers=self._headers(),
+            params=self._params(),
+        )
+        if not resp.is_success:
+            raise ErroEscrita(
+                f"{self.operacao} em {self.tabela} falhou ({resp.status_code}): {resp.text[:500]}",
+                status_code=resp.status_code,
+            )
+
+    def escrever(self, registros: Iterable[Dict[str, Any]]) -> Dict[str, int]:
+        """
+        Grava todos os registros e retorna um resumo
+        ({lotes, registros, bytes_json, bytes_enviados}).
+        """
+        it = iter(registros)
+        resumo = {"lotes": 0, "registros": 0, "bytes_json": 0, "bytes_enviados": 0}
+
+        def _proximo():
+            # lido na thread de preparo, já com o tamanho de lote mais recente do agendador
+            return self.preparar(list(islice(it, self.agendador.tamanho)))
+
+        with ThreadPoolExecutor(max_workers=1) as prep:
+            futuro = prep.submit(_proximo)
+            while True:
+                preparado = futuro.result()
+                if preparado is None:
+                    break
+                futuro = prep.submit(_proximo)
+                original, corpo_original, tamanho_original = preparado
+
+                def _enviar(lote: List[Dict[str, Any]]) -> None:
+                    if lote is original:
+                        corpo, tamanho = corpo_original, tamanho_original
+                    else:  # metade de um lote dividido: serializa de novo
+                        _, corpo, tamanho = self.preparar(lote)
+                    with span(f"lote {self.operacao} {self.tabela}", "escrita", registros=len(lote), bytes=len(corpo)):
+                        self.enviar(corpo)
+                    resumo["lotes"] += 1
+                    resumo["registros"] += len(lote)
+                    resumo["bytes_json"] += tamanho
+                    resumo["bytes_enviados"] += len(corpo)
+
+                try:
+                    self.agendador.gravar(original, _enviar)
+                except ErroEscrita as e:
+                    e.lotes_ok = resumo["lotes"]
+                    raise
+                except httpx.HTTPError as e:
+                    raise ErroEscrita(
+                        f"{self.operacao} em {self.tabela} falhou: {e}", lotes_ok=resumo["lotes"]
+                    ) from e
+        return resumo
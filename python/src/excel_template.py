@@ -1,23 +1,57 @@
 from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
 from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
 from openpyxl.worksheet.datavalidation import DataValidation
 from openpyxl.utils import get_column_letter
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Optional
+from typing import Any, Dict, List, Optional, Sequence
 
-from .schema import contrato_columns
+from .catalogo import carregar_servicos, servicos_da_planilha
+from .schema import DEFAULT_ROWS, contrato_columns
+from .shards import NUMERO, chave_shard
 
+# Valores aceitos nas colunas de serviço (quantidades numéricas também são aceitas)
+SERVICE_LIST_VALUES = ["SIM", "NAO"]
 
-def gerar_template(output_path: Optional[str] = None) -> Path:
+# Coluna de custo do template por tenant (entre as colunas do contrato e as de serviço)
+COLUNA_CUSTO = "Custo"
+
+# Layout de contratos_prontos_with_ids.xlsx, lido por link_contracts_services_corrigido.py:
+# contract_id (uuid) na coluna B, Custo na K, serviços a partir da L com o UUID na linha 2
+VINCULOS_COLUNA_CONTRACT_ID = 2
+VINCULOS_COLUNA_CUSTO = 11
+
+
+def gerar_template(
+    output_path: Optional[str] = None,
+    rows: int = DEFAULT_ROWS,
+    servicos: Optional[Sequence[Dict[str, Any]]] = None,
+) -> Path:
     """
     Gera a planilha Excel com cabeçalhos, formatos, filtros e validações.
+    Usa modo write-only e estilos por coluna (não por célula), então o custo
+    não depende de `rows`, que define apenas o alcance das validações.
+
+    Se `servicos` for informado (catálogo do tenant, ver `catalogo.carregar_servicos`),
+    uma coluna `Custo` e uma coluna por serviço são adicionadas, com o nome na linha 1
+    e o UUID do serviço na linha 2; os dados passam a começar na linha 3.
+    `gerar_planilha_vinculos` converte o template preenchido para o layout da vinculação.
     Retorna o caminho do arquivo gerado.
     """
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Contratos"
+    if rows < 1:
+        raise ValueError("rows deve ser maior ou igual a 1")
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Contratos")
 
     cols = contrato_columns()
+    servicos = list(servicos or [])
+    first_row = 3 if servicos else 2  # linha 2 guarda os IDs dos serviços
+    last_row = first_row + rows - 1
+    extras = [COLUNA_CUSTO] if servicos else []
+    first_service = len(cols) + len(extras) + 1
+    total_cols = first_service + len(servicos) - 1
 
     # Estilos de cabeçalho
     header_font = Font(bold=True)
@@ -26,48 +60,70 @@ def gerar_template(output_path: Optional[str] = None) -> Path:
     header_border = Border(top=thin, bottom=thin)
     center = Alignment(horizontal="center", vertical="center")
 
-    # Escrever cabeçalhos e configurar colunas
+    # Largura e formato numérico / data aplicados na coluna inteira
     for idx, col in enumerate(cols, start=1):
-        cell = ws.cell(row=1, column=idx, value=col["title"])
-        cell.font = header_font
-        cell.fill = header_fill
-        cell.alignment = center
-        cell.border = header_border
-        ws.column_dimensions[get_column_letter(idx)].width = col.get("width", 15)
+        col_letter = get_column_letter(idx)
+        dim = ws.column_dimensions[col_letter]
+        dim.width = col.get("width", 15)
+        num_fmt = col.get("number_format")
+        if num_fmt:
+            dim.number_format = num_fmt
+    for idx in range(len(cols) + 1, total_cols + 1):
+        ws.column_dimensions[get_column_letter(idx)].width = 14
+    if extras:
+        ws.column_dimensions[get_column_letter(len(cols) + 1)].number_format = "#,##0.00"
 
     # Congelar cabeçalho e habilitar autofiltro
-    ws.freeze_panes = "A2"
-    ws.auto_filter.ref = ws.dimensions
+    ws.freeze_panes = f"A{first_row}"
+    ws.auto_filter.ref = f"A1:{get_column_letter(total_cols)}{last_row}"
 
-    # Formatação e validações por coluna
-    max_rows = 5000  # limite razoável para validação/aplicação
+    # Validações por coluna
     for idx, col in enumerate(cols, start=1):
         col_letter = get_column_letter(idx)
 
-        # Formato numérico / data
-        num_fmt = col.get("number_format")
-        if num_fmt:
-            for r in range(2, max_rows + 1):
-                ws[f"{col_letter}{r}"].number_format = num_fmt
-
         # Validação de lista
         if col.get("type") == "list" and col.get("list_values"):
             lista = ",".join(col["list_values"])  # ex: "ativo,inativo,suspenso"
             dv = DataValidation(type="list", formula1=f'"{lista}"', allow_blank=not col.get("required", False))
             dv.prompt = f"Selecione um valor para {col['title']}"
             dv.error = "Valor inválido"
-            ws.add_data_validation(dv)
-            dv.add(f"{col_letter}2:{col_letter}{max_rows}")
+            dv.add(f"{col_letter}{first_row}:{col_letter}{last_row}")
+            ws.data_validations.append(dv)
 
         # Validação de data (opcional — Excel já formata)
         if col.get("type") == "date":
             # Não aplicamos DataValidation de data para evitar bloqueios — apenas formato.
             pass
 
+    # Colunas de serviço: uma única validação cobrindo todas elas
+    if servicos:
+        lista = ",".join(SERVICE_LIST_VALUES)
+        dv = DataValidation(type="list", formula1=f'"{lista}"', allow_blank=True)
+        dv.errorStyle = "warning"  # permite informar quantidades (ex.: PDV/Comandas = 4)
+        dv.prompt = "SIM, NAO ou a quantidade contratada"
+        dv.error = "Use SIM, NAO ou uma quantidade"
+        first_letter = get_column_letter(first_service)
+        last_letter = get_column_letter(total_cols)
+        dv.add(f"{first_letter}{first_row}:{last_letter}{last_row}")
+        ws.data_validations.append(dv)
+
+    # Cabeçalhos (no modo write-only as linhas precisam vir depois da configuração)
+    header = []
+    for title in [c["title"] for c in cols] + extras + [s["name"] for s in servicos]:
+        cell = WriteOnlyCell(ws, value=title)
+        cell.font = header_font
+        cell.fill = header_fill
+        cell.alignment = center
+        cell.border = header_border
+        header.append(cell)
+    ws.append(header)
+    if servicos:
+        ws.append([None] * (first_service - 1) + [s["id"] for s in servicos])
+
     # Aba dicionário de dados
     dict_ws = wb.create_sheet("Dicionario")
     dict_ws.append(["Coluna", "Obrigatório", "Descrição", "Tipo", "Valores (se lista)"])
-    for c in contrato_columns():
+    for c in cols:
         dict_ws.append([
             c["title"],
             "Sim" if c.get("required") else "Não",
@@ -75,8 +131,90 @@ def gerar_template(output_path: Optional[str] = None) -> Path:
             c.get("type", "text"),
             ", ".join(c.get("list_values", [])),
         ])
+    if extras:
+        dict_ws.append([COLUNA_CUSTO, "Não", "Custo do contrato (cost_price do serviço de custo)", "number", ""])
+    for srv in servicos:
+        dict_ws.append([
+            srv["name"],
+            "Não",
+            f"Serviço {srv['id']}",
+            "service",
+            ", ".join(SERVICE_LIST_VALUES),
+        ])
 
     # Caminho de saída
     out = Path(output_path or "contratos_template.xlsx")
     wb.save(out)
-    return out
\ No newline at end of file
+    return out
+
+
+def gerar_templates_tenants(
+    client,
+    tenant_ids: Sequence[str],
+    output_dir: str = ".",
+    rows: int = DEFAULT_ROWS,
+    workers: int = 8,
+) -> List[Path]:
+    """
+    Gera um template por tenant com as colunas de serviço do seu catálogo.
+    Os catálogos são buscados em paralelo (e ficam em cache); retorna os caminhos na
+    ordem de `tenant_ids`, sem repetições.
+    """
+    tenant_ids = list(dict.fromkeys(tenant_ids))  # remove repetidos mantendo a ordem
+    out_dir = Path(output_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    def _um(tenant_id: str) -> Path:
+        servicos = carregar_servicos(client, tenant_id)
+        return gerar_template(str(out_dir / f"contratos_template_{tenant_id}.xlsx"), rows=rows, servicos=servicos)
+
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(tenant_ids)))) as pool:
+        return list(pool.map(_um, tenant_ids))
+
+
+def gerar_planilha_vinculos(origem: str, saida: str, ids_por_numero: Dict[str, str]) -> Dict[str, int]:
+    """
+    Converte um template por tenant preenchido (e já importado) para o layout que
+    link_contracts_services_corrigido.py lê: ID Contrato, contract_id (uuid do banco, via
+    `ids_por_numero` {contract_number: id}), demais colunas do contrato, linha de origem,
+    Custo e as colunas de serviço com o UUID na linha 2; dados a partir da linha 3.
+    Retorna {linhas, sem_id}; linhas sem id ficam com contract_id vazio (a vinculação as ignora).
+    """
+    from openpyxl import load_workbook
+
+    from .planilha import iter_projetado, ler_cabecalho
+
+    cols = contrato_columns()
+    wb_origem = load_workbook(origem, data_only=True, read_only=True)
+    try:
+        ws_origem = wb_origem.active
+        servicos = servicos_da_planilha(ws_origem)
+        if not servicos:
+            raise ValueError(f"{origem}: sem IDs de serviço na linha 2 (gere o template com --tenant)")
+        cabecalho = ler_cabecalho(ws_origem)
+        col_custo = cabecalho.index(COLUNA_CUSTO) + 1 if COLUNA_CUSTO in cabecalho else None
+
+        titulos = [cols[0]["title"], "contract_id"] + [c["title"] for c in cols[1:]] + ["Linha Origem"]
+        if len(titulos) != VINCULOS_COLUNA_CUSTO - 1:
+            raise ValueError("colunas do contrato não cabem antes da coluna de custo do layout de vínculos")
+
+        wb = Workbook(write_only=True)
+        ws = wb.create_sheet("Contratos")
+        ws.append(titulos + [COLUNA_CUSTO] + [s["name"] for s in servicos.values()])
+        ws.append([None] * VINCULOS_COLUNA_CUSTO + [s["id"] for s in servicos.values()])
+
+        lidas = list(range(1, len(cols) + 1)) + ([col_custo] if col_custo else []) + list(servicos)
+        resumo = {"linhas": 0, "sem_id": 0}
+        for row, valores in iter_projetado(ws_origem, lidas, min_row=3):
+            contrato = valores[:len(cols)]
+            custo = valores[len(cols)] if col_custo else None
+            contract_id = ids_por_numero.get(chave_shard(contrato[0], NUMERO))
+            ws.append(
+                [contrato[0], contract_id, *contrato[1:], row, custo, *valores[len(lidas) - len(servicos):]]
+            )
+            resumo["linhas"] += 1
+            resumo["sem_id"] += contract_id is None
+        wb.save(saida)
+        return resumo
+    finally:
+        wb_origem.close()
@@ -0,0 +1,184 @@
+import csv
+import json
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from .paginacao import paginar_keyset
+from .rastreamento import span
+
+XLSX = "xlsx"
+CSV = "csv"
+FORMATOS = (XLSX, CSV)
+
+# Projeção padrão por tabela: as colunas que a auditoria confere (ver contract_schema.md).
+# Outras tabelas, sem `colunas`, saem com todas as colunas.
+COLUNAS_PADRAO = {
+    "contracts": (
+        "id,tenant_id,customer_id,contract_number,status,initial_date,final_date,billing_type,"
+        "billing_day,installments,total_amount,total_discount,total_tax,billed,created_at,updated_at"
+    ),
+    "contract_services": (
+        "id,tenant_id,contract_id,service_id,quantity,unit_price,discount_percentage,discount_amount,"
+        "total_amount,tax_rate,tax_amount,is_active,payment_method,billing_type,recurrence_frequency,"
+        "installments,created_at,updated_at"
+    ),
+}
+TABELAS_PADRAO = tuple(COLUNAS_PADRAO)
+
+# Limite de linhas de uma aba do Excel, menos o cabeçalho; acima disso a tabela continua em outra aba
+LINHAS_POR_ABA = 1_048_575
+
+
+def formato_da_saida(saida: str, formato: Optional[str] = None) -> str:
+    """Formato pedido ou, sem ele, a extensão de `saida` (.xlsx ou .csv)."""
+    formato = (formato or Path(saida).suffix.lstrip(".")).lower()
+    if formato not in FORMATOS:
+        raise ValueError(f"formato deve ser um de: {', '.join(FORMATOS)} (use --formato ou a extensão da saída)")
+    return formato
+
+
+def projecao(tabela: str, colunas: Optional[str] = None, chave: str = "id") -> Tuple[str, Optional[List[str]]]:
+    """
+    (select, colunas exportadas). A chave do keyset entra no select mesmo quando não é
+    exportada; com '*' as colunas exportadas vêm da primeira linha (None aqui).
+    """
+    colunas = colunas or COLUNAS_PADRAO.get(tabela, "*")
+    if colunas.strip() == "*":
+        return "*", None
+    saida = [c.strip() for c in colunas.split(",") if c.strip()]
+    if not saida:
+        raise ValueError(f"{tabela}: nenhuma coluna informada")
+    select = saida if chave in saida else [chave] + saida
+    return ",".join(select), saida
+
+
+def _adiantar(paginas: Iterator[List[Dict[str, Any]]]) -> Iterator[List[Dict[str, Any]]]:
+    """Busca a próxima página enquanto a atual é gravada; no máximo duas ficam em memória."""
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        proxima = executor.submit(next, paginas, None)
+        while True:
+            pagina = proxima.result()
+            if pagina is None:
+                return
+            proxima = executor.submit(next, paginas, None)
+            yield pagina
+
+
+def _celula(valor: Any) -> Any:
+    # colunas json/array viram texto; o resto (números, booleanos, datas ISO) vai como veio
+    if isinstance(valor, (dict, list)):
+        return json.dumps(valor, ensure_ascii=False)
+    return valor
+
+
+def _linhas(
+    client,
+    tabela: str,
+    colunas: Optional[str],
+    filtros: Optional[Sequence[Tuple[str, Any]]],
+    tamanho_pagina: int,
+    resumo: Dict[str, int],
+) -> Tuple[Optional[List[str]], Iterator[List[Any]]]:
+    """(cabeçalho, linhas como listas) da tabela, página a página, contando em `resumo`."""
+    select, cabecalho = projecao(tabela, colunas)
+    paginas = _adiantar(paginar_keyset(client, tabela, select, filtros=filtros, tamanho=tamanho_pagina))
+    primeira = next(paginas, None)
+    if cabecalho is None:
+        cabecalho = list(primeira[0]) if primeira else None
+
+    def _gerar() -> Iterator[List[Any]]:
+        if primeira is None:
+            return
+        for pagina in chain([primeira], paginas):
+            resumo["paginas"] += 1
+            resumo["linhas"] += len(pagina)
+            for r in pagina:
+                yield [_celula(r.get(c)) for c in cabecalho]
+
+    return cabecalho, _gerar()
+
+
+def caminho_csv(saida: str, tabela: str, varias: bool) -> str:
+    """Com várias tabelas em CSV, um arquivo por tabela: 'auditoria.csv' -> 'auditoria_contracts.csv'."""
+    if not varias:
+        return saida
+    p = Path(saida)
+    return str(p.with_name(f"{p.stem}_{tabela}{p.suffix or '.csv'}"))
+
+
+def exportar(
+    client,
+    saida: str,
+    tabelas: Sequence[str] = TABELAS_PADRAO,
+    colunas: Optional[Dict[str, str]] = None,
+    filtros: Optional[Sequence[Tuple[str, Any]]] = None,
+    formato: Optional[str] = None,
+    tamanho_pagina: int = 1000,
+) -> Dict[str, Dict[str, Any]]:
+    """
+    Exporta as tabelas para XLSX (uma aba por tabela) ou CSV (um arquivo por tabela quando
+    há mais de uma), percorrendo-as por keyset em `id` com a projeção de `colunas`
+    ({tabela: "col1,col2"}; padrão em COLUNAS_PADRAO) e os `filtros` (pares coluna/valor, eq).
+
+    As linhas são gravadas à medida que as páginas chegam, com a próxima página buscada
+    durante a gravação da atual; o XLSX usa o modo write-only do openpyxl. A memória fica
+    em torno de duas páginas, qualquer que seja o tamanho da tabela.
+    Retorna {tabela: {linhas, paginas, arquivo}}.
+    """
+    formato = formato_da_saida(saida, formato)
+    colunas = colunas or {}
+    tabelas = list(dict.fromkeys(tabelas))
+    if not tabelas:
+        raise ValueError("nenhuma tabela informada")
+    resultado: Dict[str, Dict[str, Any]] = {}
+
+    if formato == CSV:
+        for tabela in tabelas:
+            destino = caminho_csv(saida, tabela, len(tabelas) > 1)
+            resumo = {"linhas": 0, "paginas": 0}
+            with span(f"exportar {tabela}", "exportacao", formato=CSV) as args:
+                cabecalho, linhas = _linhas(client, tabela, colunas.get(tabela), filtros, tamanho_pagina, resumo)
+                with open(destino, "w", newline="", encoding="utf-8") as f:
+                    w = csv.writer(f)
+                    if cabecalho:
+                        w.writerow(cabecalho)
+                    w.writerows(linhas)
+                args.update(resumo)
+            resultado[tabela] = {**resumo, "arquivo": destino}
+        return resultado
+
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Font
+
+    wb = Workbook(write_only=True)
+    negrito = Font(bold=True)
+
+    def _nova_aba(tabela: str, parte: int, cabecalho: List[str]):
+        ws = wb.create_sheet(tabela[:31] if parte == 1 else f"{tabela[:26]} ({parte})")
+        ws.freeze_panes = "A2"
+        celulas = []
+        for titulo in cabecalho:
+            c = WriteOnlyCell(ws, value=titulo)
+            c.font = negrito
+            celulas.append(c)
+        ws.append(celulas)
+        return ws
+
+    for tabela in tabelas:
+        resumo = {"linhas": 0, "paginas": 0}
+        with span(f"exportar {tabela}", "exportacao", formato=XLSX) as args:
+            cabecalho, linhas = _linhas(client, tabela, colunas.get(tabela), filtros, tamanho_pagina, resumo)
+            parte, ws, na_aba = 1, _nova_aba(tabela, 1, cabecalho or []), 0
+            for linha in linhas:
+                if na_aba == LINHAS_POR_ABA:
+                    parte, na_aba = parte + 1, 0
+                    ws = _nova_aba(tabela, parte, cabecalho)
+                ws.append(linha)
+                na_aba += 1
+            args.update(resumo, abas=parte)
+        resultado[tabela] = {**resumo, "arquivo": saida, "abas": parte}
+    wb.save(saida)
+    return resultado
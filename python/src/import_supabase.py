@@ -1,57 +1,78 @@
-from typing import List, Dict, Any, Tuple
+from typing import List, Dict, Any, Optional, Tuple
 from pathlib import Path
-from datetime import datetime
 from openpyxl import load_workbook
 
+from .escrita import DEFAULT_BATCH_SIZE, ErroEscrita, EscritorLote
+from .parsing import ColunaData, parse_date, parse_number
+from .planilha import iter_projetado, ler_cabecalho
+from .catalogo import servicos_da_planilha
+from .rastreamento import span
 from .schema import contrato_columns
+from .shards import CNPJ, NUMERO, Shard, chave_shard
 
 
-def _parse_date(value) -> Any:
+# Coluna do template usada para escolher o shard de cada linha
+COLUNA_SHARD = {NUMERO: "id_contrato", CNPJ: "cliente_cpf_cnpj"}
+
+
+def _parse_date(value, conv=parse_date) -> Any:
     if value is None or value == "":
         return None
-    if isinstance(value, datetime):
-        return value.date().isoformat()
-    # tentar converter de string dd/mm/yyyy
-    try:
-        return datetime.strptime(str(value), "%d/%m/%Y").date().isoformat()
-    except Exception:
-        # tentar ISO diretamente
-        try:
-            return datetime.fromisoformat(str(value)).date().isoformat()
-        except Exception:
-            return str(value)
+    # mantém o texto original quando não é uma data reconhecida
+    res = conv(value)
+    return res if res is not None else str(value)
 
 
 def _parse_number(value) -> Any:
     if value is None or value == "":
         return None
-    try:
-        # troca vírgula por ponto se vier em formato PT-BR
-        return float(str(value).replace(".", "").replace(",", "."))
-    except Exception:
-        return value
+    res = parse_number(value)
+    return res if res is not None else value
 
 
-def ler_planilha(path: str) -> Tuple[List[Dict[str, Any]], List[str]]:
+def ler_planilha(
+    path: str,
+    aba: Optional[str] = None,
+    shard: Optional[Shard] = None,
+    shard_por: str = NUMERO,
+) -> Tuple[List[Dict[str, Any]], List[str]]:
     """
     Lê a planilha e retorna (registros, erros).
-    Considera a primeira aba como fonte de dados.
+    Considera a primeira aba como fonte de dados, a menos que `aba` seja informada.
+    Com `shard`, só as linhas da fatia (ver `ler_aba`).
     """
     p = Path(path)
     if not p.exists():
         raise FileNotFoundError(f"Arquivo não encontrado: {path}")
 
-    wb = load_workbook(p, data_only=True)
-    ws = wb.active
+    with span("carregar planilha", "planilha", arquivo=p.name):
+        wb = load_workbook(p, data_only=True, read_only=True)
+    try:
+        ws = wb[aba] if aba else wb.active
+        return ler_aba(ws, shard=shard, shard_por=shard_por)
+    finally:
+        wb.close()
+
+
+def ler_aba(ws, shard: Optional[Shard] = None, shard_por: str = NUMERO) -> Tuple[List[Dict[str, Any]], List[str]]:
+    """
+    Lê e valida uma aba já aberta no formato do template; retorna (registros, erros).
+    Levanta ValueError se o cabeçalho não corresponder ao template. No template por tenant
+    (UUIDs dos serviços na linha 2), os dados começam na linha 3.
 
+    Com `shard`, linhas cuja chave (ID do contrato, ou CPF/CNPJ com `shard_por="cnpj"`)
+    cai em outra fatia são puladas antes de qualquer conversão, e seus erros ficam para o
+    nó responsável por elas.
+    """
     cols = contrato_columns()
     headers = [c["title"] for c in cols]
     name_map = {c["title"]: c["name"] for c in cols}
-    type_map = {c["name"]: c.get("type", "text")}
+    type_map = {c["name"]: c.get("type", "text") for c in cols}
 
     # Verificar cabeçalhos
+    header_row = ler_cabecalho(ws)
     for idx, h in enumerate(headers, start=1):
-        cell_val = ws.cell(row=1, column=idx).value
+        cell_val = header_row[idx - 1] if idx <= len(header_row) else None
         if cell_val != h:
             raise ValueError(
                 f"Cabeçalho inesperado na coluna {idx}: esperado '{h}', encontrado '{cell_val}'"
@@ -60,21 +81,23 @@ def ler_planilha(path: str) -> Tuple[List[Dict[str, Any]], List[str]]:
     registros: List[Dict[str, Any]] = []
     erros: List[str] = []
 
-    row = 2
-    while True:
-        # Parar quando a linha estiver toda vazia
-        row_values = [ws.cell(row=row, column=i).value for i in range(1, len(cols) + 1)]
-        if all(v is None or (isinstance(v, str) and v.strip() == "") for v in row_values):
-            break
+    # Um conversor por coluna de data, que fixa o formato dominante daquela coluna
+    date_convs = {c["name"]: ColunaData() for c in cols if c.get("type") == "date"}
+
+    pos_chave = [c["name"] for c in cols].index(COLUNA_SHARD[shard_por])
 
+    # Parar na primeira linha vazia; apenas as colunas do schema são lidas
+    primeira = _primeira_linha(ws, len(cols))
+    for row, row_values in iter_projetado(ws, range(1, len(cols) + 1), min_row=primeira, parar_na_vazia=True):
+        if shard is not None and not shard.contem(chave_shard(row_values[pos_chave], shard_por)):
+            continue
         registro: Dict[str, Any] = {}
-        for idx, col in enumerate(cols, start=1):
-            val = ws.cell(row=row, column=idx).value
+        for col, val in zip(cols, row_values):
             key = col["name"]
             tipo = col.get("type", "text")
 
             if tipo == "date":
-                registro[key] = _parse_date(val)
+                registro[key] = _parse_date(val, date_convs[key])
             elif tipo == "number":
                 registro[key] = _parse_number(val)
             else:
@@ -91,22 +114,42 @@ def ler_planilha(path: str) -> Tuple[List[Dict[str, Any]], List[str]]:
                     )
 
         registros.append(registro)
-        row += 1
 
     return registros, erros
 
 
-def importar_para_supabase(client, registros: List[Dict[str, Any]], tabela: str = "contratos") -> Any:
-    """
-    Envia os registros para a tabela indicada no Supabase.
-    Por padrão usa insert; se o cliente suportar upsert, tentamos upsert.
+def _primeira_linha(ws, n_colunas: int) -> int:
+    """3 quando a linha 2 é a dos IDs de serviço (colunas do contrato vazias), senão 2."""
+    linha2 = next(ws.iter_rows(min_row=2, max_row=2, max_col=n_colunas, values_only=True), ())
+    if any(v not in (None, "") for v in linha2):
+        return 2
+    return 3 if servicos_da_planilha(ws) else 2
+
+
+def importar_para_supabase(
+    client,
+    registros: List[Dict[str, Any]],
+    tabela: str = "contratos",
+    tamanho_lote: int = DEFAULT_BATCH_SIZE,
+    comprimir: bool = False,
+    outbox=None,
+) -> Any:
     """
-    table_api = client.table(tabela)
+    Envia os registros para a tabela indicada no Supabase, em lotes.
+    Tenta upsert; se o primeiro lote falhar (nada gravado ainda), repete tudo com insert.
+    Retorna o resumo do `EscritorLote` ({lotes, registros, bytes_json, bytes_enviados}).
 
-    # Tentar upsert se disponível
+    Com `outbox` (src.outbox.Outbox), os registros são primeiro enfileirados no SQLite
+    local e depois drenados; o que não puder ser enviado agora fica pendente e o resumo
+    é {enfileirados, enviados, falhas, pendentes}.
+    """
+    if outbox is not None:
+        novos = outbox.enfileirar_varios(tabela, "upsert", registros)
+        return {"enfileirados": novos, **outbox.drenar(client, tamanho_lote=tamanho_lote)}
+    opts = dict(tamanho_lote=tamanho_lote, comprimir=comprimir)
     try:
-        result = table_api.upsert(registros).execute()
-    except Exception:
-        result = table_api.insert(registros).execute()
-
-    return result
\ No newline at end of file
+        return EscritorLote(client, tabela, operacao="upsert", **opts).escrever(registros)
+    except ErroEscrita as e:
+        if e.lotes_ok:
+            raise
+        return EscritorLote(client, tabela, operacao="insert", **opts).escrever(registros)
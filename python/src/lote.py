@@ -0,0 +1,141 @@
+import glob
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from openpyxl import load_workbook
+
+from .import_supabase import ler_aba
+
+
+# Formatos aceitos no lote
+TEMPLATE = "template"    # colunas do template (src/schema.py), como `importar`
+CONTRATOS = "contratos"  # planilhas de import_contracts_from_excel.read_rows (customer_id pelo CPF/CNPJ)
+FORMATOS = (TEMPLATE, CONTRATOS)
+
+# Aba de ajuda gerada junto com o template: fora do formato, mas esperada
+ABA_DICIONARIO = "Dicionario"
+
+# Mapa documento -> cliente, enviado uma vez a cada processo do pool (ver `_iniciar_processo`)
+_clientes: Optional[Dict[str, Dict[str, Any]]] = None
+
+
+def _iniciar_processo(clientes: Optional[Dict[str, Dict[str, Any]]]) -> None:
+    global _clientes
+    _clientes = clientes
+
+
+def expandir_entradas(entrada: str) -> List[Path]:
+    """
+    Resolve `entrada` (pasta ou padrão glob) para a lista ordenada de planilhas .xlsx.
+    Arquivos temporários do Excel (`~$...`) são ignorados.
+    """
+    p = Path(entrada)
+    if p.is_dir():
+        candidatos = list(p.glob("*.xlsx"))
+    elif p.is_file():
+        candidatos = [p]
+    else:
+        candidatos = [Path(c) for c in glob.glob(entrada, recursive=True)]
+    return sorted(c for c in candidatos if c.suffix.lower() == ".xlsx" and not c.name.startswith("~$"))
+
+
+def ler_arquivo(path: str) -> Tuple[str, List[Dict[str, Any]], List[str], List[str]]:
+    """
+    Lê todas as abas no formato do template de um arquivo.
+    Retorna (arquivo, registros, erros, abas ignoradas). Executado nos processos do pool;
+    um arquivo que não abre (corrompido, não é xlsx) vira erro dele, sem derrubar o lote.
+    """
+    registros: List[Dict[str, Any]] = []
+    erros: List[str] = []
+    ignoradas: List[str] = []
+    nome = Path(path).name
+    try:
+        wb = load_workbook(path, data_only=True, read_only=True)
+    except Exception as e:
+        return path, registros, [f"{nome}: não foi possível abrir ({type(e).__name__}: {e})"], ignoradas
+    try:
+        for ws in wb.worksheets:
+            try:
+                regs, errs = ler_aba(ws)
+            except ValueError:
+                # aba fora do formato do template (ex.: Dicionario)
+                ignoradas.append(ws.title)
+                continue
+            registros.extend(regs)
+            erros.extend(f"{nome} [{ws.title}] {e}" for e in errs)
+        if len(ignoradas) == len(wb.worksheets):
+            erros.append(f"{nome}: nenhuma aba no formato do template")
+    except Exception as e:
+        erros.append(f"{nome}: falha na leitura ({type(e).__name__}: {e})")
+    finally:
+        wb.close()
+    return path, registros, erros, ignoradas
+
+
+def ler_arquivo_contratos(path: str) -> Tuple[str, List[Any], List[str], List[str]]:
+    """
+    Lê a aba ativa com `read_rows` (planilha de contratos, customer_id resolvido pelo
+    CPF/CNPJ com o mapa de clientes do processo). Retorna como `ler_arquivo`.
+    """
+    from import_contracts_from_excel import read_rows
+
+    nome = Path(path).name
+    try:
+        registros, erros = read_rows(Path(path), clientes=_clientes)
+    except Exception as e:
+        return path, [], [f"{nome}: não foi possível ler ({type(e).__name__}: {e})"], []
+    return path, registros, [f"{nome}: {e}" for e in erros], []
+
+
+def nucleos_disponiveis() -> int:
+    """Núcleos que este processo pode usar (respeita afinidade/cgroups quando disponível)."""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:  # Windows/macOS
+        return os.cpu_count() or 1
+
+
+def ler_lote(
+    arquivos: Sequence[Path],
+    workers: Optional[int] = None,
+    formato: str = TEMPLATE,
+    clientes: Optional[Dict[str, Dict[str, Any]]] = None,
+) -> Tuple[List[Any], List[str], Dict[str, int]]:
+    """
+    Lê e valida as planilhas em um pool de processos (um arquivo por tarefa).
+    Retorna (registros de todos os arquivos, erros, registros por arquivo), na ordem de `arquivos`.
+
+    `formato` TEMPLATE devolve dicts das abas no formato do template; abas fora dele (exceto
+    o Dicionario) entram nos erros. CONTRATOS
+    devolve `ContratoLinha` de `read_rows`, com `clientes` (`fetch_customers_map`) copiado
+    uma vez para cada processo.
+    """
+    if formato not in FORMATOS:
+        raise ValueError(f"formato deve ser um de: {', '.join(FORMATOS)}")
+    ler = ler_arquivo if formato == TEMPLATE else ler_arquivo_contratos
+    workers = workers or nucleos_disponiveis()
+    registros: List[Dict[str, Any]] = []
+    erros: List[str] = []
+    por_arquivo: Dict[str, int] = {}
+    caminhos = [str(a) for a in arquivos]
+
+    def _acumular(resultados) -> None:
+        for path, regs, errs, ignoradas in resultados:
+            registros.extend(regs)
+            erros.extend(errs)
+            erros.extend(
+                f"{path}: aba {t} ignorada (cabeçalho não corresponde)" for t in ignoradas if t != ABA_DICIONARIO
+            )
+            por_arquivo[path] = len(regs)
+
+    if workers == 1 or len(caminhos) <= 1:
+        _iniciar_processo(clientes)
+        _acumular(map(ler, caminhos))
+    else:
+        with ProcessPoolExecutor(
+            max_workers=min(workers, len(caminhos)), initializer=_iniciar_processo, initargs=(clientes,)
+        ) as pool:
+            _acumular(pool.map(ler, caminhos))
+    return registros, erros, por_arquivo
@@ -0,0 +1,212 @@
+import os
+import sys
+import tracemalloc
+from contextlib import contextmanager
+from typing import ContextManager, Iterator, List, Optional, Tuple
+
+from .rastreamento import span
+
+
+# Locais de alocação listados por etapa
+TOP_PADRAO = 10
+
+# Alocações do próprio rastreamento e do import de módulos não interessam no relatório.
+# São descartadas depois de agrupar por linha: `Snapshot.filter_traces` percorre cada
+# alocação em Python e domina o tempo em planilhas grandes.
+_IGNORADOS = {tracemalloc.__file__, __file__, "<unknown>"}
+_PREFIXOS_IGNORADOS = ("<frozen importlib",)
+
+
+def pico_rss_mb() -> Optional[float]:
+    """Pico de memória residente do processo até agora (None onde `resource` não existe)."""
+    try:
+        import resource
+    except ImportError:  # pragma: no cover - Windows
+        return None
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux informa em KiB, macOS em bytes
+    return round(pico / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+class EtapaMemoria:
+    __slots__ = ("nome", "nivel", "inicio", "pico", "retido", "rss_mb", "top")
+
+    def __init__(self, nome: str, nivel: int, inicio: int):
+        self.nome = nome
+        self.nivel = nivel
+        self.inicio = inicio
+        self.pico = inicio
+        self.retido = 0
+        self.rss_mb: Optional[float] = None
+        # (arquivo:linha, bytes, blocos) que cresceram durante a etapa
+        self.top: List[Tuple[str, int, int]] = []
+
+
+class RastreadorMemoria:
+    """
+    Mede a memória alocada pelo Python (tracemalloc) por etapa do pipeline:
+
+    - pico: maior volume rastreado enquanto a etapa rodava (inclui o que foi liberado);
+    - retido: quanto a etapa deixou alocado ao terminar;
+    - top: os locais (arquivo:linha) cujas alocações mais cresceram entre o snapshot do
+      início e o do fim da etapa — quem está segurando a memória.
+
+    Etapas podem ser aninhadas; o pico da etapa externa considera o das internas.
+    Memória alocada fora do Python (ex.: bibliotecas C) só aparece no pico de RSS.
+    """
+
+    def __init__(self, top: int = TOP_PADRAO, quadros: int = 1):
+        self.top = top
+        self.quadros = quadros
+        self.etapas: List[EtapaMemoria] = []
+        self._pilha: List[EtapaMemoria] = []
+
+    def iniciar(self) -> "RastreadorMemoria":
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.quadros)
+        return self
+
+    def parar(self) -> None:
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    @contextmanager
+    def etapa(self, nome: str) -> Iterator[None]:
+        if not tracemalloc.is_tracing():
+            yield
+            return
+        atual, pico = tracemalloc.get_traced_memory()
+        for externa in self._pilha:  # o reset abaixo não pode apagar o pico das etapas externas
+            externa.pico = max(externa.pico, pico)
+        etapa = EtapaMemoria(nome, len(self._pilha), atual)
+        self.etapas.append(etapa)
+        self._pilha.append(etapa)
+        antes = tracemalloc.take_snapshot()
+        tracemalloc.reset_peak()
+        try:
+            yield
+        finally:
+            atual, pico = tracemalloc.get_traced_memory()
+            etapa.pico = max(etapa.pico, pico)
+            etapa.retido = atual - etapa.inicio
+            etapa.rss_mb = pico_rss_mb()
+            self._pilha.pop()
+            for externa in self._pilha:
+                externa.pico = max(externa.pico, etapa.pico)
+            diferencas = [
+                d for d in tracemalloc.take_snapshot().compare_to(antes, "lineno")
+                if d.size_diff > 0
+                and d.traceback[0].filename not in _IGNORADOS
+                and not d.traceback[0].filename.startswith(_PREFIXOS_IGNORADOS)
+            ]
+            etapa.top = [
+                (f"{d.traceback[0].filename}:{d.traceback[0].lineno}", d.size_diff, d.count_diff)
+                for d in sorted(diferencas, key=lambda d: d.size_diff, reverse=True)[: self.top]
+            ]
+
+    def relatorio(self) -> str:
+        if not self.etapas:
+            return "Memória: nenhuma etapa registrada."
+        mb = lambda b: b / (1024 * 1024)
+        largura = max(len(e.nome) + 2 * e.nivel for e in self.etapas)
+        linhas = ["Memória por etapa (tracemalloc):"]
+        linhas.append(f"  {'etapa'.ljust(largura)}   pico MB  retido MB  RSS máx MB")
+        for e in self.etapas:
+            rss = f"{e.rss_mb:11.1f}" if e.rss_mb is not None else f"{'-':>11}"
+            linhas.append(
+                f"  {('  ' * e.nivel + e.nome).ljust(largura)} {mb(e.pico):9.1f} {mb(e.retido):10.1f} {rss}"
+            )
+        for e in self.etapas:
+            if not e.top:
+                continue
+            linhas.append(f"  Top alocações retidas em '{e.nome}':")
+            for local, tamanho, blocos in e.top:
+                linhas.append(f"    {mb(tamanho):8.2f} MB {blocos:9d} blocos  {_encurtar(local)}")
+        return "\n".join(linhas)
+
+
+def _encurtar(local: str) -> str:
+    # caminho relativo à entrada mais específica do sys.path (projeto, stdlib ou site-packages)
+    arquivo, _, linha = local.rpartition(":")
+    bases = [
+        os.path.abspath(p) for p in sys.path
+        if p and arquivo.startswith(os.path.join(os.path.abspath(p), ""))
+    ]
+    if not bases:
+        return local
+    return f"{os.path.relpath(arquivo, max(bases, key=len))}:{linha}"
+
+
+_rastreador: Optional[RastreadorMemoria] = None
+
+
+def ativar(top: int = TOP_PADRAO) -> RastreadorMemoria:
+    """Liga o rastreamento do processo (idempotente) e retorna o rastreador."""
+    global _rastreador
+    if _rastreador is None:
+        _rastreador = RastreadorMemoria(top=top)
+    return _rastreador.iniciar()
+
+
+@contextmanager
+def _etapa_completa(nome: str) -> Iterator[None]:
+    with span(nome, "etapa"), _rastreador.etapa(nome):
+        yield
+
+
+def etapa(nome: str) -> ContextManager[None]:
+    """
+    Marca uma etapa do pipeline: memória (se `ativar`) e span no trace (se
+    src/rastreamento.py estiver ativo). Sem nenhum dos dois não custa nada.
+    """
+    if _rastreador is None:
+        return span(nome, "etapa")
+    return _etapa_completa(nome)
+
+
+class Etapa:
+    """
+    Etapa marcada sem bloco `with`, para scripts em que as etapas são trechos seguidos da
+    mesma função: `etapa = iniciar_etapa("leitura")` ... `etapa.encerrar()`.
+    """
+
+    __slots__ = ("nome", "_contexto")
+
+    def __init__(self, nome: str):
+        self.nome = nome
+        self._contexto: Optional[ContextManager[None]] = None
+
+    def iniciar(self) -> "Etapa":
+        self._contexto = etapa(self.nome)
+        self._contexto.__enter__()
+        return self
+
+    def encerrar(self) -> None:
+        if self._contexto is not None:
+            contexto, self._contexto = self._contexto, None
+            contexto.__exit__(None, None, None)
+
+
+def iniciar_etapa(nome: str) -> Etapa:
+    return Etapa(nome).iniciar()
+
+
+def relatorio() -> str:
+    if _rastreador is None:
+        return "Memória: rastreamento desativado."
+    return _rastreador.relatorio()
+
+
+def memoria_ativa() -> bool:
+    """Scripts avulsos ativam com SUPABASE_TRACE_MEMORY=1 ou `--trace-memory` (o CLI usa a opção global)."""
+    return os.environ.get("SUPABASE_TRACE_MEMORY") == "1" or "--trace-memory" in sys.argv[1:]
+
+
+def iniciar_se_ativo() -> None:
+    if memoria_ativa():
+        ativar()
+
+
+def imprimir_se_ativo() -> None:
+    if _rastreador is not None:
+        print(relatorio())
@@ -0,0 +1,419 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import httpx
+
+from .escrita import (
+    DEFAULT_BATCH_SIZE,
+    FATAL,
+    AgendadorEscrita,
+    ErroEscrita,
+    EscritorLote,
+    classificar_erro,
+)
+
+
+# Estados de um item da outbox
+PENDENTE = "pendente"
+ENVIADO = "enviado"
+FALHA = "falha"  # erro definitivo (dados/permissão); não é reenviado sozinho
+
+# Carimbos de data não identificam a escrita: ficam fora da chave de idempotência,
+# senão cada execução do mesmo pipeline geraria chaves novas
+CAMPOS_FORA_DA_CHAVE = ("created_at", "updated_at")
+
+# Namespace dos ids gerados a partir da chave de idempotência (uuid5)
+NAMESPACE_OUTBOX = uuid.UUID("6f1d3c2a-8e7b-4c1d-9a55-2b0e4f7c9d10")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    chave TEXT NOT NULL,
+    tabela TEXT NOT NULL,
+    operacao TEXT NOT NULL,
+    on_conflict TEXT,
+    filtro TEXT,
+    payload TEXT NOT NULL,
+    estado TEXT NOT NULL DEFAULT 'pendente',
+    tentativas INTEGER NOT NULL DEFAULT 0,
+    ultimo_erro TEXT,
+    criado_em REAL NOT NULL,
+    enviado_em REAL
+);
+CREATE INDEX IF NOT EXISTS outbox_estado_id ON outbox (estado, id);
+-- a chave só é única entre os pendentes: depois de enviada, a mesma escrita pode voltar
+-- (A -> B -> A precisa reenviar o último A)
+CREATE UNIQUE INDEX IF NOT EXISTS outbox_chave_pendente ON outbox (chave) WHERE estado = 'pendente';
+"""
+
+
+def _json(valor: Any) -> str:
+    return json.dumps(valor, sort_keys=True, ensure_ascii=False, separators=(",", ":"), default=str)
+
+
+def chave_idempotencia(
+    tabela: str,
+    operacao: str,
+    registro: Dict[str, Any],
+    on_conflict: Optional[str] = None,
+    filtro: Optional[Dict[str, Any]] = None,
+) -> str:
+    """Hash estável da escrita: enfileirar duas vezes a mesma escrita não a duplica."""
+    identidade = {k: v for k, v in registro.items() if k not in CAMPOS_FORA_DA_CHAVE}
+    return hashlib.sha256(_json([tabela, operacao, on_conflict, filtro, identidade]).encode("utf-8")).hexdigest()
+
+
+class Outbox:
+    """
+    Fila local (SQLite) de escritas para o Supabase.
+
+    Os pipelines enfileiram insert/update/upsert aqui — sem depender da rede — e um
+    drenador envia os pendentes depois, em lotes. Cada item tem uma chave de
+    idempotência:
+
+    - enfileirar de novo uma escrita que ainda está pendente é ignorado (índice único
+      parcial na chave); já enviada, ela entra de novo na fila, senão a sequência
+      A -> B -> A perderia o último A;
+    - inserts recebem `id` = uuid5(chave) e são enviados como upsert com
+      `resolution=ignore-duplicates` em `id`, então reenviar um lote cuja resposta se
+      perdeu não cria linhas duplicadas (vale para tabelas com PK uuid `id`, como
+      contracts e contract_services; use `gerar_id=False` nas demais);
+    - upserts e updates já são idempotentes por natureza.
+    """
+
+    def __init__(self, caminho: str = "outbox.sqlite3"):
+        self.caminho = caminho
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(caminho, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def __enter__(self) -> "Outbox":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    # -- enfileirar ---------------------------------------------------------------
+
+    def _linha(
+        self,
+        tabela: str,
+        operacao: str,
+        registro: Dict[str, Any],
+        on_conflict: Optional[str],
+        filtro: Optional[Dict[str, Any]],
+        chave: Optional[str],
+        gerar_id: bool,
+        agora: float,
+    ) -> Tuple[Any, ...]:
+        if operacao not in ("insert", "upsert", "update"):
+            raise ValueError("operacao deve ser 'insert', 'upsert' ou 'update'")
+        if operacao == "update" and not filtro:
+            raise ValueError("update na outbox exige `filtro` (ex.: {'id': ...})")
+        chave = chave or chave_idempotencia(tabela, operacao, registro, on_conflict, filtro)
+        if operacao == "insert" and gerar_id and "id" not in registro:
+            registro = {"id": str(uuid.uuid5(NAMESPACE_OUTBOX, chave)), **registro}
+        return (
+            chave,
+            tabela,
+            operacao,
+            on_conflict,
+            _json(filtro) if filtro else None,
+            _json(registro),
+            agora,
+        )
+
+    def enfileirar(
+        self,
+        tabela: str,
+        operacao: str,
+        registro: Dict[str, Any],
+        on_conflict: Optional[str] = None,
+        filtro: Optional[Dict[str, Any]] = None,
+        chave: Optional[str] = None,
+        gerar_id: bool = True,
+    ) -> bool:
+        """Enfileira uma escrita; retorna False se a mesma chave já estava pendente na outbox."""
+        linha = self._linha(tabela, operacao, registro, on_conflict, filtro, chave, gerar_id, time.time())
+        with self._lock:
+            cur = self._conn.execute(
+                "INSERT OR IGNORE INTO outbox (chave, tabela, operacao, on_conflict, filtro, payload, criado_em)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                linha,
+            )
+        return cur.rowcount == 1
+
+    def enfileirar_varios(
+        self,
+        tabela: str,
+        operacao: str,
+        registros: Iterable[Dict[str, Any]],
+        on_conflict: Optional[str] = None,
+        gerar_id: bool = True,
+    ) -> int:
+        """Enfileira vários registros em uma transação; retorna quantos não estavam pendentes."""
+        agora = time.time()
+        linhas = [self._linha(tabela, operacao, r, on_conflict, None, None, gerar_id, agora) for r in registros]
+        with self._lock:
+            antes = self._conn.total_changes
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO outbox (chave, tabela, operacao, on_conflict, filtro, payload, criado_em)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    linhas,
+                )
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+            return self._conn.total_changes - antes
+
+    # -- consulta -----------------------------------------------------------------
+
+    def contar(self) -> Dict[str, int]:
+        with self._lock:
+            linhas = self._conn.execute("SELECT estado, COUNT(*) FROM outbox GROUP BY estado").fetchall()
+        contagem = {PENDENTE: 0, ENVIADO: 0, FALHA: 0}
+        contagem.update(dict(linhas))
+        return contagem
+
+    def falhas(self, limite: int = 20) -> List[Tuple[str, str, str]]:
+        """(tabela, operacao, erro) das últimas falhas definitivas."""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT tabela, operacao, ultimo_erro FROM outbox WHERE estado = ? ORDER BY id DESC LIMIT ?",
+                (FALHA, limite),
+            ).fetchall()
+
+    def reenfileirar_falhas(self) -> int:
+        """
+        Volta os itens em falha para pendente (após corrigir a causa). Falhas cuja chave já
+        está pendente (a mesma escrita enfileirada de novo) são descartadas.
+        """
+        with self._lock:
+            self._conn.execute("BEGIN")
+            cur = self._conn.execute("UPDATE OR IGNORE outbox SET estado = ? WHERE estado = ?", (PENDENTE, FALHA))
+            self._conn.execute("DELETE FROM outbox WHERE estado = ?", (FALHA,))
+            self._conn.execute("COMMIT")
+        return cur.rowcount
+
+    def limpar_enviados(self, mais_antigos_que: float = 7 * 86400) -> int:
+        """Remove itens já enviados há mais de `mais_antigos_que` segundos."""
+        with self._lock:
+            cur = self._conn.execute(
+                "DELETE FROM outbox WHERE estado = ? AND enviado_em < ?",
+                (ENVIADO, time.time() - mais_antigos_que),
+            )
+        return cur.rowcount
+
+    # -- drenagem -----------------------------------------------------------------
+
+    def _pendentes(self, limite: int) -> List[Tuple[Any, ...]]:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT id, tabela, operacao, on_conflict, filtro, payload FROM outbox"
+                " WHERE estado = ? ORDER BY id LIMIT ?",
+                (PENDENTE, limite),
+            ).fetchall()
+
+    def _marcar(self, ids: List[int], estado: str, erro: Optional[str] = None) -> None:
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.executemany(
+                "UPDATE outbox SET estado = ?, ultimo_erro = ?, tentativas = tentativas + 1,"
+                " enviado_em = CASE WHEN ? = 'enviado' THEN ? ELSE enviado_em END WHERE id = ?",
+                [(estado, erro, estado, time.time(), i) for i in ids],
+            )
+            self._conn.execute("COMMIT")
+
+    def _registrar_tentativa(self, ids: List[int], erro: str) -> None:
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE outbox SET tentativas = tentativas + 1, ultimo_erro = ? WHERE id = ?",
+                [(erro, i) for i in ids],
+            )
+
+    def drenar(
+        self,
+        client,
+        tamanho_lote: int = DEFAULT_BATCH_SIZE,
+        agendador: Optional[AgendadorEscrita] = None,
+    ) -> Dict[str, int]:
+        """
+        Envia os pendentes em ordem de enfileiramento, agrupando itens consecutivos da
+        mesma tabela/operação em lotes. Para na primeira falha de rede/servidor (os
+        itens continuam pendentes para a próxima drenagem); erros definitivos marcam
+        só os itens culpados como `falha`.
+        Retorna {enviados, falhas, pendentes}.
+        """
+        agendador = agendador or AgendadorEscrita(tamanho_inicial=tamanho_lote)
+        resumo = {"enviados": 0, "falhas": 0}
+        while True:
+            grupo = _primeiro_grupo(self._pendentes(tamanho_lote))
+            if not grupo:
+                break
+            ids = [g[0] for g in grupo]
+            try:
+                _enviar_grupo(client, grupo, agendador)
+            except Exception as e:
+                if _transitorio(e):
+                    self._registrar_tentativa(ids, str(e)[:500])
+                    break
+                enviados, falhos, interrompido = _isolar_falhas(client, grupo, agendador)
+                self._marcar(enviados, ENVIADO)
+                for item_id, erro in falhos:
+                    self._marcar([item_id], FALHA, erro)
+                resumo["enviados"] += len(enviados)
+                resumo["falhas"] += len(falhos)
+                if interrompido:
+                    break
+                continue
+            self._marcar(ids, ENVIADO)
+            resumo["enviados"] += len(ids)
+        resumo["pendentes"] = self.contar()[PENDENTE]
+        return resumo
+
+
+def _assinatura(item: Tuple[Any, ...]) -> Tuple[Any, ...]:
+    _, tabela, operacao, on_conflict, filtro, payload = item
+    if operacao == "update":
+        # cada update tem seu filtro: vai sozinho
+        return (tabela, operacao, filtro, payload)
+    # PostgREST usa as chaves do primeiro objeto do lote: só agrupa registros com as mesmas colunas
+    return (tabela, operacao, on_conflict, tuple(json.loads(payload)))
+
+
+def _primeiro_grupo(itens: List[Tuple[Any, ...]]) -> List[Tuple[Any, ...]]:
+    """Maior prefixo de itens consecutivos que podem ir no mesmo lote."""
+    if not itens:
+        return []
+    base = _assinatura(itens[0])
+    if base[1] == "update":
+        return itens[:1]
+    grupo = [itens[0]]
+    for item in itens[1:]:
+        if _assinatura(item) != base:
+            break
+        grupo.append(item)
+    return grupo
+
+
+def _enviar_grupo(client, grupo: List[Tuple[Any, ...]], agendador: AgendadorEscrita) -> None:
+    _, tabela, operacao, on_conflict, filtro, _ = grupo[0]
+    registros = [json.loads(g[5]) for g in grupo]
+    if operacao == "update":
+        def _patch(lote: List[Dict[str, Any]]) -> None:
+            query = client.table(tabela).update(lote[0])
+            for coluna, valor in json.loads(filtro).items():
+                query = query.eq(coluna, valor)
+            query.execute()
+
+        agendador.gravar(registros, _patch)
+        return
+    if operacao == "insert" and "id" in registros[0]:
+        # id derivado da chave de idempotência: reenvio vira no-op
+        escritor = EscritorLote(client, tabela, operacao="upsert", on_conflict="id",
+                                ignorar_duplicados=True, agendador=agendador)
+    else:
+        escritor = EscritorLote(client, tabela, operacao=operacao, on_conflict=on_conflict, agendador=agendador)
+    escritor.escrever(registros)
+
+
+def _transitorio(exc: BaseException) -> bool:
+    """Falha de rede/servidor (tentar de novo mais tarde) x erro definitivo dos dados."""
+    if isinstance(exc, ErroEscrita) and exc.status_code is None:
+        return exc.__cause__ is None or isinstance(exc.__cause__, httpx.HTTPError)
+    return classificar_erro(exc) != FATAL
+
+
+def _isolar_falhas(
+    client, grupo: List[Tuple[Any, ...]], agendador: AgendadorEscrita
+) -> Tuple[List[int], List[Tuple[int, str]], bool]:
+    """
+    Reenvia item a item para separar os registros válidos dos que o servidor recusa.
+    Retorna (enviados, falhos, interrompido) — interrompido se a rede/servidor falhou no meio.
+    """
+    enviados: List[int] = []
+    falhos: List[Tuple[int, str]] = []
+    for item in grupo:
+        try:
+            _enviar_grupo(client, [item], agendador)
+        except Exception as e:
+            if _transitorio(e):
+                return enviados, falhos, True
+            falhos.append((item[0], str(e)[:500]))
+        else:
+            enviados.append(item[0])
+    return enviados, falhos, False
+
+
+class DrenadorOutbox:
+    """
+    Thread que drena a outbox periodicamente enquanto o pipeline processa a planilha.
+    Ao parar, faz uma última drenagem; o que não puder ser enviado fica pendente.
+    """
+
+    def __init__(self, outbox: Outbox, client, intervalo: float = 2.0, tamanho_lote: int = DEFAULT_BATCH_SIZE):
+        self.outbox = outbox
+        self.client = client
+        self.intervalo = intervalo
+        self.tamanho_lote = tamanho_lote
+        self.resumo = {"enviados": 0, "falhas": 0, "pendentes": 0}
+        self._parar = threading.Event()
+        self._thread = threading.Thread(target=self._loop, name="drenador-outbox", daemon=True)
+
+    def _drenar(self) -> None:
+        try:
+            r = self.outbox.drenar(self.client, tamanho_lote=self.tamanho_lote)
+        except Exception as e:  # rede caiu no meio da consulta etc.: tenta de novo depois
+            print(f"Outbox: drenagem adiada ({e})")
+            return
+        self.resumo["enviados"] += r["enviados"]
+        self.resumo["falhas"] += r["falhas"]
+        self.resumo["pendentes"] = r["pendentes"]
+
+    def _loop(self) -> None:
+        while not self._parar.wait(self.intervalo):
+            self._drenar()
+
+    def iniciar(self) -> "DrenadorOutbox":
+        self._thread.start()
+        return self
+
+    def parar(self) -> Dict[str, int]:
+        self._parar.set()
+        self._thread.join()
+        self._drenar()
+        return self.resumo
+
+    def relatorio(self) -> str:
+        r = self.resumo
+        return (
+            f"Outbox: {r['enviados']} enviados, {r['falhas']} com falha, "
+            f"{r['pendentes']} pendentes em {self.outbox.caminho}"
+        )
+
+    def __enter__(self) -> "DrenadorOutbox":
+        return self.iniciar()
+
+    def __exit__(self, *exc) -> None:
+        self.parar()
+
+
+def outbox_do_ambiente() -> Optional[Outbox]:
+    """Outbox configurada em SUPABASE_OUTBOX (caminho do arquivo SQLite), se houver."""
+    caminho = os.environ.get("SUPABASE_OUTBOX")
+    return Outbox(caminho) if caminho else None
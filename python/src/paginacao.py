@@ -0,0 +1,35 @@
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+
+def paginar_keyset(
+    client,
+    tabela: str,
+    colunas: str,
+    filtros: Optional[Sequence[Tuple[str, Any]]] = None,
+    chave: str = "id",
+    tamanho: int = 1000,
+) -> Iterator[List[Dict[str, Any]]]:
+    """
+    Percorre a tabela em páginas ordenadas por `chave`, pedindo sempre as linhas com
+    `chave` maior que a última vista (keyset), em vez de usar offset/range.
+    `colunas` é a projeção enviada no select e precisa incluir `chave`.
+    `filtros` é uma lista de pares (coluna, valor) aplicados com eq (ou com `in` quando
+    o valor é uma lista/tupla/conjunto).
+    """
+    ultimo = None
+    while True:
+        query = client.table(tabela).select(colunas)
+        for coluna, valor in filtros or ():
+            if isinstance(valor, (list, tuple, set, frozenset)):
+                query = query.in_(coluna, list(valor))
+            else:
+                query = query.eq(coluna, valor)
+        if ultimo is not None:
+            query = query.gt(chave, ultimo)
+        resp = query.order(chave).limit(tamanho).execute()
+        rows = resp.data or []
+        if rows:
+            yield rows
+        if len(rows) < tamanho:
+            break
+        ultimo = rows[-1][chave]
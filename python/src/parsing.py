@@ -0,0 +1,151 @@
+import re
+from collections import Counter
+from datetime import date, datetime
+from functools import lru_cache
+from typing import Any, Iterable, Optional
+
+
+# Formatos de data reconhecidos
+FORMATO_BR = "dd/mm/yyyy"
+FORMATO_ISO = "iso"
+
+# Tamanho do cache de valores já convertidos (datas e números se repetem muito entre linhas)
+CACHE_SIZE = 8192
+
+_BR_RE = re.compile(r"(\d{1,2})/(\d{1,2})/(\d{4})")
+_ISO_RE = re.compile(r"(\d{4})-(\d{2})-(\d{2})(?:[T ].*)?")
+_MILHAR_RE = re.compile(r"-?\d{1,3}(?:\.\d{3})+")
+
+
+def _vazio(value: Any) -> bool:
+    return value is None or (isinstance(value, str) and value.strip() == "")
+
+
+def _classificar(texto: str) -> Optional[str]:
+    if _BR_RE.fullmatch(texto):
+        return FORMATO_BR
+    if _ISO_RE.fullmatch(texto):
+        return FORMATO_ISO
+    return None
+
+
+def detectar_formato_data(valores: Iterable[Any], amostra: int = 200) -> str:
+    """Retorna o formato dominante entre os primeiros `amostra` textos de data."""
+    contagem: Counter = Counter()
+    vistos = 0
+    for v in valores:
+        if not isinstance(v, str) or not v.strip():
+            continue
+        fmt = _classificar(v.strip())
+        if fmt:
+            contagem[fmt] += 1
+        vistos += 1
+        if vistos >= amostra:
+            break
+    return contagem.most_common(1)[0][0] if contagem else FORMATO_BR
+
+
+def _de_br(texto: str) -> Optional[str]:
+    m = _BR_RE.fullmatch(texto)
+    if not m:
+        return None
+    d, mth, y = m.groups()
+    try:
+        return date(int(y), int(mth), int(d)).isoformat()
+    except ValueError:  # ex.: 31/02/2025
+        return None
+
+
+def _de_iso(texto: str) -> Optional[str]:
+    m = _ISO_RE.fullmatch(texto)
+    if not m:
+        return None
+    y, mth, d = m.groups()
+    try:
+        return date(int(y), int(mth), int(d)).isoformat()
+    except ValueError:
+        return None
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _data_de_texto(texto: str, formato: str) -> Optional[str]:
+    # Formato dominante primeiro; os testes são por regex, sem exceções no caminho comum
+    ordem = (_de_br, _de_iso) if formato == FORMATO_BR else (_de_iso, _de_br)
+    for conv in ordem:
+        res = conv(texto)
+        if res:
+            return res
+    # Último recurso para variações aceitas por fromisoformat (ex.: 20250131)
+    try:
+        return datetime.fromisoformat(texto).date().isoformat()
+    except ValueError:
+        return None
+
+
+def parse_date(value: Any, formato: str = FORMATO_BR) -> Optional[str]:
+    """
+    Converte um valor de célula em data ISO (YYYY-MM-DD), ou None se não for uma data.
+    Textos são convertidos uma única vez por valor distinto (cache limitado).
+    """
+    if _vazio(value):
+        return None
+    if isinstance(value, datetime):
+        return value.date().isoformat()
+    if isinstance(value, date):
+        return value.isoformat()
+    return _data_de_texto(str(value).strip(), formato)
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _numero_de_texto(texto: str) -> Optional[float]:
+    s = texto.replace("R$", "").replace(" ", "")
+    if "," in s:
+        # PT-BR: 1.234,56
+        s = s.replace(".", "").replace(",", ".")
+    elif _MILHAR_RE.fullmatch(s):
+        # PT-BR só com separador de milhar: 1.234.567
+        s = s.replace(".", "")
+    try:
+        return float(s)
+    except ValueError:
+        return None
+
+
+def parse_number(value: Any) -> Optional[float]:
+    """
+    Converte um valor de célula em float, aceitando números PT-BR (`1.234,56`).
+    Células numéricas não passam por texto; textos usam cache limitado.
+    """
+    if _vazio(value):
+        return None
+    if isinstance(value, bool):
+        return float(value)
+    if isinstance(value, (int, float)):
+        return float(value)
+    return _numero_de_texto(str(value).strip())
+
+
+class ColunaData:
+    """
+    Conversor de datas de uma coluna: observa os primeiros valores em texto, fixa o
+    formato dominante e passa a tentá-lo primeiro nas demais linhas.
+    """
+
+    def __init__(self, amostra: int = 50):
+        self.amostra = amostra
+        self.formato: Optional[str] = None
+        self._contagem: Counter = Counter()
+        self._vistos = 0
+
+    def __call__(self, value: Any) -> Optional[str]:
+        if self.formato is None and isinstance(value, str) and value.strip():
+            fmt = _classificar(value.strip())
+            if fmt:
+                self._contagem[fmt] += 1
+            self._vistos += 1
+            if self._vistos >= self.amostra:
+                self.formato = self._formato_atual()
+        return parse_date(value, self.formato or self._formato_atual())
+
+    def _formato_atual(self) -> str:
+        return self._contagem.most_common(1)[0][0] if self._contagem else FORMATO_BR
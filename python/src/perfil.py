@@ -0,0 +1,98 @@
+import os
+import threading
+from collections import deque
+from typing import Deque, Dict, Optional
+
+from .concorrencia import LIMITADOR, LimitadorAIMD
+
+
+# Quantas latências guardar por endpoint para o p95 (as mais recentes)
+AMOSTRA_LATENCIAS = 2048
+
+
+class EstatisticaEndpoint:
+    __slots__ = ("requisicoes", "erros", "bytes_enviados", "total_s", "max_s", "latencias")
+
+    def __init__(self) -> None:
+        self.requisicoes = 0
+        self.erros = 0
+        self.bytes_enviados = 0
+        self.total_s = 0.0
+        self.max_s = 0.0
+        self.latencias: Deque[float] = deque(maxlen=AMOSTRA_LATENCIAS)
+
+    def registrar(self, latencia: float, erro: bool, bytes_enviados: int) -> None:
+        self.requisicoes += 1
+        self.erros += erro
+        self.bytes_enviados += bytes_enviados
+        self.total_s += latencia
+        self.max_s = max(self.max_s, latencia)
+        self.latencias.append(latencia)  # deque com maxlen descarta a mais antiga em O(1)
+
+    def resumo(self) -> Dict[str, float]:
+        ordenadas = sorted(self.latencias)
+        p95 = ordenadas[min(len(ordenadas) - 1, int(len(ordenadas) * 0.95))] if ordenadas else 0.0
+        return {
+            "requisicoes": self.requisicoes,
+            "erros": self.erros,
+            "bytes_enviados": self.bytes_enviados,
+            "media_ms": round(1000 * self.total_s / self.requisicoes, 1) if self.requisicoes else 0.0,
+            "p95_ms": round(1000 * p95, 1),
+            "max_ms": round(1000 * self.max_s, 1),
+        }
+
+
+_lock = threading.Lock()
+_endpoints: Dict[str, EstatisticaEndpoint] = {}
+
+
+def registrar_requisicao(endpoint: str, latencia: float, erro: bool, bytes_enviados: int = 0) -> None:
+    """Registra uma requisição HTTP concluída (chamado pelo transporte do cliente)."""
+    with _lock:
+        est = _endpoints.get(endpoint)
+        if est is None:
+            est = _endpoints[endpoint] = EstatisticaEndpoint()
+        est.registrar(latencia, erro, bytes_enviados)
+
+
+def estatisticas() -> Dict[str, Dict[str, float]]:
+    """Resumo por endpoint ("METODO tabela"), ordenado pelo tempo total gasto."""
+    with _lock:
+        itens = sorted(_endpoints.items(), key=lambda kv: kv[1].total_s, reverse=True)
+        return {nome: est.resumo() for nome, est in itens}
+
+
+def limpar() -> None:
+    with _lock:
+        _endpoints.clear()
+
+
+def relatorio(limitador: Optional[LimitadorAIMD] = LIMITADOR) -> str:
+    """Relatório em texto das requisições por endpoint e do estado do limitador."""
+    stats = estatisticas()
+    if not stats:
+        return "Perfil: nenhuma requisição HTTP registrada."
+    linhas = ["Perfil de requisições:"]
+    largura = max(len(n) for n in stats)
+    linhas.append(f"  {'endpoint'.ljust(largura)}   reqs  erros  média ms    p95 ms    máx ms")
+    for nome, r in stats.items():
+        linhas.append(
+            f"  {nome.ljust(largura)} {r['requisicoes']:6d} {r['erros']:6d} "
+            f"{r['media_ms']:9.1f} {r['p95_ms']:9.1f} {r['max_ms']:9.1f}"
+        )
+    if limitador is not None:
+        e = limitador.estado()
+        linhas.append(
+            f"  concorrência: limite={e['limite']} pico={e['pico_em_transito']} cortes={e['cortes']}"
+        )
+    return "\n".join(linhas)
+
+
+def perfil_ativo() -> bool:
+    """Scripts avulsos ativam o relatório com SUPABASE_PERFIL=1 (o CLI usa --perfil)."""
+    return os.environ.get("SUPABASE_PERFIL") == "1"
+
+
+def imprimir_se_ativo() -> None:
+    if perfil_ativo():
+        print(relatorio())
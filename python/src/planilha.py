@@ -0,0 +1,70 @@
+from operator import itemgetter
+from typing import Any, Iterator, List, Optional, Sequence, Tuple
+
+from .rastreamento import rastro
+
+
+# Linhas por span "ler bloco" no trace (ver src/rastreamento.py)
+LINHAS_POR_BLOCO = 1000
+
+
+def _vazio(v: Any) -> bool:
+    return v is None or (isinstance(v, str) and v.strip() == "")
+
+
+def ler_cabecalho(ws, row: int = 1) -> List[Any]:
+    """Retorna os valores da linha de cabeçalho sem criar objetos de célula."""
+    return list(next(ws.iter_rows(min_row=row, max_row=row, values_only=True), ()))
+
+
+def iter_projetado(
+    ws,
+    colunas: Sequence[int],
+    min_row: int = 2,
+    parar_na_vazia: bool = False,
+    max_row: Optional[int] = None,
+) -> Iterator[Tuple[int, Tuple[Any, ...]]]:
+    """
+    Percorre a planilha a partir de `min_row` devolvendo (número da linha, valores),
+    onde os valores são apenas os das `colunas` pedidas (índices 1-based), na mesma ordem.
+
+    A leitura usa `values_only` e para na maior coluna pedida, então colunas à direita
+    nunca são decodificadas. Linhas vazias (considerando só as colunas projetadas) são
+    puladas, ou encerram a leitura se `parar_na_vazia` for verdadeiro.
+
+    Com o trace ativo, cada bloco de `LINHAS_POR_BLOCO` linhas vira um span (leitura e
+    processamento das linhas pelo chamador).
+
+    `max_row` limita a última linha lida (intervalos de linhas processados por shards).
+    """
+    if not colunas:
+        return
+    max_col = max(colunas)
+    pick = itemgetter(*[c - 1 for c in colunas])
+    unico = len(colunas) == 1
+    r = rastro()
+    inicio_bloco = r.agora() if r else 0
+    linhas_bloco = 0
+    row_num = min_row - 1
+
+    try:
+        for row_num, vals in enumerate(
+            ws.iter_rows(min_row=min_row, max_row=max_row, max_col=max_col, values_only=True), start=min_row
+        ):
+            if len(vals) < max_col:  # modo read-only pode encurtar linhas no fim da planilha
+                vals = tuple(vals) + (None,) * (max_col - len(vals))
+            valores = (pick(vals),) if unico else pick(vals)
+            if all(_vazio(v) for v in valores):
+                if parar_na_vazia:
+                    return
+                continue
+            yield row_num, valores
+            if r is not None:
+                linhas_bloco += 1
+                if linhas_bloco == LINHAS_POR_BLOCO:
+                    fim = r.agora()
+                    r.registrar("ler bloco", "planilha", inicio_bloco, fim, {"ate_linha": row_num, "linhas": linhas_bloco})
+                    inicio_bloco, linhas_bloco = fim, 0
+    finally:
+        if r is not None and linhas_bloco:
+            r.registrar("ler bloco", "planilha", inicio_bloco, r.agora(), {"ate_linha": row_num, "linhas": linhas_bloco})
@@ -0,0 +1,101 @@
+import atexit
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Any, ContextManager, Dict, Iterator, List, Optional
+
+
+class Rastro:
+    """
+    Coleta spans no formato Trace Event do Chrome (eventos "X" com início e duração em µs,
+    uma faixa por thread). O arquivo gerado abre em chrome://tracing, https://ui.perfetto.dev
+    ou speedscope, e mostra lado a lado leitura da planilha, requisições e lotes de escrita —
+    onde o pipeline fica serial e onde há espera.
+    """
+
+    def __init__(self, caminho: str):
+        self.caminho = caminho
+        self.pid = os.getpid()
+        self._inicio_ns = time.perf_counter_ns()
+        self._eventos: List[Dict[str, Any]] = []
+        self._threads: set = set()
+        self._lock = threading.Lock()
+
+    def agora(self) -> int:
+        """Instante atual (ns desde o início do rastro), para `registrar`."""
+        return time.perf_counter_ns() - self._inicio_ns
+
+    def registrar(self, nome: str, categoria: str, inicio: int, fim: int, args: Optional[Dict[str, Any]] = None) -> None:
+        """Registra um span já medido (`inicio`/`fim` vindos de `agora`)."""
+        tid = threading.get_ident()
+        evento = {
+            "name": nome,
+            "cat": categoria,
+            "ph": "X",
+            "ts": inicio / 1000,
+            "dur": (fim - inicio) / 1000,
+            "pid": self.pid,
+            "tid": tid,
+        }
+        if args:
+            evento["args"] = args
+        with self._lock:
+            if tid not in self._threads:
+                self._threads.add(tid)
+                self._eventos.append({
+                    "name": "thread_name",
+                    "ph": "M",
+                    "pid": self.pid,
+                    "tid": tid,
+                    "args": {"name": threading.current_thread().name},
+                })
+            self._eventos.append(evento)
+
+    @contextmanager
+    def span(self, nome: str, categoria: str, **args: Any) -> Iterator[Dict[str, Any]]:
+        """Span do bloco; o dict devolvido aceita argumentos conhecidos só no fim (ex.: status)."""
+        inicio = self.agora()
+        try:
+            yield args
+        finally:
+            self.registrar(nome, categoria, inicio, self.agora(), args)
+
+    def salvar(self) -> str:
+        with self._lock:
+            eventos = list(self._eventos)
+        with open(self.caminho, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": eventos, "displayTimeUnit": "ms"}, f, default=str)
+        return self.caminho
+
+
+_rastro: Optional[Rastro] = None
+
+
+def ativar(caminho: str) -> Rastro:
+    """Liga a coleta de spans no processo; o arquivo é gravado ao sair (idempotente)."""
+    global _rastro
+    if _rastro is None:
+        _rastro = Rastro(caminho)
+        atexit.register(_rastro.salvar)
+    return _rastro
+
+
+def rastro() -> Optional[Rastro]:
+    """O rastro ativo, ou None: código quente testa isto antes de medir."""
+    return _rastro
+
+
+def span(nome: str, categoria: str = "etapa", **args: Any) -> ContextManager[Dict[str, Any]]:
+    """Span de um bloco; sem rastro ativo não custa nada."""
+    if _rastro is None:
+        return nullcontext({})
+    return _rastro.span(nome, categoria, **args)
+
+
+def iniciar_se_ativo() -> None:
+    """Scripts avulsos ativam com SUPABASE_TRACE=arquivo.json (o CLI usa --trace)."""
+    caminho = os.environ.get("SUPABASE_TRACE")
+    if caminho:
+        ativar(caminho)
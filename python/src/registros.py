@@ -0,0 +1,73 @@
+import sys
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, Iterator, Optional
+
+
+# Campos iguais para todos os contratos importados por planilha; só entram no
+# registro na hora de serializar (ver `ContratoLinha.to_dict`).
+CONTRATO_CONSTANTES: Dict[str, Any] = {
+    "anticipate_weekends": True,
+    "reference_period": None,
+    "installments": 1,
+    "stage_id": None,
+    "internal_notes": "IMPORTADO POR PLANILHA",
+    "billed": False,
+}
+
+# Totais zerados só na criação do contrato: depois quem os mantém é `recalcular_totais`
+# (src/totais.py), então updates e upserts da importação nunca os enviam
+CONTRATO_TOTAIS_INICIAIS: Dict[str, Any] = {
+    "total_amount": 0,
+    "total_discount": 0,
+    "total_tax": 0,
+}
+
+
+def _intern(value: Optional[str]) -> Optional[str]:
+    # status/billing_type têm poucos valores distintos: uma única cópia de cada texto
+    return sys.intern(value) if value is not None else None
+
+
+@dataclass(slots=True)
+class ContratoLinha:
+    """Contrato lido da planilha: guarda apenas os campos que variam por linha."""
+
+    customer_id: str
+    contract_number: str
+    status: str
+    initial_date: str
+    final_date: Optional[str]
+    billing_type: str
+    billing_day: int
+    description: Optional[str] = None
+
+    def __post_init__(self) -> None:
+        self.status = _intern(self.status)
+        self.billing_type = _intern(self.billing_type)
+
+    def to_dict(self, tenant_id: str, novo: bool = False) -> Dict[str, Any]:
+        """
+        Registro para a tabela contracts (constantes aplicadas aqui). Com `novo` (insert),
+        inclui os totais zerados; sem ele, o registro serve para update/upsert.
+        """
+        registro = {
+            "tenant_id": tenant_id,
+            "customer_id": self.customer_id,
+            "contract_number": self.contract_number,
+            "status": self.status,
+            "initial_date": self.initial_date,
+            "final_date": self.final_date,
+            "billing_type": self.billing_type,
+            "billing_day": self.billing_day,
+            "description": self.description,
+            **CONTRATO_CONSTANTES,
+        }
+        if novo:
+            registro.update(CONTRATO_TOTAIS_INICIAIS)
+        return registro
+
+
+def serializar(registros: Iterable[ContratoLinha], tenant_id: str, novos: bool = False) -> Iterator[Dict[str, Any]]:
+    """Gera os dicts de envio sob demanda, sem materializar a lista inteira."""
+    for r in registros:
+        yield r.to_dict(tenant_id, novo=novos)
@@ -1,6 +1,10 @@
 from typing import List, Dict, Any
 
 
+# Quantidade padrão de linhas cobertas pelas validações do template
+DEFAULT_ROWS = 5000
+
+
 def contrato_columns() -> List[Dict[str, Any]]:
     """
     Define o dicionário de colunas do template de contratos.
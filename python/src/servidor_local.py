@@ -0,0 +1,644 @@
+import json
+import random
+import re
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import date, datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from urllib.parse import parse_qsl, unquote, urlsplit
+
+from .registros import CONTRATO_CONSTANTES
+
+
+# Subconjunto das tabelas do Supabase usado pelos scripts: coluna -> tipo no SQLite.
+# BOOLEAN é convertido de/para true/false na fronteira HTTP.
+TABELAS: Dict[str, Dict[str, str]] = {
+    "customers": {
+        "id": "TEXT PRIMARY KEY",
+        "tenant_id": "TEXT",
+        "name": "TEXT",
+        "company": "TEXT",
+        "cpf_cnpj": "INTEGER",
+        "created_at": "TEXT",
+        "updated_at": "TEXT",
+    },
+    "services": {
+        "id": "TEXT PRIMARY KEY",
+        "tenant_id": "TEXT",
+        "name": "TEXT",
+        "default_price": "REAL",
+        "cost_price": "REAL",
+        "created_at": "TEXT",
+        "updated_at": "TEXT",
+    },
+    "contracts": {
+        "id": "TEXT PRIMARY KEY",
+        "tenant_id": "TEXT",
+        "customer_id": "TEXT",
+        "contract_number": "TEXT",
+        "status": "TEXT",
+        "initial_date": "TEXT",
+        "final_date": "TEXT",
+        "billing_type": "TEXT",
+        "billing_day": "INTEGER",
+        "description": "TEXT",
+        "anticipate_weekends": "BOOLEAN",
+        "reference_period": "TEXT",
+        "installments": "INTEGER",
+        "total_amount": "REAL",
+        "total_discount": "REAL",
+        "total_tax": "REAL",
+        "stage_id": "TEXT",
+        "internal_notes": "TEXT",
+        "billed": "BOOLEAN",
+        "created_at": "TEXT",
+        "updated_at": "TEXT",
+    },
+    "contract_services": {
+        "id": "TEXT PRIMARY KEY",
+        "contract_id": "TEXT NOT NULL",
+        "service_id": "TEXT NOT NULL",
+        "quantity": "REAL",
+        "unit_price": "REAL",
+        "discount_percentage": "REAL",
+        # colunas geradas, como no banco (contract_schema.md)
+        "discount_amount": "REAL GENERATED ALWAYS AS (round(unit_price * quantity * discount_percentage, 2)) STORED",
+        "total_amount": "REAL GENERATED ALWAYS AS (round(unit_price * quantity * (1 - discount_percentage), 2)) STORED",
+        "tax_rate": "REAL",
+        "tax_amount": "REAL GENERATED ALWAYS AS (round(unit_price * quantity * (1 - discount_percentage) * tax_rate / 100, 2)) STORED",
+        "description": "TEXT",
+        "is_active": "BOOLEAN",
+        "tenant_id": "TEXT",
+        "payment_method": "TEXT",
+        "card_type": "TEXT",
+        "billing_type": "TEXT",
+        "recurrence_frequency": "TEXT",
+        "installments": "INTEGER",
+        "payment_gateway": "TEXT",
+        "due_next_month": "BOOLEAN",
+        "no_charge": "BOOLEAN",
+        "generate_billing": "BOOLEAN",
+        "due_type": "TEXT",
+        "due_value": "INTEGER",
+        "cost_price": "REAL",
+        "created_at": "TEXT",
+        "updated_at": "TEXT",
+    },
+}
+
+# Restrições únicas além da chave primária (alvos válidos de on_conflict)
+UNICAS: Dict[str, List[Tuple[str, ...]]] = {
+    "contract_services": [("contract_id", "service_id")],
+}
+
+# Defaults aplicados na inserção quando a coluna não vem no registro
+PADROES: Dict[str, Dict[str, Any]] = {
+    "contract_services": {
+        "quantity": 1,
+        "discount_percentage": 0,
+        "tax_rate": 0,
+        "is_active": True,
+        "installments": 1,
+        "due_next_month": False,
+        "no_charge": False,
+        "generate_billing": True,
+        "due_type": "days_after_billing",
+        "due_value": 5,
+        "cost_price": 0,
+    },
+}
+
+# Parâmetros da URL que não são filtros
+PARAMETROS_RESERVADOS = {"select", "order", "limit", "offset", "on_conflict", "columns"}
+
+OPERADORES = {"eq": "=", "neq": "<>", "gt": ">", "gte": ">=", "lt": "<", "lte": "<="}
+
+# Linhas por resposta, como o max-rows padrão do Supabase
+MAX_LINHAS = 1000
+
+
+class ErroPostgrest(Exception):
+    """Erro devolvido no formato do PostgREST ({code, message, details, hint})."""
+
+    def __init__(self, status: int, code: str, message: str):
+        super().__init__(message)
+        self.status = status
+        self.code = code
+        self.message = message
+
+    def corpo(self) -> bytes:
+        return json.dumps({"code": self.code, "message": self.message, "details": None, "hint": None}).encode()
+
+
+def _agora() -> str:
+    return datetime.now().isoformat()
+
+
+def _separar_lista(texto: str) -> List[str]:
+    """'(a,"b,c",d)' -> ['a', 'b,c', 'd'] (valores com , : ( ) vêm entre aspas)."""
+    return [
+        a if a else b
+        for a, b in re.findall(r'"((?:[^"\\]|\\.)*)"|([^,]+)', texto.strip()[1:-1])
+    ]
+
+
+class BancoLocal:
+    """
+    Tabelas do `TABELAS` em um SQLite, com as operações do PostgREST que os scripts usam.
+    Uma conexão compartilhada protegida por lock: as requisições concorrentes disputam o
+    banco como disputariam o Postgres, e a latência injetada fica fora do lock.
+    """
+
+    def __init__(self, caminho: str = ":memory:"):
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(caminho, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=OFF")
+        for tabela, colunas in TABELAS.items():
+            definicao = ", ".join(f'"{c}" {t}' for c, t in colunas.items())
+            self.conn.execute(f'CREATE TABLE IF NOT EXISTS "{tabela}" ({definicao})')
+            for unica in UNICAS.get(tabela, ()):
+                nome = f"{tabela}_{'_'.join(unica)}_key"
+                cols = ", ".join(f'"{c}"' for c in unica)
+                self.conn.execute(f'CREATE UNIQUE INDEX IF NOT EXISTS "{nome}" ON "{tabela}" ({cols})')
+        # índices das colunas filtradas pelos scripts
+        for tabela, coluna in (
+            ("customers", "tenant_id"),
+            ("services", "tenant_id"),
+            ("contracts", "tenant_id"),
+            ("contracts", "contract_number"),
+        ):
+            self.conn.execute(f'CREATE INDEX IF NOT EXISTS "{tabela}_{coluna}_idx" ON "{tabela}" ("{coluna}")')
+
+    # --- conversões ---
+
+    def _colunas(self, tabela: str) -> Dict[str, str]:
+        if tabela not in TABELAS:
+            raise ErroPostgrest(404, "42P01", f'relation "public.{tabela}" does not exist')
+        return TABELAS[tabela]
+
+    def _coluna(self, tabela: str, coluna: str) -> str:
+        if coluna not in self._colunas(tabela):
+            raise ErroPostgrest(400, "42703", f"column {tabela}.{coluna} does not exist")
+        return f'"{coluna}"'
+
+    def _booleana(self, tabela: str, coluna: str) -> bool:
+        return TABELAS[tabela].get(coluna, "").startswith("BOOLEAN")
+
+    def _valor_filtro(self, tabela: str, coluna: str, valor: str) -> Any:
+        if self._booleana(tabela, coluna) and valor in ("true", "false"):
+            return 1 if valor == "true" else 0
+        return valor
+
+    def _saida(self, tabela: str, colunas: Sequence[str], linha: tuple) -> Dict[str, Any]:
+        return {
+            c: (bool(v) if v is not None and self._booleana(tabela, c) else v)
+            for c, v in zip(colunas, linha)
+        }
+
+    def _gravavel(self, tabela: str, coluna: str) -> bool:
+        tipo = self._colunas(tabela).get(coluna)
+        if tipo is None:
+            raise ErroPostgrest(400, "PGRST204", f"Could not find the '{coluna}' column of '{tabela}' in the schema cache")
+        return "GENERATED" not in tipo
+
+    # --- consultas ---
+
+    def _where(self, tabela: str, filtros: Sequence[Tuple[str, str]]) -> Tuple[str, List[Any]]:
+        partes: List[str] = []
+        params: List[Any] = []
+        for coluna, expressao in filtros:
+            col = self._coluna(tabela, coluna)
+            negar = expressao.startswith("not.")
+            if negar:
+                expressao = expressao[4:]
+            op, _, valor = expressao.partition(".")
+            if op == "in":
+                valores = [self._valor_filtro(tabela, coluna, v) for v in _separar_lista(valor)]
+                sql = f"{col} IN ({', '.join('?' * len(valores))})" if valores else "0"
+                params.extend(valores)
+            elif op == "is":
+                alvo = {"null": "NULL", "true": "1", "false": "0"}.get(valor.lower())
+                if alvo is None:
+                    raise ErroPostgrest(400, "PGRST100", f"invalid is value: {valor}")
+                sql = f"{col} IS {alvo}"
+            elif op == "like":  # curinga `*`, sensível a maiúsculas: o GLOB do SQLite
+                sql = f"{col} GLOB ?"
+                params.append(valor)
+            elif op == "ilike":
+                sql = f"{col} LIKE ?"
+                params.append(valor.replace("*", "%"))
+            elif op in OPERADORES:
+                sql = f"{col} {OPERADORES[op]} ?"
+                params.append(self._valor_filtro(tabela, coluna, valor))
+            else:
+                raise ErroPostgrest(400, "PGRST100", f"unsupported operator: {op}")
+            partes.append(f"NOT ({sql})" if negar else sql)
+        return (" WHERE " + " AND ".join(partes)) if partes else "", params
+
+    def _order(self, tabela: str, order: Optional[str]) -> str:
+        if not order:
+            return ""
+        termos = []
+        for termo in order.split(","):
+            coluna, *mods = termo.split(".")
+            sentido = "DESC" if "desc" in mods else "ASC"
+            nulos = " NULLS FIRST" if "nullsfirst" in mods else " NULLS LAST" if "nullslast" in mods else ""
+            termos.append(f"{self._coluna(tabela, coluna)} {sentido}{nulos}")
+        return " ORDER BY " + ", ".join(termos)
+
+    def selecionar(
+        self,
+        tabela: str,
+        select: str,
+        filtros: Sequence[Tuple[str, str]],
+        order: Optional[str],
+        inicio: int,
+        limite: Optional[int],
+        contar: bool,
+    ) -> Tuple[List[Dict[str, Any]], Optional[int]]:
+        """Linhas da página pedida e, com `contar`, o total que casa com os filtros."""
+        todas = list(self._colunas(tabela))
+        colunas = todas if select in ("", "*") else [c.strip() for c in select.split(",")]
+        if any("(" in c or ":" in c for c in colunas):
+            raise ErroPostgrest(400, "PGRST100", "embedded resources and aliases are not supported")
+        projecao = ", ".join(self._coluna(tabela, c) for c in colunas)
+        where, params = self._where(tabela, filtros)
+        limite = MAX_LINHAS if limite is None else min(limite, MAX_LINHAS)
+        sql = f'SELECT {projecao} FROM "{tabela}"{where}{self._order(tabela, order)} LIMIT ? OFFSET ?'
+        with self._lock:
+            linhas = self.conn.execute(sql, [*params, limite, inicio]).fetchall()
+            total = (
+                self.conn.execute(f'SELECT count(*) FROM "{tabela}"{where}', params).fetchone()[0]
+                if contar
+                else None
+            )
+        return [self._saida(tabela, colunas, l) for l in linhas], total
+
+    def _preparar(self, tabela: str, registro: Dict[str, Any]) -> Dict[str, Any]:
+        linha = {**PADROES.get(tabela, {}), **registro}
+        linha.setdefault("id", str(uuid.uuid4()))
+        agora = _agora()
+        for campo in ("created_at", "updated_at"):
+            if campo in TABELAS[tabela]:
+                linha.setdefault(campo, agora)
+        return {c: v for c, v in linha.items() if self._gravavel(tabela, c)}
+
+    def inserir(
+        self,
+        tabela: str,
+        registros: List[Dict[str, Any]],
+        on_conflict: Optional[str] = None,
+        resolucao: Optional[str] = None,
+        retornar: bool = False,
+    ) -> List[Dict[str, Any]]:
+        """
+        INSERT em uma transação; com `resolucao` ('merge-duplicates' ou 'ignore-duplicates')
+        vira upsert no alvo `on_conflict` (chave primária por padrão), atualizando só as
+        colunas enviadas, como o PostgREST.
+        """
+        self._colunas(tabela)
+        alvo = tuple(c.strip() for c in (on_conflict or "id").split(","))
+        if alvo != ("id",) and alvo not in UNICAS.get(tabela, []):
+            raise ErroPostgrest(400, "42P10", "there is no unique or exclusion constraint matching the ON CONFLICT specification")
+        todas = list(TABELAS[tabela])
+        saida: List[Dict[str, Any]] = []
+        with self._lock:
+            try:
+                self.conn.execute("BEGIN")
+                for registro in registros:
+                    enviados = set(registro)
+                    linha = self._preparar(tabela, registro)
+                    colunas = list(linha)
+                    sql = (
+                        f'INSERT INTO "{tabela}" ({", ".join(chr(34) + c + chr(34) for c in colunas)}) '
+                        f'VALUES ({", ".join("?" * len(colunas))})'
+                    )
+                    if resolucao:
+                        acao = "NOTHING"
+                        if resolucao == "merge-duplicates":
+                            atualizar = [c for c in colunas if c in enviados and c not in alvo and c != "created_at"]
+                            if atualizar:
+                                acao = "UPDATE SET " + ", ".join(f'"{c}" = excluded."{c}"' for c in atualizar)
+                        sql += f' ON CONFLICT ({", ".join(chr(34) + c + chr(34) for c in alvo)}) DO {acao}'
+                    if retornar:
+                        sql += " RETURNING " + ", ".join(f'"{c}"' for c in todas)
+                    cursor = self.conn.execute(sql, [self._valor_gravado(v) for v in linha.values()])
+                    if retornar:
+                        saida.extend(self._saida(tabela, todas, l) for l in cursor.fetchall())
+                self.conn.execute("COMMIT")
+            except sqlite3.IntegrityError as e:
+                self.conn.execute("ROLLBACK")
+                codigo = "23505" if "UNIQUE" in str(e) else "23502"
+                raise ErroPostgrest(409 if codigo == "23505" else 400, codigo, str(e))
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        return saida
+
+    @staticmethod
+    def _valor_gravado(valor: Any) -> Any:
+        if isinstance(valor, (dict, list)):
+            return json.dumps(valor)
+        if isinstance(valor, (date, datetime)):
+            return valor.isoformat()
+        return valor
+
+    def atualizar(
+        self,
+        tabela: str,
+        valores: Dict[str, Any],
+        filtros: Sequence[Tuple[str, str]],
+        retornar: bool = False,
+    ) -> List[Dict[str, Any]]:
+        # colunas e valores da mesma iteração filtrada: colunas geradas ficam fora dos dois
+        gravaveis = [(c, v) for c, v in valores.items() if self._gravavel(tabela, c)]
+        if not gravaveis:
+            return []
+        atribuicoes = ", ".join(f'"{c}" = ?' for c, _ in gravaveis)
+        where, params = self._where(tabela, filtros)
+        todas = list(TABELAS[tabela])
+        sql = f'UPDATE "{tabela}" SET {atribuicoes}{where}'
+        if retornar:
+            sql += " RETURNING " + ", ".join(f'"{c}"' for c in todas)
+        with self._lock:
+            cursor = self.conn.execute(sql, [*(self._valor_gravado(v) for _, v in gravaveis), *params])
+            linhas = cursor.fetchall() if retornar else []
+        return [self._saida(tabela, todas, l) for l in linhas]
+
+    def excluir(self, tabela: str, filtros: Sequence[Tuple[str, str]]) -> int:
+        self._colunas(tabela)
+        where, params = self._where(tabela, filtros)
+        with self._lock:
+            return self.conn.execute(f'DELETE FROM "{tabela}"{where}', params).rowcount
+
+    def contar(self, tabela: str) -> int:
+        self._colunas(tabela)
+        with self._lock:
+            return self.conn.execute(f'SELECT count(*) FROM "{tabela}"').fetchone()[0]
+
+
+def _uuid(rng: random.Random) -> str:
+    return str(uuid.UUID(int=rng.getrandbits(128), version=4))
+
+
+def semear(
+    banco: BancoLocal,
+    tenants: int = 1,
+    clientes: int = 1000,
+    servicos: int = 11,
+    vinculos_por_contrato: int = 3,
+    semente: int = 0,
+) -> Dict[str, Any]:
+    """
+    Popula o banco com dados sintéticos determinísticos (mesma `semente`, mesmos ids):
+    por tenant, `clientes` clientes com um contrato cada, `servicos` serviços no catálogo e
+    `vinculos_por_contrato` vínculos por contrato. Retorna {tenants: [...], contagens}.
+    """
+    rng = random.Random(semente)
+    ids_tenants = [_uuid(rng) for _ in range(tenants)]
+    hoje = date.today()
+    for t, tenant_id in enumerate(ids_tenants):
+        catalogo = [
+            {
+                "id": _uuid(rng),
+                "tenant_id": tenant_id,
+                "name": f"Serviço {s:02d}",
+                "default_price": 35.0,
+                "cost_price": round(rng.uniform(0, 20), 2),
+            }
+            for s in range(servicos)
+        ]
+        banco.inserir("services", catalogo)
+        clientes_tenant, contratos, vinculos = [], [], []
+        for c in range(clientes):
+            customer_id = _uuid(rng)
+            documento = 10_000_000_000 + t * clientes + c  # sem zeros à esquerda, como o bigint do banco
+            clientes_tenant.append({
+                "id": customer_id,
+                "tenant_id": tenant_id,
+                "name": f"Cliente {c}",
+                "company": f"Empresa {c} LTDA",
+                "cpf_cnpj": documento,
+            })
+            contrato_id = _uuid(rng)
+            inicio = hoje - timedelta(days=rng.randrange(0, 720))
+            contratos.append({
+                **CONTRATO_CONSTANTES,
+                "id": contrato_id,
+                "tenant_id": tenant_id,
+                "customer_id": customer_id,
+                "contract_number": str(100_000 + c),
+                "status": "ACTIVE",
+                "initial_date": inicio.isoformat(),
+                "final_date": (inicio + timedelta(days=365)).isoformat(),
+                "billing_type": "Mensal",
+                "billing_day": rng.randint(1, 28),
+            })
+            for servico in rng.sample(catalogo, min(vinculos_por_contrato, len(catalogo))):
+                vinculos.append({
+                    "contract_id": contrato_id,
+                    "service_id": servico["id"],
+                    "tenant_id": tenant_id,
+                    "quantity": rng.choice((1, 1, 1, 2, 3)),
+                    "unit_price": 35.0,
+                    "generate_billing": False,
+                    "payment_method": "Boleto",
+                    "billing_type": "Único",
+                    "recurrence_frequency": "Mensal",
+                })
+        banco.inserir("customers", clientes_tenant)
+        banco.inserir("contracts", contratos)
+        banco.inserir("contract_services", vinculos)
+    return {"tenants": ids_tenants, **{t: banco.contar(t) for t in TABELAS}}
+
+
+class ServidorLocal:
+    """
+    Servidor HTTP compatível com o subconjunto do PostgREST usado pelos scripts
+    (`/rest/v1/<tabela>` com select/filtros eq, neq, gt, gte, lt, lte, in, is, like/ilike,
+    order, limit/offset ou Range, Prefer count=exact, insert/upsert com on_conflict,
+    PATCH e DELETE), sobre um `BancoLocal`.
+
+    Para testes de carga, cada requisição espera `latencia` ± `variacao` segundos e, com
+    probabilidade `taxa_erro`, responde `status_erro` sem tocar no banco. Os atributos
+    podem ser alterados com o servidor rodando.
+    """
+
+    def __init__(
+        self,
+        banco: Optional[BancoLocal] = None,
+        host: str = "127.0.0.1",
+        porta: int = 0,
+        latencia: float = 0.0,
+        variacao: float = 0.0,
+        taxa_erro: float = 0.0,
+        status_erro: int = 503,
+        semente: Optional[int] = None,
+    ):
+        self.banco = banco or BancoLocal()
+        self.latencia = latencia
+        self.variacao = variacao
+        self.taxa_erro = taxa_erro
+        self.status_erro = status_erro
+        self.requisicoes = 0
+        self.erros_injetados = 0
+        self._rng = random.Random(semente)
+        self._lock = threading.Lock()
+        self._http = ThreadingHTTPServer((host, porta), _handler(self))
+        self._http.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, porta = self._http.server_address[:2]
+        return f"http://{host}:{porta}"
+
+    def _sortear(self) -> Tuple[float, bool]:
+        with self._lock:
+            self.requisicoes += 1
+            espera = max(0.0, self.latencia + self._rng.uniform(-self.variacao, self.variacao))
+            falhar = self._rng.random() < self.taxa_erro
+            self.erros_injetados += falhar
+        return espera, falhar
+
+    def iniciar(self) -> "ServidorLocal":
+        self._thread = threading.Thread(target=self._http.serve_forever, name="postgrest-local", daemon=True)
+        self._thread.start()
+        return self
+
+    def servir(self) -> None:
+        """Atende em primeiro plano até Ctrl+C."""
+        try:
+            self._http.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self._http.server_close()
+
+    def parar(self) -> None:
+        self._http.shutdown()
+        self._http.server_close()
+        if self._thread:
+            self._thread.join()
+
+    def __enter__(self) -> "ServidorLocal":
+        return self.iniciar()
+
+    def __exit__(self, *exc) -> None:
+        self.parar()
+
+
+def _handler(servidor: ServidorLocal):
+    banco = servidor.banco
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args) -> None:  # silencioso: o volume de requisições é alto
+            pass
+
+        def _responder(self, status: int, corpo: bytes = b"", cabecalhos: Optional[Dict[str, str]] = None) -> None:
+            self.send_response(status)
+            for nome, valor in (cabecalhos or {}).items():
+                self.send_header(nome, valor)
+            if corpo or status != 204:
+                self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(corpo)))
+            self.end_headers()
+            if corpo and self.command != "HEAD":
+                self.wfile.write(corpo)
+
+        def _ler_corpo(self, bruto: bytes) -> Any:
+            if self.headers.get("Content-Encoding") == "gzip":
+                import gzip
+
+                bruto = gzip.decompress(bruto)
+            try:
+                return json.loads(bruto) if bruto else None
+            except ValueError:
+                raise ErroPostgrest(400, "PGRST102", "Empty or invalid json")
+
+        def _despachar(self) -> None:
+            # o corpo é consumido antes de qualquer erro, para a conexão keep-alive seguir utilizável
+            tamanho = int(self.headers.get("Content-Length") or 0)
+            bruto = self.rfile.read(tamanho) if tamanho else b""
+            espera, falhar = servidor._sortear()
+            if espera:
+                time.sleep(espera)
+            partes = urlsplit(self.path)
+            caminho = unquote(partes.path)
+            if not caminho.startswith("/rest/v1/"):
+                raise ErroPostgrest(404, "PGRST125", f"Invalid path specified in request URL: {caminho}")
+            if falhar:
+                raise ErroPostgrest(servidor.status_erro, "PGRST000", "erro injetado pelo servidor local")
+            tabela = caminho[len("/rest/v1/"):].strip("/")
+            params = parse_qsl(partes.query, keep_blank_values=True)
+            especiais = {k: v for k, v in params if k in PARAMETROS_RESERVADOS}
+            filtros = [(k, v) for k, v in params if k not in PARAMETROS_RESERVADOS]
+            prefer = {
+                chave.strip(): valor.strip()
+                for item in self.headers.get("Prefer", "").split(",")
+                if item.strip()
+                for chave, _, valor in [item.partition("=")]
+            }
+            retornar = prefer.get("return") == "representation"
+
+            if self.command in ("GET", "HEAD"):
+                inicio = int(especiais.get("offset", 0))
+                limite = int(especiais["limit"]) if "limit" in especiais else None
+                intervalo = self.headers.get("Range")
+                if intervalo and "-" in intervalo:
+                    a, _, b = intervalo.partition("-")
+                    inicio = int(a)
+                    if b:
+                        limite = int(b) - inicio + 1 if limite is None else min(limite, int(b) - inicio + 1)
+                linhas, total = banco.selecionar(
+                    tabela,
+                    especiais.get("select", "*"),
+                    filtros,
+                    especiais.get("order"),
+                    inicio,
+                    limite,
+                    prefer.get("count") == "exact",
+                )
+                faixa = f"{inicio}-{inicio + len(linhas) - 1}" if linhas else "*"
+                self._responder(
+                    206 if total is not None and total > inicio + len(linhas) else 200,
+                    json.dumps(linhas).encode(),
+                    {"Content-Range": f"{faixa}/{'*' if total is None else total}"},
+                )
+            elif self.command == "POST":
+                corpo = self._ler_corpo(bruto)
+                registros = corpo if isinstance(corpo, list) else [corpo or {}]
+                linhas = banco.inserir(
+                    tabela,
+                    registros,
+                    on_conflict=especiais.get("on_conflict"),
+                    resolucao=prefer.get("resolution"),
+                    retornar=retornar,
+                )
+                self._responder(201, json.dumps(linhas).encode() if retornar else b"")
+            elif self.command == "PATCH":
+                linhas = banco.atualizar(tabela, self._ler_corpo(bruto) or {}, filtros, retornar=retornar)
+                self._responder(200 if retornar else 204, json.dumps(linhas).encode() if retornar else b"")
+            elif self.command == "DELETE":
+                banco.excluir(tabela, filtros)
+                self._responder(200 if retornar else 204, b"[]" if retornar else b"")
+            else:
+                raise ErroPostgrest(405, "PGRST117", f"Unsupported HTTP method: {self.command}")
+
+        def _tratar(self) -> None:
+            try:
+                self._despachar()
+            except ErroPostgrest as e:
+                self._responder(e.status, e.corpo())
+            except (ValueError, sqlite3.Error) as e:
+                self._responder(400, ErroPostgrest(400, "PGRST100", str(e)).corpo())
+
+        do_GET = do_HEAD = do_POST = do_PATCH = do_DELETE = _tratar
+
+    return Handler
@@ -0,0 +1,135 @@
+import csv
+import hashlib
+import os
+import re
+import sys
+from pathlib import Path
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence
+
+
+# Critérios de divisão: número do contrato (ou id, na planilha de vínculos) ou documento do cliente
+NUMERO = "numero"
+CNPJ = "cnpj"
+CRITERIOS = (NUMERO, CNPJ)
+
+_NAO_DIGITOS = re.compile(r"\D+")
+_SUFIXO = re.compile(r"\.shard(\d+)de(\d+)$")
+
+
+class Shard(NamedTuple):
+    """Fatia `indice` (1..total) das linhas, escolhida pelo hash da chave de cada linha."""
+
+    indice: int
+    total: int
+
+    def contem(self, chave: str) -> bool:
+        return indice_shard(chave, self.total) == self.indice
+
+    def __str__(self) -> str:
+        return f"{self.indice}/{self.total}"
+
+
+def parse_shard(texto: str) -> Shard:
+    """'2/4' -> Shard(2, 4); levanta ValueError se o formato ou o índice forem inválidos."""
+    m = re.fullmatch(r"\s*(\d+)\s*/\s*(\d+)\s*", texto or "")
+    if not m:
+        raise ValueError(f"shard deve ter o formato i/N (ex.: 2/4), recebido: {texto!r}")
+    indice, total = int(m.group(1)), int(m.group(2))
+    if total < 1 or not 1 <= indice <= total:
+        raise ValueError(f"shard {texto!r}: o índice deve estar entre 1 e N")
+    return Shard(indice, total)
+
+
+def chave_shard(valor: Any, por: str = NUMERO) -> str:
+    """
+    Chave normalizada da linha: o mesmo contrato gera a mesma chave em qualquer nó,
+    venha a célula como texto, inteiro ou float (123.0) e o documento com ou sem máscara.
+    """
+    if valor is None:
+        return ""
+    if isinstance(valor, float) and valor.is_integer():
+        valor = int(valor)
+    if por == CNPJ:
+        # como em map_customer_ids: sem máscara e sem zeros à esquerda (cpf_cnpj é bigint no banco)
+        return _NAO_DIGITOS.sub("", str(valor)).lstrip("0")
+    return str(valor).strip()
+
+
+def indice_shard(chave: str, total: int) -> int:
+    """Shard (1..total) da chave. Usa blake2b, estável entre processos (o `hash` do Python não é)."""
+    h = hashlib.blake2b(chave.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(h, "big") % total + 1
+
+
+def shard_do_ambiente() -> Optional[Shard]:
+    """Scripts avulsos: `--shard i/N` na linha de comando ou SUPABASE_SHARD=i/N."""
+    args = sys.argv[1:]
+    for i, arg in enumerate(args):
+        if arg == "--shard" and i + 1 < len(args):
+            return parse_shard(args[i + 1])
+        if arg.startswith("--shard="):
+            return parse_shard(arg.split("=", 1)[1])
+    texto = os.environ.get("SUPABASE_SHARD")
+    return parse_shard(texto) if texto else None
+
+
+def caminho_do_shard(caminho: str, shard: Optional[Shard]) -> str:
+    """'erros.csv' -> 'erros.shard2de4.csv': relatórios de nós diferentes não se sobrescrevem."""
+    if shard is None:
+        return caminho
+    p = Path(caminho)
+    return str(p.with_name(f"{p.stem}.shard{shard.indice}de{shard.total}{p.suffix}"))
+
+
+def mesclar_relatorios(arquivos: Sequence[str], saida: str) -> Dict[str, Any]:
+    """
+    Junta os relatórios CSV dos shards (mesmo cabeçalho) em `saida`, sem linhas repetidas.
+    Retorna {linhas, por_arquivo, faltando}; `faltando` lista os shards i/N esperados pelos
+    nomes dos arquivos (ver `caminho_do_shard`) que não apareceram.
+    """
+    cabecalho: Optional[List[str]] = None
+    vistos = set()
+    por_arquivo: Dict[str, int] = {}
+    presentes: Dict[int, set] = {}
+    with open(saida, "w", newline="", encoding="utf-8") as out:
+        w = csv.writer(out)
+        for arquivo in arquivos:
+            m = _SUFIXO.search(Path(arquivo).stem)
+            if m:
+                presentes.setdefault(int(m.group(2)), set()).add(int(m.group(1)))
+            with open(arquivo, newline="", encoding="utf-8") as f:
+                r = csv.reader(f)
+                atual = next(r, None)
+                if atual is None:
+                    por_arquivo[arquivo] = 0
+                    continue
+                if cabecalho is None:
+                    cabecalho = atual
+                    w.writerow(cabecalho)
+                elif atual != cabecalho:
+                    raise ValueError(f"{arquivo}: cabeçalho {atual} difere de {cabecalho}")
+                n = 0
+                for linha in r:
+                    t = tuple(linha)
+                    if t in vistos:
+                        continue
+                    vistos.add(t)
+                    w.writerow(linha)
+                    n += 1
+                por_arquivo[arquivo] = n
+    faltando: List[str] = [
+        f"{i}/{total}" for total, indices in sorted(presentes.items()) for i in range(1, total + 1) if i not in indices
+    ]
+    return {"linhas": len(vistos), "por_arquivo": por_arquivo, "faltando": faltando}
+
+
+def salvar_erros(caminho: str, erros: Sequence[str], shard: Optional[Shard] = None) -> str:
+    """Relatório de erros de validação (um por linha), no caminho do shard."""
+    destino = caminho_do_shard(caminho, shard)
+    with open(destino, "w", newline="", encoding="utf-8") as f:
+        w = csv.writer(f)
+        w.writerow(["shard", "erro"])
+        for e in erros:
+            w.writerow([str(shard) if shard else "", e])
+    return destino
+
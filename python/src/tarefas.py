@@ -0,0 +1,441 @@
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+
+# Tipos de tarefa (pipelines que podem ser divididos em shards)
+IMPORTAR = "importar"   # contratos (formato de import_contracts_from_excel.py), por hash do número do contrato
+VINCULAR = "vincular"   # contract_services (formato de link_contracts_services_corrigido.py), por intervalo
+TOTAIS = "totais"       # recálculo dos totais (src/totais.py), um shard por tenant
+TIPOS = (IMPORTAR, VINCULAR, TOTAIS)
+
+# Estados de uma tarefa
+PENDENTE = "pendente"
+EM_ANDAMENTO = "em_andamento"
+CONCLUIDA = "concluida"
+FALHA = "falha"  # esgotou as tentativas; volta para a fila com `reenfileirar_falhas`
+
+LEASE_PADRAO_S = 60.0
+MAX_TENTATIVAS = 3
+LINHAS_POR_SHARD = 2000
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tarefas (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    job TEXT NOT NULL,
+    shard INTEGER NOT NULL,
+    tipo TEXT NOT NULL,
+    parametros TEXT NOT NULL,
+    estado TEXT NOT NULL DEFAULT 'pendente',
+    dono TEXT,
+    lease_ate REAL,
+    tentativas INTEGER NOT NULL DEFAULT 0,
+    max_tentativas INTEGER NOT NULL,
+    resultado TEXT,
+    ultimo_erro TEXT,
+    criado_em REAL NOT NULL,
+    concluido_em REAL,
+    UNIQUE (job, shard)
+);
+CREATE INDEX IF NOT EXISTS tarefas_estado_id ON tarefas (estado, id);
+"""
+
+
+class Tarefa:
+    __slots__ = ("id", "job", "shard", "tipo", "parametros", "tentativas", "dono")
+
+    def __init__(self, id: int, job: str, shard: int, tipo: str, parametros: str, tentativas: int, dono: str):
+        self.id = id
+        self.job = job
+        self.shard = shard
+        self.tipo = tipo
+        self.parametros: Dict[str, Any] = json.loads(parametros)
+        self.tentativas = tentativas
+        self.dono = dono
+
+
+class FilaTarefas:
+    """
+    Fila durável de tarefas em SQLite, com leases.
+
+    Um job é dividido em shards (fatias da planilha ou tenants), um por linha da tabela.
+    Cada worker reivindica o próximo shard livre com um único UPDATE
+    atômico, que grava o dono e o prazo do lease (`lease_ate`); enquanto processa, o
+    worker renova o lease. Um shard cujo lease venceu (worker morto ou travado) volta a
+    ser reivindicável, até `max_tentativas`.
+
+    A conclusão só é aceita do dono atual na mesma tentativa (`tentativas` funciona como
+    token): um worker que perdeu o lease não sobrescreve o resultado de quem assumiu.
+    Assim cada shard é concluído uma única vez. Reprocessar um shard interrompido também não
+    duplica linhas: vínculos são gravados com upsert em (contract_id, service_id), que tem
+    constraint única no banco; contratos não têm essa garantia em (tenant_id,
+    contract_number), então a importação divide as linhas pelo hash do número
+    (`shards_por_numero`): só um shard pode inserir cada número, e ao reprocessar ele
+    encontra os contratos já inseridos e os atualiza.
+
+    O arquivo pode ser compartilhado por vários processos da mesma máquina (WAL).
+    """
+
+    def __init__(self, caminho: str = "tarefas.sqlite3"):
+        self.caminho = caminho
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(caminho, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def __enter__(self) -> "FilaTarefas":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    # -- criação ------------------------------------------------------------------
+
+    def criar_job(
+        self,
+        tipo: str,
+        shards: Sequence[Dict[str, Any]],
+        job: Optional[str] = None,
+        max_tentativas: int = MAX_TENTATIVAS,
+    ) -> str:
+        """Enfileira um shard por item de `shards`; repetir com o mesmo `job` não duplica."""
+        if tipo not in TIPOS:
+            raise ValueError(f"tipo deve ser um de: {', '.join(TIPOS)}")
+        job = job or uuid.uuid4().hex[:12]
+        agora = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO tarefas (job, shard, tipo, parametros, max_tentativas, criado_em) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    [
+                        (job, i, tipo, json.dumps(p, sort_keys=True), max_tentativas, agora)
+                        for i, p in enumerate(shards)
+                    ],
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return job
+
+    # -- ciclo de vida de um shard ------------------------------------------------
+
+    def reivindicar(self, dono: str, lease: float = LEASE_PADRAO_S) -> Optional[Tarefa]:
+        """Próximo shard pendente (ou com lease vencido) para `dono`, ou None."""
+        agora = time.time()
+        with self._lock:
+            # última tentativa com lease vencido: não volta mais à fila
+            self._conn.execute(
+                "UPDATE tarefas SET estado = ?, ultimo_erro = 'lease vencido', lease_ate = NULL "
+                "WHERE estado = ? AND lease_ate < ? AND tentativas >= max_tentativas",
+                (FALHA, EM_ANDAMENTO, agora),
+            )
+            # fetchall: a instrução precisa terminar para liberar o lock de escrita
+            linhas = self._conn.execute(
+                "UPDATE tarefas SET estado = ?, dono = ?, lease_ate = ?, tentativas = tentativas + 1 "
+                "WHERE id = ("
+                "  SELECT id FROM tarefas"
+                "  WHERE (estado = ? OR (estado = ? AND lease_ate < ?)) AND tentativas < max_tentativas"
+                "  ORDER BY id LIMIT 1"
+                ") RETURNING id, job, shard, tipo, parametros, tentativas",
+                (EM_ANDAMENTO, dono, agora + lease, PENDENTE, EM_ANDAMENTO, agora),
+            ).fetchall()
+        return Tarefa(*linhas[0], dono) if linhas else None
+
+    def renovar(self, tarefa: Tarefa, lease: float = LEASE_PADRAO_S) -> bool:
+        """Estende o lease; False se o shard já foi assumido por outro worker."""
+        with self._lock:
+            cur = self._conn.execute(
+                "UPDATE tarefas SET lease_ate = ? WHERE id = ? AND dono = ? AND tentativas = ? AND estado = ?",
+                (time.time() + lease, tarefa.id, tarefa.dono, tarefa.tentativas, EM_ANDAMENTO),
+            )
+        return cur.rowcount == 1
+
+    def concluir(self, tarefa: Tarefa, resultado: Dict[str, Any]) -> bool:
+        with self._lock:
+            cur = self._conn.execute(
+                "UPDATE tarefas SET estado = ?, resultado = ?, ultimo_erro = NULL, lease_ate = NULL, concluido_em = ? "
+                "WHERE id = ? AND dono = ? AND tentativas = ? AND estado = ?",
+                (CONCLUIDA, json.dumps(resultado, default=str), time.time(),
+                 tarefa.id, tarefa.dono, tarefa.tentativas, EM_ANDAMENTO),
+            )
+        return cur.rowcount == 1
+
+    def falhar(self, tarefa: Tarefa, erro: str) -> None:
+        """Devolve o shard à fila, ou o marca como falha se esgotou as tentativas."""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE tarefas SET estado = CASE WHEN tentativas >= max_tentativas THEN ? ELSE ? END, "
+                "ultimo_erro = ?, lease_ate = NULL "
+                "WHERE id = ? AND dono = ? AND tentativas = ? AND estado = ?",
+                (FALHA, PENDENTE, erro[:1000], tarefa.id, tarefa.dono, tarefa.tentativas, EM_ANDAMENTO),
+            )
+
+    # -- consultas ----------------------------------------------------------------
+
+    def ha_trabalho(self) -> bool:
+        """Há shards pendentes ou em andamento (que ainda podem voltar à fila)."""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT 1 FROM tarefas WHERE estado IN (?, ?) LIMIT 1", (PENDENTE, EM_ANDAMENTO)
+            ).fetchone() is not None
+
+    def contar(self, job: Optional[str] = None) -> Dict[str, Dict[str, int]]:
+        """job -> {estado: quantidade}."""
+        sql = "SELECT job, estado, COUNT(*) FROM tarefas"
+        params: tuple = ()
+        if job:
+            sql += " WHERE job = ?"
+            params = (job,)
+        with self._lock:
+            linhas = self._conn.execute(sql + " GROUP BY job, estado ORDER BY job", params).fetchall()
+        contagem: Dict[str, Dict[str, int]] = {}
+        for j, estado, qtd in linhas:
+            contagem.setdefault(j, {})[estado] = qtd
+        return contagem
+
+    def resultados(self, job: str) -> Dict[str, Any]:
+        """Soma dos campos numéricos dos resultados dos shards concluídos do job."""
+        with self._lock:
+            linhas = self._conn.execute(
+                "SELECT resultado FROM tarefas WHERE job = ? AND estado = ?", (job, CONCLUIDA)
+            ).fetchall()
+        total: Dict[str, Any] = {}
+        for (resultado,) in linhas:
+            for chave, valor in json.loads(resultado or "{}").items():
+                if isinstance(valor, (int, float)):
+                    total[chave] = total.get(chave, 0) + valor
+        return total
+
+    def falhas(self) -> List[tuple]:
+        """(job, shard, tentativas, último erro) dos shards em falha."""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT job, shard, tentativas, ultimo_erro FROM tarefas WHERE estado = ? ORDER BY id", (FALHA,)
+            ).fetchall()
+
+    def reenfileirar_falhas(self) -> int:
+        with self._lock:
+            cur = self._conn.execute(
+                "UPDATE tarefas SET estado = ?, tentativas = 0, dono = NULL WHERE estado = ?", (PENDENTE, FALHA)
+            )
+        return cur.rowcount
+
+
+# -- divisão em shards ---------------------------------------------------------------
+
+
+def contar_linhas(arquivo: str) -> int:
+    """Última linha da aba ativa (dimensão gravada pelo Excel; conta as linhas se faltar)."""
+    from openpyxl import load_workbook
+
+    wb = load_workbook(arquivo, read_only=True)
+    try:
+        ws = wb.active
+        if ws.max_row:
+            return ws.max_row
+        return sum(1 for _ in ws.iter_rows(values_only=True))
+    finally:
+        wb.close()
+
+
+def shards_por_linhas(
+    arquivo: str,
+    primeira_linha: int,
+    linhas_por_shard: int = LINHAS_POR_SHARD,
+    **extras: Any,
+) -> List[Dict[str, Any]]:
+    """Intervalos [inicio, fim] de linhas da planilha (fim inclusive), com `extras` em cada shard."""
+    ultima = contar_linhas(arquivo)
+    arquivo = str(Path(arquivo).resolve())  # workers podem rodar em outra pasta
+    return [
+        {"arquivo": arquivo, "inicio": inicio, "fim": min(inicio + linhas_por_shard - 1, ultima), **extras}
+        for inicio in range(primeira_linha, ultima + 1, linhas_por_shard)
+    ]
+
+
+def shards_por_numero(
+    arquivo: str,
+    primeira_linha: int,
+    linhas_por_shard: int = LINHAS_POR_SHARD,
+    **extras: Any,
+) -> List[Dict[str, Any]]:
+    """
+    Fatias i/N da planilha pelo hash do número do contrato (`src.shards`), com N para dar
+    cerca de `linhas_por_shard` linhas por shard. Cada shard lê o arquivo inteiro e pula
+    as linhas de outras fatias; linhas repetidas de um contrato sempre caem no mesmo shard.
+    """
+    ultima = contar_linhas(arquivo)
+    total = max(1, -(-(ultima - primeira_linha + 1) // linhas_por_shard))
+    arquivo = str(Path(arquivo).resolve())
+    return [
+        {"arquivo": arquivo, "inicio": primeira_linha, "fim": ultima, "shard": f"{i}/{total}", **extras}
+        for i in range(1, total + 1)
+    ]
+
+
+def shards_por_tenant(tenants: Sequence[str]) -> List[Dict[str, Any]]:
+    return [{"tenant": t} for t in dict.fromkeys(tenants)]
+
+
+# -- processamento -------------------------------------------------------------------
+
+
+def _importar(client, p: Dict[str, Any]) -> Dict[str, Any]:
+    from import_contracts_from_excel import TENANT_ID_DEFAULT, gravar_contratos, read_rows
+
+    from .shards import parse_shard
+
+    # jobs antigos (intervalos de linhas) não têm "shard"
+    fatia = parse_shard(p["shard"]) if p.get("shard") else None
+    registros, erros = read_rows(Path(p["arquivo"]), min_row=p["inicio"], max_row=p["fim"], shard=fatia)
+    _, atualizados, novos = gravar_contratos(client, registros, p.get("tenant") or TENANT_ID_DEFAULT)
+    return {"linhas": len(registros), "erros_leitura": len(erros), "atualizados": atualizados, "inseridos": novos}
+
+
+def _vincular(client, p: Dict[str, Any]) -> Dict[str, Any]:
+    from openpyxl import load_workbook
+
+    from import_contract_services import parse_service_value
+    from link_contracts_services_corrigido import CAMPOS_ATUALIZADOS, CONTRACT_ID_COL, COST_COL, build_link_record
+
+    from .catalogo import servico_por_id, servicos_da_planilha
+    from .planilha import iter_projetado
+    from .vinculos import buscar_tenants_contratos, gravar_vinculos
+
+    wb = load_workbook(p["arquivo"], read_only=True)
+    try:
+        ws = wb.active
+        mapeamento = servicos_da_planilha(ws)
+        colunas = [CONTRACT_ID_COL, COST_COL] + list(mapeamento)
+        linhas = [
+            (str(valores[0]), valores[1], valores[2:])
+            for _, valores in iter_projetado(ws, colunas, min_row=max(p["inicio"], 3), max_row=p["fim"])
+            if valores[0]
+        ]
+    finally:
+        wb.close()
+
+    tenants = buscar_tenants_contratos(client, (contract_id for contract_id, _, _ in linhas))
+    infos = list(mapeamento.values())
+    vinculos = []
+    ignorados = 0
+    for contract_id, custo, valores in linhas:
+        tenant_id = tenants.get(contract_id)
+        if not tenant_id:
+            ignorados += 1
+            continue
+        for info, valor in zip(infos, valores):
+            if parse_service_value(valor) <= 0:
+                continue
+            servico = servico_por_id(client, tenant_id, info["id"])
+            if servico:
+                vinculos.append(build_link_record(contract_id, tenant_id, {"id": info["id"], "value": valor}, servico, custo))
+    gravados = gravar_vinculos(client, vinculos, campos_atualizaveis=CAMPOS_ATUALIZADOS)["registros"] if vinculos else 0
+    return {"linhas": len(linhas), "contratos_ausentes": ignorados, "vinculos": gravados}
+
+
+def _totais(client, p: Dict[str, Any]) -> Dict[str, Any]:
+    from .totais import recalcular_totais
+
+    return recalcular_totais(client, tenant_id=p["tenant"])
+
+
+PROCESSADORES: Dict[str, Callable[[Any, Dict[str, Any]], Dict[str, Any]]] = {
+    IMPORTAR: _importar,
+    VINCULAR: _vincular,
+    TOTAIS: _totais,
+}
+
+
+def processar_tarefa(tarefa: Tarefa) -> Dict[str, Any]:
+    """Executa o shard com o cliente Supabase do processo (conexões reaproveitadas entre shards)."""
+    from .config import get_supabase_client
+
+    return PROCESSADORES[tarefa.tipo](get_supabase_client(), tarefa.parametros)
+
+
+class _Renovador:
+    """Renova o lease em segundo plano enquanto o shard é processado."""
+
+    def __init__(self, fila: FilaTarefas, tarefa: Tarefa, lease: float):
+        self._parar = threading.Event()
+        self._thread = threading.Thread(target=self._loop, args=(fila, tarefa, lease), daemon=True)
+
+    def _loop(self, fila: FilaTarefas, tarefa: Tarefa, lease: float) -> None:
+        while not self._parar.wait(lease / 3):
+            if not fila.renovar(tarefa, lease):
+                return
+
+    def __enter__(self) -> "_Renovador":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._parar.set()
+        self._thread.join()
+
+
+def trabalhar(
+    caminho: str,
+    dono: Optional[str] = None,
+    lease: float = LEASE_PADRAO_S,
+    ocioso: float = 1.0,
+    processar: Callable[[Tarefa], Dict[str, Any]] = processar_tarefa,
+) -> Dict[str, Any]:
+    """
+    Loop de um worker: reivindica e processa shards até a fila esvaziar (shards de outros
+    workers ainda em andamento são aguardados, pois podem voltar à fila se o lease vencer).
+    Retorna {dono, concluidas, falhas, descartadas}.
+    """
+    dono = dono or f"{socket.gethostname()}:{os.getpid()}"
+    resumo = {"dono": dono, "concluidas": 0, "falhas": 0, "descartadas": 0}
+    with FilaTarefas(caminho) as fila:
+        while True:
+            tarefa = fila.reivindicar(dono, lease)
+            if tarefa is None:
+                if not fila.ha_trabalho():
+                    return resumo
+                time.sleep(ocioso)
+                continue
+            try:
+                with _Renovador(fila, tarefa, lease):
+                    resultado = processar(tarefa)
+            except Exception as e:
+                fila.falhar(tarefa, f"{type(e).__name__}: {e}")
+                resumo["falhas"] += 1
+                continue
+            if fila.concluir(tarefa, resultado):
+                resumo["concluidas"] += 1
+            else:  # lease perdido: outro worker assumiu o shard
+                resumo["descartadas"] += 1
+
+
+def executar_workers(caminho: str, workers: int, lease: float = LEASE_PADRAO_S) -> List[Dict[str, Any]]:
+    """
+    Sobe `workers` processos (spawn) rodando `trabalhar` na mesma fila. Cada processo tem
+    seu próprio cliente HTTP e limitador AIMD: a vazão cresce com o número de workers até
+    o limite de requisições da API. Mais workers podem ser iniciados em outros terminais
+    com `tarefas trabalhar` apontando para o mesmo arquivo.
+    """
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+
+    if workers == 1:
+        return [trabalhar(caminho, lease=lease)]
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        futuros = [pool.submit(trabalhar, caminho, None, lease) for _ in range(workers)]
+        return [f.result() for f in futuros]
@@ -0,0 +1,142 @@
+from collections import defaultdict
+from decimal import ROUND_HALF_UP, Decimal
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from .concorrencia import mapear_paralelo
+from .escrita import DEFAULT_BATCH_SIZE, EscritorLote
+from .paginacao import paginar_keyset
+from .vinculos import IDS_POR_CONSULTA, TABELA_VINCULOS
+
+
+CONTRACTS_TABLE = "contracts"
+CAMPOS_TOTAIS = ("total_amount", "total_discount", "total_tax")
+# Só o id e os totais: a gravação é um upsert desses três campos, sem reenviar o resto do contrato
+COLUNAS_CONTRATO_TOTAIS = ",".join(("id",) + CAMPOS_TOTAIS)
+COLUNAS_VINCULO_TOTAIS = "id,contract_id,quantity,unit_price,discount_percentage,tax_rate,is_active"
+
+_CENTAVO = Decimal("0.01")
+_ZERO = Decimal("0")
+_CEM = Decimal("100")
+
+
+@lru_cache(maxsize=8192)  # preços/quantidades/percentuais se repetem muito entre vínculos
+def _dec(valor: Any) -> Decimal:
+    if valor is None or valor == "":
+        return _ZERO
+    return Decimal(str(valor))
+
+
+def _round2(valor: Decimal) -> Decimal:
+    # round(numeric, 2) do Postgres arredonda metades para longe do zero
+    return valor.quantize(_CENTAVO, rounding=ROUND_HALF_UP)
+
+
+def totais_vinculo(vinculo: Dict[str, Any]) -> Tuple[Decimal, Decimal, Decimal]:
+    """
+    (total_amount, discount_amount, tax_amount) de um vínculo, como as colunas geradas
+    de contract_services (contract_schema.md):
+
+    - discount_amount = round(unit_price * quantity * discount_percentage, 2)
+    - total_amount    = round(unit_price * quantity - unit_price * quantity * discount_percentage, 2)
+    - tax_amount      = round((unit_price * quantity - desconto) * (tax_rate / 100), 2)
+    """
+    bruto = _dec(vinculo.get("unit_price")) * _dec(vinculo.get("quantity", 1))
+    desconto = bruto * _dec(vinculo.get("discount_percentage"))
+    liquido = bruto - desconto
+    return _round2(liquido), _round2(desconto), _round2(liquido * (_dec(vinculo.get("tax_rate")) / _CEM))
+
+
+def agregar_totais(vinculos: Iterable[Dict[str, Any]]) -> Dict[str, Dict[str, Decimal]]:
+    """
+    Soma, por contrato, total/desconto/imposto dos vínculos ativos (agregação em dict,
+    uma passada). Retorna {contract_id: {total_amount, total_discount, total_tax}}.
+    """
+    totais: Dict[str, List[Decimal]] = defaultdict(lambda: [_ZERO, _ZERO, _ZERO])
+    for v in vinculos:
+        if v.get("is_active") is False:
+            continue
+        total, desconto, imposto = totais_vinculo(v)
+        acc = totais[str(v["contract_id"])]
+        acc[0] += total
+        acc[1] += desconto
+        acc[2] += imposto
+    return {
+        contrato: {"total_amount": t, "total_discount": d, "total_tax": i}
+        for contrato, (t, d, i) in totais.items()
+    }
+
+
+def _buscar_em_blocos(client, tabela: str, colunas: str, coluna_filtro: str, ids: List[str]) -> List[Dict[str, Any]]:
+    blocos = [ids[i:i + IDS_POR_CONSULTA] for i in range(0, len(ids), IDS_POR_CONSULTA)]
+
+    def _buscar(bloco: List[str]) -> List[Dict[str, Any]]:
+        return [r for pagina in paginar_keyset(client, tabela, colunas, filtros=[(coluna_filtro, bloco)]) for r in pagina]
+
+    return [r for linhas in mapear_paralelo(_buscar, blocos) for r in linhas]
+
+
+def contratos_com_totais_alterados(
+    contratos: Iterable[Dict[str, Any]],
+    totais: Dict[str, Dict[str, Decimal]],
+) -> List[Dict[str, Any]]:
+    """
+    {id, total_amount, total_discount, total_tax} recalculados, apenas dos contratos cujo
+    valor gravado difere. Contratos sem vínculo ativo ficam com 0.
+    """
+    zerado = {campo: _ZERO for campo in CAMPOS_TOTAIS}
+    alterados: List[Dict[str, Any]] = []
+    for c in contratos:
+        novos = totais.get(str(c["id"]), zerado)
+        if all(_dec(c.get(campo)) == valor for campo, valor in novos.items()):
+            continue
+        alterados.append({"id": c["id"], **{campo: float(valor) for campo, valor in novos.items()}})
+    return alterados
+
+
+def gravar_totais(client, alterados: List[Dict[str, Any]], tamanho_lote: int = DEFAULT_BATCH_SIZE) -> int:
+    """
+    Grava os totais com upsert em lote em `id`, só com o id e os três totais: as demais
+    colunas do contrato não são reenviadas, então edições concorrentes não são
+    sobrescritas. Lotes de `tamanho_lote` registros, divididos e repetidos pelo
+    `AgendadorEscrita` em erros transitórios. Retorna quantos contratos foram gravados.
+    """
+    escritor = EscritorLote(client, CONTRACTS_TABLE, operacao="upsert", on_conflict="id", tamanho_lote=tamanho_lote)
+    return escritor.escrever(alterados)["registros"]
+
+
+def recalcular_totais(
+    client,
+    contract_ids: Optional[Iterable[Any]] = None,
+    tenant_id: Optional[str] = None,
+    dry_run: bool = False,
+    tamanho_lote: int = DEFAULT_BATCH_SIZE,
+) -> Dict[str, int]:
+    """
+    Recalcula total_amount/total_discount/total_tax dos contratos a partir dos vínculos
+    e grava só os totais dos alterados (`gravar_totais`, em lotes de `tamanho_lote`, em vez
+    de uma requisição por contrato).
+
+    Os contratos vêm de `contract_ids` ou, se omitido, de todo o `tenant_id`.
+    Retorna {contratos, vinculos, alterados, gravados}.
+    """
+    colunas = COLUNAS_CONTRATO_TOTAIS
+    if contract_ids is not None:
+        ids = sorted({str(c) for c in contract_ids if c})
+        contratos = _buscar_em_blocos(client, CONTRACTS_TABLE, colunas, "id", ids)
+    elif tenant_id:
+        contratos = [
+            c for pagina in paginar_keyset(client, CONTRACTS_TABLE, colunas, filtros=[("tenant_id", tenant_id)])
+            for c in pagina
+        ]
+    else:
+        raise ValueError("informe contract_ids ou tenant_id")
+
+    ids = [str(c["id"]) for c in contratos]
+    vinculos = _buscar_em_blocos(client, TABELA_VINCULOS, COLUNAS_VINCULO_TOTAIS, "contract_id", ids)
+    alterados = contratos_com_totais_alterados(contratos, agregar_totais(vinculos))
+
+    resumo = {"contratos": len(contratos), "vinculos": len(vinculos), "alterados": len(alterados), "gravados": 0}
+    if alterados and not dry_run:
+        resumo["gravados"] = gravar_totais(client, alterados, tamanho_lote)
+    return resumo
@@ -0,0 +1,83 @@
+import time
+from typing import Optional
+from urllib.parse import unquote
+
+import httpx
+
+from . import perfil
+from .concorrencia import LIMITADOR, LimitadorAIMD
+from .rastreamento import rastro
+
+
+# Respostas que indicam sobrecarga do servidor e devem reduzir a concorrência
+STATUS_SOBRECARGA = {429, 500, 502, 503, 504}
+
+
+def nome_endpoint(request: httpx.Request) -> str:
+    """'GET /rest/v1/contracts?...' -> 'GET contracts' (agrupa sem filtros/ids)."""
+    caminho = unquote(request.url.path)
+    if "/rest/v1/" in caminho:
+        caminho = caminho.split("/rest/v1/", 1)[1]
+    return f"{request.method} {caminho.strip('/') or '/'}"
+
+
+class TransporteLimitado(httpx.BaseTransport):
+    """
+    Transporte httpx que passa toda requisição pelo `LimitadorAIMD` e registra
+    latência/erros por endpoint em `perfil`. Envolve outro transporte (por padrão o
+    HTTP com pool de conexões), então vale para qualquer cliente que o use.
+    """
+
+    def __init__(
+        self,
+        transporte: Optional[httpx.BaseTransport] = None,
+        limitador: LimitadorAIMD = LIMITADOR,
+    ):
+        self.transporte = transporte or httpx.HTTPTransport(retries=0)
+        self.limitador = limitador
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        endpoint = nome_endpoint(request)
+        tamanho = int(request.headers.get("content-length") or 0)
+        r = rastro()
+        if r is not None:
+            espera_inicio = r.agora()
+        self.limitador.adquirir()
+        if r is not None:
+            req_inicio = r.agora()
+            if req_inicio - espera_inicio >= 100_000:  # só esperas de 0,1 ms ou mais pela vaga
+                r.registrar("aguardando vaga", "limitador", espera_inicio, req_inicio)
+        inicio = time.perf_counter()
+        erro = True
+        status = None
+        try:
+            resposta = self.transporte.handle_request(request)
+            # lê o corpo aqui para que a latência medida inclua a transferência
+            resposta.read()
+            status = resposta.status_code
+            erro = status in STATUS_SOBRECARGA
+            return resposta
+        finally:
+            latencia = time.perf_counter() - inicio
+            self.limitador.liberar(latencia, erro)
+            perfil.registrar_requisicao(endpoint, latencia, erro, tamanho)
+            if r is not None:
+                r.registrar(endpoint, "http", req_inicio, r.agora(), {"status": status, "bytes_enviados": tamanho})
+
+    def close(self) -> None:
+        self.transporte.close()
+
+
+def criar_http_client(timeout: float = 120.0, limitador: LimitadorAIMD = LIMITADOR) -> httpx.Client:
+    """
+    Cliente httpx com limite de concorrência AIMD e estatísticas por endpoint. Com
+    SUPABASE_CASSETE o tráfego é gravado ou reproduzido de um cassete (ver src/cassete.py).
+    """
+    from .cassete import transporte_do_ambiente
+
+    max_conexoes = max(1, int(limitador.maximo))
+    transporte = transporte_do_ambiente(httpx.HTTPTransport(
+        retries=0,
+        limits=httpx.Limits(max_connections=max_conexoes, max_keepalive_connections=max_conexoes),
+    ))
+    return httpx.Client(transport=TransporteLimitado(transporte, limitador), timeout=timeout)
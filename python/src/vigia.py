@@ -0,0 +1,399 @@
+import dataclasses
+import fnmatch
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from .rastreamento import span
+
+
+# Planilhas vigiadas por padrão (arquivos temporários do Excel, `~$...`, são ignorados)
+PADRAO = "contratos*.xlsx"
+
+# Estados de um arquivo no estado do vigia
+OK = "ok"
+ERRO = "erro"
+
+# Arquivo com erro é reprocessado depois deste intervalo mesmo sem mudar (falha de rede, etc.)
+RETENTAR_ERRO_S = 300.0
+
+# Caches de clientes e catálogo são recarregados depois deste intervalo
+TTL_CACHE_S = 600.0
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS arquivos (
+    caminho TEXT PRIMARY KEY,
+    hash TEXT NOT NULL,
+    estado TEXT NOT NULL,
+    resumo TEXT,
+    processado_em REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS linhas (
+    caminho TEXT NOT NULL,
+    chave TEXT NOT NULL,
+    hash TEXT NOT NULL,
+    PRIMARY KEY (caminho, chave)
+);
+"""
+
+
+def hash_arquivo(caminho: Path, bloco: int = 1 << 20) -> str:
+    """SHA-256 do conteúdo: salvar a planilha sem mudanças não dispara nova importação."""
+    h = hashlib.sha256()
+    with open(caminho, "rb") as f:
+        for parte in iter(lambda: f.read(bloco), b""):
+            h.update(parte)
+    return h.hexdigest()
+
+
+def hash_linha(contrato, servicos: Tuple[Any, ...] = ()) -> str:
+    """Hash do contrato lido (`ContratoLinha`) mais as células de serviço/custo da mesma linha."""
+    dados = [dataclasses.astuple(contrato), list(servicos)]
+    return hashlib.sha256(json.dumps(dados, default=str).encode("utf-8")).hexdigest()[:32]
+
+
+class EstadoVigia:
+    """
+    Estado persistente do vigia (SQLite): hash do último conteúdo processado de cada
+    planilha e o hash de cada linha importada, para que uma planilha alterada envie só
+    as linhas que mudaram (importação delta). Reiniciar o vigia não reimporta nada.
+    """
+
+    def __init__(self, caminho: str = ".watch.sqlite3"):
+        self.caminho = caminho
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(caminho, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def __enter__(self) -> "EstadoVigia":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def pendente(self, caminho: str, hash_atual: str, agora: Optional[float] = None) -> bool:
+        """Conteúdo novo/alterado, ou com erro há mais de `RETENTAR_ERRO_S`."""
+        with self._lock:
+            linha = self._conn.execute(
+                "SELECT hash, estado, processado_em FROM arquivos WHERE caminho = ?", (caminho,)
+            ).fetchone()
+        if linha is None or linha[0] != hash_atual:
+            return True
+        return linha[1] == ERRO and (agora or time.time()) - linha[2] >= RETENTAR_ERRO_S
+
+    def hashes_linhas(self, caminho: str) -> Dict[str, str]:
+        with self._lock:
+            return dict(self._conn.execute("SELECT chave, hash FROM linhas WHERE caminho = ?", (caminho,)))
+
+    def registrar(
+        self,
+        caminho: str,
+        hash_arquivo: str,
+        estado: str,
+        resumo: Dict[str, Any],
+        linhas: Optional[Dict[str, str]] = None,
+    ) -> None:
+        """Grava o resultado; com `linhas`, substitui os hashes de linha do arquivo."""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute(
+                    "INSERT INTO arquivos (caminho, hash, estado, resumo, processado_em) VALUES (?, ?, ?, ?, ?) "
+                    "ON CONFLICT (caminho) DO UPDATE SET hash = excluded.hash, estado = excluded.estado, "
+                    "resumo = excluded.resumo, processado_em = excluded.processado_em",
+                    (caminho, hash_arquivo, estado, json.dumps(resumo, default=str), time.time()),
+                )
+                if linhas is not None:
+                    self._conn.execute("DELETE FROM linhas WHERE caminho = ?", (caminho,))
+                    self._conn.executemany(
+                        "INSERT INTO linhas (caminho, chave, hash) VALUES (?, ?, ?)",
+                        ((caminho, chave, h) for chave, h in linhas.items()),
+                    )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def arquivos(self) -> List[Tuple[str, str, Dict[str, Any]]]:
+        """(caminho, estado, resumo) de todos os arquivos já processados."""
+        with self._lock:
+            linhas = self._conn.execute("SELECT caminho, estado, resumo FROM arquivos ORDER BY caminho").fetchall()
+        return [(c, e, json.loads(r or "{}")) for c, e, r in linhas]
+
+
+class CachesQuentes:
+    """
+    O que uma execução avulsa dos scripts paga a cada planilha e o vigia paga uma vez:
+    cliente Supabase (pool de conexões e limitador compartilhados), índice de clientes
+    por documento e catálogo de serviços do tenant. Os dois últimos são recarregados
+    depois de `ttl` segundos; as threads do pool compartilham a mesma cópia.
+    """
+
+    def __init__(self, tenant_id: str, ttl: float = TTL_CACHE_S, client=None):
+        self.tenant_id = tenant_id
+        self.ttl = ttl
+        self._client = client
+        self._lock = threading.Lock()
+        self._clientes: Optional[Dict[str, Dict[str, Any]]] = None
+        self._clientes_em = 0.0
+        self._catalogo_em: Optional[float] = None
+
+    @property
+    def client(self):
+        with self._lock:
+            if self._client is None:
+                from .config import get_supabase_client
+
+                self._client = get_supabase_client()
+            return self._client
+
+    def clientes(self) -> Dict[str, Dict[str, Any]]:
+        """Mapa documento -> cliente do tenant (ver `map_customer_ids.fetch_customers_map`)."""
+        client = self.client
+        with self._lock:
+            if self._clientes is None or time.monotonic() - self._clientes_em >= self.ttl:
+                from map_customer_ids import fetch_customers_map
+
+                with span("carregar clientes", "cache"):
+                    self._clientes = fetch_customers_map(client, tenant_id=self.tenant_id)
+                self._clientes_em = time.monotonic()
+            return self._clientes
+
+    def servico(self, service_id: str) -> Optional[Dict[str, Any]]:
+        """Serviço do catálogo do tenant (cache de src/catalogo.py, renovado a cada `ttl`)."""
+        from .catalogo import carregar_servicos, servico_por_id
+
+        client = self.client
+        with self._lock:
+            if self._catalogo_em is None or time.monotonic() - self._catalogo_em >= self.ttl:
+                with span("carregar catálogo", "cache"):
+                    carregar_servicos(client, self.tenant_id, refresh=True)
+                self._catalogo_em = time.monotonic()
+        return servico_por_id(client, self.tenant_id, service_id)
+
+
+def _ler_servicos(caminho: Path) -> Tuple[Dict[int, Dict[str, Any]], Dict[str, Tuple[Tuple[Any, ...], Any]]]:
+    """
+    Colunas de serviço (IDs na linha 2, como no template por tenant) e, por número de
+    contrato, os valores dessas colunas e o Custo. Sem IDs na linha 2 não há vínculos.
+    """
+    from openpyxl import load_workbook
+
+    from import_contracts_from_excel import SYNONYMS, _build_row_mapper, _norm_header
+
+    from .catalogo import servicos_da_planilha
+    from .planilha import iter_projetado, ler_cabecalho
+
+    wb = load_workbook(caminho, data_only=True, read_only=True)
+    try:
+        ws = wb.active
+        mapeamento = servicos_da_planilha(ws)
+        if not mapeamento:
+            return {}, {}
+        idx = _build_row_mapper(ler_cabecalho(ws))
+        col_numero = next((idx[_norm_header(s)] for s in SYNONYMS["codge"] if _norm_header(s) in idx), None)
+        if col_numero is None:
+            return mapeamento, {}
+        col_custo = idx.get("custo")
+        colunas = [col_numero] + list(mapeamento) + ([col_custo] if col_custo else [])
+        por_contrato: Dict[str, Tuple[Tuple[Any, ...], Any]] = {}
+        for _, valores in iter_projetado(ws, colunas, min_row=3):
+            if valores[0] is None:
+                continue
+            servicos = valores[1:1 + len(mapeamento)]
+            custo = valores[-1] if col_custo else None
+            por_contrato[str(valores[0])] = (servicos, custo)
+        return mapeamento, por_contrato
+    finally:
+        wb.close()
+
+
+def processar_planilha(
+    caminho: Path,
+    caches: CachesQuentes,
+    estado: EstadoVigia,
+    hash_conteudo: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    Importa uma planilha de contratos e vincula seus serviços, enviando só as linhas cujo
+    conteúdo (contrato, células de serviço e custo) mudou desde a última importação do
+    mesmo arquivo. Linhas removidas da planilha não são apagadas do banco (use a
+    reconciliação de link_contracts_services_corrigido.py para isso).
+
+    Contratos já existentes (tenant, contract_number) são atualizados pelo id; os novos,
+    inseridos. Os vínculos usam o upsert por (contract_id, service_id) de src/vinculos.py.
+    `hash_conteudo` é o hash visto ao enfileirar: se o arquivo mudar durante o
+    processamento, a próxima varredura o processa de novo.
+    Retorna o resumo; levanta ErroEscrita se a gravação falhar (nada é marcado como feito).
+    """
+    from import_contracts_from_excel import gravar_contratos, read_rows
+    from import_contract_services import parse_service_value
+    from link_contracts_services_corrigido import CAMPOS_ATUALIZADOS, build_link_record
+
+    from .vinculos import gravar_vinculos
+
+    tenant_id = caches.tenant_id
+    mapeamento, servicos = _ler_servicos(caminho)
+    registros, erros = read_rows(caminho, min_row=3 if mapeamento else 2, clientes=caches.clientes())
+
+    chave = str(caminho)
+    anteriores = estado.hashes_linhas(chave)
+    por_numero = {r.contract_number: r for r in registros}  # número repetido: vale a última linha
+    hashes = {n: hash_linha(r, servicos.get(n, ())) for n, r in por_numero.items()}
+    alterados = [r for n, r in por_numero.items() if anteriores.get(n) != hashes[n]]
+    resumo: Dict[str, Any] = {
+        "linhas": len(registros),
+        "alterados": len(alterados),
+        "erros_leitura": len(erros),
+        "contratos_atualizados": 0,
+        "contratos_novos": 0,
+        "vinculos": 0,
+        "servicos_desconhecidos": 0,
+    }
+    if erros:
+        resumo["exemplos_erros"] = erros[:5]
+
+    client = caches.client
+    if alterados:
+        existentes, atualizados, novos = gravar_contratos(client, alterados, tenant_id)
+        resumo["contratos_atualizados"] = atualizados
+        resumo["contratos_novos"] = novos
+
+        vinculos = []
+        colunas = list(mapeamento.values())
+        for r in alterados:
+            contract_id = existentes.get(r.contract_number)
+            valores, custo = servicos.get(r.contract_number, ((), None))
+            if not contract_id:
+                continue
+            for info, valor in zip(colunas, valores):
+                if parse_service_value(valor) <= 0:
+                    continue
+                servico = caches.servico(info["id"])
+                if not servico:
+                    resumo["servicos_desconhecidos"] += 1
+                    continue
+                vinculos.append(build_link_record(contract_id, tenant_id, {"id": info["id"], "value": valor}, servico, custo))
+        if vinculos:
+            resumo["vinculos"] = gravar_vinculos(client, vinculos, campos_atualizaveis=CAMPOS_ATUALIZADOS)["registros"]
+
+    estado.registrar(chave, hash_conteudo or hash_arquivo(caminho), OK, resumo, linhas=hashes)
+    return resumo
+
+
+class Vigia:
+    """
+    Vigia uma pasta e processa as planilhas novas ou alteradas em um pool limitado de
+    threads, com os caches quentes compartilhados entre os arquivos.
+
+    A cada `intervalo` segundos a pasta é listada; um arquivo só entra na fila quando
+    tamanho e data de modificação se repetem entre duas varreduras (não pega uma
+    planilha ainda sendo copiada) e o hash do conteúdo difere do último processado.
+    O mesmo arquivo nunca é processado por duas threads ao mesmo tempo: se mudar durante
+    o processamento, é reprocessado na varredura seguinte.
+    """
+
+    def __init__(
+        self,
+        pasta: str,
+        estado: EstadoVigia,
+        caches: CachesQuentes,
+        padrao: str = PADRAO,
+        workers: int = 2,
+        intervalo: float = 5.0,
+        processar: Callable[..., Dict[str, Any]] = processar_planilha,
+        avisar: Callable[[str], None] = print,
+    ):
+        self.pasta = Path(pasta)
+        self.estado = estado
+        self.caches = caches
+        self.padrao = padrao
+        self.workers = workers
+        self.intervalo = intervalo
+        self.processar = processar
+        self.avisar = avisar
+        self._vistos: Dict[Path, Tuple[int, int]] = {}
+        self._hashes: Dict[Path, Tuple[Tuple[int, int], str]] = {}
+        self._em_andamento: Dict[Path, Future] = {}
+        self._lock = threading.Lock()
+
+    def _candidatos(self) -> List[Path]:
+        return sorted(
+            p for p in self.pasta.iterdir()
+            if p.is_file() and fnmatch.fnmatch(p.name, self.padrao) and not p.name.startswith("~$")
+        )
+
+    def varrer(self, esperar_estavel: bool = True) -> List[Tuple[Path, str]]:
+        """(arquivo, hash) das planilhas prontas para processar nesta varredura."""
+        prontos = []
+        for p in self._candidatos():
+            try:
+                st = p.stat()
+            except FileNotFoundError:
+                continue
+            assinatura = (st.st_mtime_ns, st.st_size)
+            anterior = self._vistos.get(p)
+            self._vistos[p] = assinatura
+            if esperar_estavel and anterior != assinatura:
+                continue
+            with self._lock:
+                if p in self._em_andamento:
+                    continue
+            # o hash só é recalculado quando tamanho/data mudam
+            cache = self._hashes.get(p)
+            if cache and cache[0] == assinatura:
+                h = cache[1]
+            else:
+                h = hash_arquivo(p)
+                self._hashes[p] = (assinatura, h)
+            if self.estado.pendente(str(p), h):
+                prontos.append((p, h))
+        return prontos
+
+    def _executar(self, caminho: Path, h: str) -> None:
+        inicio = time.perf_counter()
+        try:
+            with span(f"watch {caminho.name}", "watch"):
+                resumo = self.processar(caminho, self.caches, self.estado, h)
+            self.avisar(f"✅ {caminho.name}: {resumo} ({time.perf_counter() - inicio:.1f}s)")
+        except Exception as e:
+            self.estado.registrar(str(caminho), h, ERRO, {"erro": str(e)[:500]})
+            self.avisar(f"❌ {caminho.name}: {e}")
+        finally:
+            with self._lock:
+                self._em_andamento.pop(caminho, None)
+
+    def _enfileirar(self, pool: ThreadPoolExecutor, prontos: List[Tuple[Path, str]]) -> None:
+        for p, h in prontos:
+            with self._lock:
+                if p in self._em_andamento:
+                    continue
+                self.avisar(f"📥 {p.name} na fila ({h[:12]})")
+                self._em_andamento[p] = pool.submit(self._executar, p, h)
+
+    def executar(self, parar: Optional[threading.Event] = None, uma_vez: bool = False) -> None:
+        """
+        Loop principal, até `parar` ser sinalizado (ou Ctrl+C). Com `uma_vez`, processa o
+        que já está na pasta (sem esperar estabilizar) e retorna.
+        """
+        parar = parar or threading.Event()
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="watch") as pool:
+            if uma_vez:
+                self._enfileirar(pool, self.varrer(esperar_estavel=False))
+                return
+            try:
+                while not parar.is_set():
+                    self._enfileirar(pool, self.varrer())
+                    parar.wait(self.intervalo)
+            except KeyboardInterrupt:
+                self.avisar("⏹️  Encerrando: aguardando as planilhas em processamento...")
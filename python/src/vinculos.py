@@ -0,0 +1,228 @@
+import csv
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from .concorrencia import mapear_paralelo
+from .escrita import DEFAULT_BATCH_SIZE, AgendadorEscrita, EscritorLote
+from .paginacao import paginar_keyset
+
+
+TABELA_VINCULOS = "contract_services"
+# Chave natural do vínculo (constraint contract_services_contract_id_service_id_key)
+CHAVE_VINCULO = ("contract_id", "service_id")
+ON_CONFLICT_VINCULO = ",".join(CHAVE_VINCULO)
+
+# Ids por requisição `in.(...)`: mantém a URL bem abaixo dos limites de proxy
+IDS_POR_CONSULTA = 200
+
+
+def deduplicar_vinculos(vinculos: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Um registro por (contract_id, service_id), mantendo o último visto. O Postgres recusa
+    um upsert em lote que atualize a mesma linha duas vezes.
+    """
+    por_chave: Dict[tuple, Dict[str, Any]] = {}
+    for v in vinculos:
+        por_chave[(v["contract_id"], v["service_id"])] = v
+    return list(por_chave.values())
+
+
+def gravar_vinculos(
+    client,
+    vinculos: Iterable[Dict[str, Any]],
+    tamanho_lote: int = DEFAULT_BATCH_SIZE,
+    outbox=None,
+    campos_atualizaveis: Optional[Sequence[str]] = None,
+) -> Dict[str, int]:
+    """
+    Grava os vínculos com upsert em lote pela chave natural (contract_id, service_id):
+    reexecuções e workers paralelos escrevendo o mesmo vínculo atualizam a mesma linha,
+    sem duplicar.
+
+    Com `campos_atualizaveis`, os vínculos que já existem recebem só esses campos (além
+    da chave) e apenas os novos vão com o registro completo: configurações editadas
+    depois da criação (is_active, due_type, ...) não voltam ao padrão da planilha.
+    Sem ele, o registro inteiro é gravado sem consultar antes o que existe.
+
+    Os registros não devem trazer `id` nem `created_at` (o banco preenche na inserção).
+    Com `outbox`, os upserts só são enfileirados. Retorna o resumo do `EscritorLote`
+    somado dos dois grupos (ou {registros, enfileirados}).
+    """
+    unicos = deduplicar_vinculos(vinculos)
+    if campos_atualizaveis is None:
+        grupos = [unicos]
+    else:
+        existentes = {
+            (str(v["contract_id"]), str(v["service_id"]))
+            for v in buscar_vinculos(client, {v["contract_id"] for v in unicos})
+        }
+        colunas = (*CHAVE_VINCULO, *campos_atualizaveis)
+        # lotes homogêneos: o PostgREST exige as mesmas chaves em todos os objetos de um lote
+        grupos = [
+            [
+                {c: v[c] for c in colunas if c in v}
+                for v in unicos
+                if (str(v["contract_id"]), str(v["service_id"])) in existentes
+            ],
+            [v for v in unicos if (str(v["contract_id"]), str(v["service_id"])) not in existentes],
+        ]
+    if outbox is not None:
+        novos = sum(
+            outbox.enfileirar_varios(TABELA_VINCULOS, "upsert", grupo, on_conflict=ON_CONFLICT_VINCULO)
+            for grupo in grupos
+        )
+        return {"registros": len(unicos), "enfileirados": novos}
+    escritor = EscritorLote(
+        client,
+        TABELA_VINCULOS,
+        operacao="upsert",
+        on_conflict=ON_CONFLICT_VINCULO,
+        tamanho_lote=tamanho_lote,
+    )
+    resumo = {"lotes": 0, "registros": 0, "bytes_json": 0, "bytes_enviados": 0}
+    for grupo in grupos:
+        for chave, valor in escritor.escrever(grupo).items():
+            resumo[chave] = resumo.get(chave, 0) + valor
+    return resumo
+
+
+def buscar_tenants_contratos(client, contract_ids: Iterable[Any]) -> Dict[str, Optional[str]]:
+    """
+    Mapa contract_id -> tenant_id dos contratos existentes, com consultas `in` em blocos
+    de `IDS_POR_CONSULTA` executadas em paralelo. Ids ausentes do mapa não existem no banco.
+    """
+    ids = sorted({str(c) for c in contract_ids if c})
+    blocos = [ids[i:i + IDS_POR_CONSULTA] for i in range(0, len(ids), IDS_POR_CONSULTA)]
+
+    def _buscar(bloco: List[str]) -> List[Dict[str, Any]]:
+        return client.table("contracts").select("id,tenant_id").in_("id", bloco).execute().data or []
+
+    tenants: Dict[str, Optional[str]] = {}
+    for linhas in mapear_paralelo(_buscar, blocos):
+        for linha in linhas:
+            tenants[linha["id"]] = linha["tenant_id"]
+    return tenants
+
+
+def buscar_ids_contratos(client, tenant_id: str, numeros: Iterable[Any]) -> Dict[str, str]:
+    """
+    Mapa contract_number -> id dos contratos do tenant, com consultas `in` em blocos
+    paralelos. Números ausentes do mapa ainda não existem no banco.
+    """
+    nums = sorted({str(n) for n in numeros if n})
+    blocos = [nums[i:i + IDS_POR_CONSULTA] for i in range(0, len(nums), IDS_POR_CONSULTA)]
+
+    def _buscar(bloco: List[str]) -> List[Dict[str, Any]]:
+        return (
+            client.table("contracts")
+            .select("id,contract_number")
+            .eq("tenant_id", tenant_id)
+            .in_("contract_number", bloco)
+            .execute()
+            .data
+            or []
+        )
+
+    return {
+        str(linha["contract_number"]): linha["id"]
+        for linhas in mapear_paralelo(_buscar, blocos)
+        for linha in linhas
+    }
+
+
+# Modos de reconciliação dos vínculos que a planilha não implica mais
+DESATIVAR = "desativar"  # is_active = false (mantém histórico)
+EXCLUIR = "excluir"      # DELETE
+
+
+def buscar_vinculos(client, contract_ids: Iterable[Any]) -> List[Dict[str, Any]]:
+    """
+    Vínculos existentes ({id, contract_id, service_id, is_active}) dos contratos, em blocos
+    `in` paralelos (cada bloco paginado por id: um contrato pode ter vários vínculos).
+    """
+    ids = sorted({str(c) for c in contract_ids if c})
+    blocos = [ids[i:i + IDS_POR_CONSULTA] for i in range(0, len(ids), IDS_POR_CONSULTA)]
+
+    def _buscar(bloco: List[str]) -> List[Dict[str, Any]]:
+        paginas = paginar_keyset(
+            client,
+            TABELA_VINCULOS,
+            "id,contract_id,service_id,is_active",
+            filtros=[("contract_id", bloco)],
+        )
+        return [v for pagina in paginas for v in pagina]
+
+    return [v for linhas in mapear_paralelo(_buscar, blocos) for v in linhas]
+
+
+def diferenca_vinculos(
+    esperados: Dict[str, Set[str]],
+    existentes: Iterable[Dict[str, Any]],
+    servicos_planilha: Set[str],
+) -> Tuple[List[Dict[str, Any]], List[Tuple[str, str]]]:
+    """
+    Compara, por contrato, os vínculos que a planilha implica com os do banco.
+    Retorna (excedentes, faltantes):
+
+    - excedentes: vínculos ativos no banco que a planilha não marca mais — só de serviços
+      que são colunas da planilha (`servicos_planilha`); os demais ela não descreve;
+    - faltantes: pares (contract_id, service_id) marcados na planilha sem vínculo ativo.
+    """
+    ativos: Dict[str, Set[str]] = {}
+    excedentes: List[Dict[str, Any]] = []
+    for v in existentes:
+        if v.get("is_active") is False:
+            continue
+        contrato = str(v["contract_id"])
+        ativos.setdefault(contrato, set()).add(v["service_id"])
+        if (
+            contrato in esperados
+            and v["service_id"] in servicos_planilha
+            and v["service_id"] not in esperados[contrato]
+        ):
+            excedentes.append(v)
+    faltantes = [
+        (contrato, servico)
+        for contrato, servicos in esperados.items()
+        for servico in sorted(servicos - ativos.get(contrato, set()))
+    ]
+    return excedentes, faltantes
+
+
+def remover_vinculos(client, ids: Iterable[str], modo: str = DESATIVAR) -> int:
+    """
+    Desativa ou exclui os vínculos pelos ids com poucas instruções em lote
+    (`id=in.(...)`, `IDS_POR_CONSULTA` por requisição). Retorna quantos ids foram enviados.
+    """
+    if modo not in (DESATIVAR, EXCLUIR):
+        raise ValueError(f"modo deve ser '{DESATIVAR}' ou '{EXCLUIR}'")
+    ids = list(ids)
+    agendador = AgendadorEscrita(tamanho_inicial=IDS_POR_CONSULTA, tamanho_maximo=IDS_POR_CONSULTA)
+    agora = datetime.now().isoformat()
+
+    def _enviar(bloco: List[str]) -> None:
+        if modo == DESATIVAR:
+            query = client.table(TABELA_VINCULOS).update({"is_active": False, "updated_at": agora})
+        else:
+            query = client.table(TABELA_VINCULOS).delete()
+        query.in_("id", bloco).execute()
+
+    for i in range(0, len(ids), IDS_POR_CONSULTA):
+        agendador.gravar(ids[i:i + IDS_POR_CONSULTA], _enviar)
+    return len(ids)
+
+
+def salvar_diferenca(
+    caminho: str,
+    excedentes: List[Dict[str, Any]],
+    faltantes: List[Tuple[str, str]],
+    modo: str,
+) -> None:
+    """Relatório CSV da reconciliação: uma linha por vínculo a remover ou a criar."""
+    with open(caminho, "w", newline="", encoding="utf-8") as f:
+        w = csv.writer(f)
+        w.writerow(["acao", "contract_id", "service_id", "contract_service_id"])
+        for v in excedentes:
+            w.writerow([modo, v["contract_id"], v["service_id"], v["id"]])
+        for contrato, servico in faltantes:
+            w.writerow(["criar", contrato, servico, ""])
@@ -0,0 +1,29 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+# Os testes importam `src.*` e os scripts da raiz de python/, como os próprios scripts fazem
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+# JWT com role service_role; o servidor local não confere a assinatura
+CHAVE_LOCAL = "eyJhbGciOiJIUzI1NiJ9.eyJyb2xlIjoic2VydmljZV9yb2xlIn0.x"
+
+
+@pytest.fixture
+def servidor():
+    """Servidor PostgREST local (src/servidor_local.py) sobre um banco em memória vazio."""
+    from src.servidor_local import ServidorLocal
+
+    with ServidorLocal() as srv:
+        yield srv
+
+
+@pytest.fixture
+def supabase(servidor):
+    """Cliente Supabase apontado para o `servidor` local."""
+    import httpx
+    from supabase import ClientOptions, create_client
+
+    with httpx.Client() as http:
+        yield create_client(servidor.url, CHAVE_LOCAL, options=ClientOptions(httpx_client=http))
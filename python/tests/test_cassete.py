@@ -0,0 +1,46 @@
+import httpx
+import pytest
+
+from src.cassete import ErroCassete, TransporteGravacao, TransporteReproducao, carregar_interacoes
+from src.servidor_local import semear
+
+
+def _clientes(http, tenant):
+    r = http.get("/rest/v1/customers", params={"select": "id,name", "tenant_id": f"eq.{tenant}", "order": "id"})
+    return r.status_code, r.json()
+
+
+def test_gravar_e_reproduzir(tmp_path, servidor):
+    tenants = semear(servidor.banco, tenants=2, clientes=3, vinculos_por_contrato=0)["tenants"]
+    cassete = str(tmp_path / "cassete.jsonl")
+
+    with httpx.Client(transport=TransporteGravacao(cassete), base_url=servidor.url) as http:
+        gravados = [_clientes(http, t) for t in tenants]
+    assert len(carregar_interacoes(cassete)) == 2
+
+    requisicoes = servidor.requisicoes
+    reproducao = TransporteReproducao(cassete, escala_latencia=0)
+    with httpx.Client(transport=reproducao, base_url="http://outro-projeto.local") as http:
+        # ordem inversa: cada consulta recebe a resposta do seu tenant, não a próxima da fila
+        reproduzidos = [_clientes(http, t) for t in reversed(tenants)]
+        assert reproduzidos == list(reversed(gravados))
+        assert reproducao.restantes() == 0
+        with pytest.raises(ErroCassete):
+            _clientes(http, tenants[0])  # já consumida
+        with pytest.raises(ErroCassete):
+            http.get("/rest/v1/customers", params={"select": "id,name", "tenant_id": "eq.outro"})
+    assert servidor.requisicoes == requisicoes  # nada foi à rede
+
+
+def test_gravadores_simultaneos_nao_se_sobrescrevem(tmp_path, servidor):
+    tenants = semear(servidor.banco, tenants=2, clientes=1, vinculos_por_contrato=0)["tenants"]
+    cassete = str(tmp_path / "cassete.jsonl")
+
+    # dois gravadores abertos ao mesmo tempo, como dois shards do mesmo script
+    with httpx.Client(transport=TransporteGravacao(cassete), base_url=servidor.url) as a, \
+            httpx.Client(transport=TransporteGravacao(cassete), base_url=servidor.url) as b:
+        esperados = [_clientes(a, tenants[0]), _clientes(b, tenants[1]), _clientes(a, tenants[1])]
+
+    assert len(carregar_interacoes(cassete)) == 3
+    with httpx.Client(transport=TransporteReproducao(cassete, escala_latencia=0), base_url=servidor.url) as http:
+        assert [_clientes(http, t) for t in (tenants[0], tenants[1], tenants[1])] == esperados
@@ -0,0 +1,47 @@
+import httpx
+
+from src.concorrencia import LimitadorAIMD
+from src.transporte import TransporteLimitado
+
+
+def _requisicao(limitador, latencia=0.01, erro=False):
+    limitador.adquirir()
+    limitador.liberar(latencia, erro)
+
+
+def test_limite_cai_pela_metade_com_erro_ou_latencia_alta():
+    limitador = LimitadorAIMD(inicial=16, minimo=2, latencia_alvo=1.0, intervalo_corte=0)
+    _requisicao(limitador, erro=True)
+    assert limitador.limite == 8
+    _requisicao(limitador, latencia=1.5)
+    assert limitador.limite == 4
+    for _ in range(5):
+        _requisicao(limitador, erro=True)
+    assert limitador.limite == 2  # não passa do mínimo
+    assert limitador.cortes == 7
+
+
+def test_limite_cresce_aos_poucos_e_corta_uma_vez_por_intervalo():
+    limitador = LimitadorAIMD(inicial=4, maximo=6, intervalo_corte=60)
+    for _ in range(4):
+        _requisicao(limitador)
+    assert limitador.limite > 4.9  # +1 por janela completa
+    _requisicao(limitador, erro=True)
+    limite = limitador.limite
+    _requisicao(limitador, erro=True)  # dentro do intervalo: sem novo corte
+    assert limitador.limite == limite and limitador.cortes == 1
+    for _ in range(100):
+        _requisicao(limitador)
+    assert limitador.limite == 6
+
+
+def test_transporte_reduz_o_limite_quando_o_servidor_responde_429():
+    limitador = LimitadorAIMD(inicial=8, intervalo_corte=0)
+    respostas = iter([429, 429, 200])
+    transporte = TransporteLimitado(httpx.MockTransport(lambda r: httpx.Response(next(respostas))), limitador)
+    with httpx.Client(transport=transporte, base_url="http://supabase.local") as client:
+        status = [client.get("/rest/v1/contracts").status_code for _ in range(3)]
+    assert status == [429, 429, 200]
+    assert limitador.cortes == 2
+    assert 2 < limitador.limite < 3
+    assert limitador.em_transito == 0
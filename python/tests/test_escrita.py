@@ -0,0 +1,31 @@
+import pytest
+
+from src.escrita import AgendadorEscrita, ErroEscrita
+
+
+def test_lote_grande_demais_e_dividido_ate_caber():
+    enviados, tentativas = [], []
+
+    def enviar(lote):
+        tentativas.append(len(lote))
+        if len(lote) > 3:
+            raise ErroEscrita("payload grande demais", status_code=413)
+        enviados.extend(lote)
+
+    agendador = AgendadorEscrita(tamanho_inicial=10, dormir=lambda s: None)
+    agendador.gravar(list(range(10)), enviar)
+
+    assert enviados == list(range(10))  # tudo enviado uma vez, na ordem
+    assert tentativas[:3] == [10, 5, 2]
+    assert agendador.estatisticas["divisoes"] > 0
+    assert agendador.estatisticas["repeticoes"] == 0
+    assert agendador.tamanho < 10
+
+
+def test_413_com_um_so_registro_nao_e_repetido_para_sempre():
+    def enviar(lote):
+        raise ErroEscrita("payload grande demais", status_code=413)
+
+    agendador = AgendadorEscrita(tamanho_inicial=1, dormir=lambda s: None)
+    with pytest.raises(ErroEscrita):
+        agendador.gravar([{"id": 1}], enviar)
@@ -0,0 +1,77 @@
+from datetime import datetime
+
+from openpyxl import load_workbook
+
+from src.catalogo import servicos_da_planilha
+from src.excel_template import (
+    COLUNA_CUSTO,
+    VINCULOS_COLUNA_CONTRACT_ID,
+    VINCULOS_COLUNA_CUSTO,
+    gerar_planilha_vinculos,
+    gerar_template,
+)
+from src.import_supabase import ler_planilha
+from src.planilha import iter_projetado
+from src.schema import contrato_columns
+
+SERVICOS = [
+    {"id": "11111111-1111-1111-1111-111111111111", "name": "PDV"},
+    {"id": "22222222-2222-2222-2222-222222222222", "name": "Comandas"},
+]
+
+LINHAS = [
+    ["1001", "Cliente A", "12.345.678/0001-90", datetime(2025, 1, 1), None, 150.0, "ativo", "", 30, "SIM", 4],
+    ["1002", "Cliente B", "98765432100", datetime(2025, 2, 1), datetime(2025, 12, 31), 80.5, "ativo", None, None, "NAO", "SIM"],
+]
+
+
+def _preencher_template(tmp_path, servicos):
+    caminho = gerar_template(str(tmp_path / "template.xlsx"), rows=10, servicos=servicos)
+    wb = load_workbook(caminho)
+    ws = wb["Contratos"]
+    primeira = 3 if servicos else 2
+    n = len(contrato_columns()) + (1 + len(servicos) if servicos else 0)
+    for i, linha in enumerate(LINHAS):
+        for col, valor in enumerate(linha[:n], start=1):
+            ws.cell(row=primeira + i, column=col, value=valor)
+    wb.save(caminho)
+    return caminho
+
+
+def test_template_por_tenant_ida_e_volta(tmp_path):
+    caminho = _preencher_template(tmp_path, SERVICOS)
+
+    registros, erros = ler_planilha(str(caminho))
+
+    assert erros == []
+    assert [r["id_contrato"] for r in registros] == ["1001", "1002"]
+    assert registros[0]["valor_total"] == 150.0
+    wb = load_workbook(caminho, read_only=True)
+    cabecalho = next(wb["Contratos"].iter_rows(max_row=1, values_only=True))
+    assert cabecalho[len(contrato_columns())] == COLUNA_CUSTO
+    assert [s["id"] for s in servicos_da_planilha(wb["Contratos"]).values()] == [s["id"] for s in SERVICOS]
+
+
+def test_template_sem_servicos_comeca_na_linha_2(tmp_path):
+    caminho = _preencher_template(tmp_path, [])
+
+    registros, erros = ler_planilha(str(caminho))
+
+    assert erros == []
+    assert [r["id_contrato"] for r in registros] == ["1001", "1002"]
+
+
+def test_planilha_vinculos_no_layout_da_vinculacao(tmp_path):
+    origem = _preencher_template(tmp_path, SERVICOS)
+    saida = tmp_path / "contratos_prontos_with_ids.xlsx"
+
+    res = gerar_planilha_vinculos(str(origem), str(saida), {"1001": "uuid-1001"})
+
+    assert res == {"linhas": 2, "sem_id": 1}
+    # leitura igual à de link_contracts_services_corrigido.py
+    ws = load_workbook(saida, read_only=True).active
+    mapeamento = servicos_da_planilha(ws)
+    assert [s["id"] for s in mapeamento.values()] == [s["id"] for s in SERVICOS]
+    colunas = [VINCULOS_COLUNA_CONTRACT_ID, VINCULOS_COLUNA_CUSTO] + list(mapeamento)
+    linhas = [valores for _, valores in iter_projetado(ws, colunas, min_row=3)]
+    assert linhas == [("uuid-1001", 30, "SIM", 4), (None, None, "NAO", "SIM")]
@@ -0,0 +1,83 @@
+import numpy as np
+import pytest
+
+from import_contract_services import (
+    _custo,
+    _por_valor,
+    montar_vinculo,
+    montar_vinculos,
+    parse_service_value,
+    ratear_custos,
+)
+
+TENANT = "8d2888f1-64a5-445f-84f5-2614d5160251"
+AGORA = "2025-01-01T00:00:00"
+SERVICOS = ["Gestao", "PDV/Comandas", "KDS", "NFCE"]
+IDS = {"Gestao": "id-gestao", "PDV/Comandas": "id-pdv", "KDS": None, "NFCE": "id-nfce"}
+
+# (contract_id, custo, valores das colunas de serviço na ordem de SERVICOS)
+LINHAS = [
+    ("c1", 100, ["SIM", "NÃO", None, "1"]),
+    ("c2", "99.99", ["SIM", "3", "SIM", ""]),  # KDS sem id ainda conta no rateio
+    ("c3", None, ["SIM", "SIM", "NAO", "SIM"]),
+    ("c4", 50, ["NÃO", "NAO", "0", None]),  # nenhum serviço ativo: custo não é dividido
+    ("c5", "abc", ["2.7", "SIM", None, "-1"]),  # custo inválido e quantidade negativa
+    ("c6", 0.1, ["SIM", "SIM", "SIM", "SIM"]),
+    ("c7", "", ["sim", "x", None, "TRUE"]),
+]
+
+
+def _laco_antigo(linhas):
+    """Rateio linha a linha, como o script fazia antes da matriz NumPy."""
+    vinculos = []
+    for contract_id, custo, valores in linhas:
+        ativos = sum(1 for v in valores if parse_service_value(v) > 0)
+        custo_por_servico = 0.0
+        if ativos > 0 and custo:
+            try:
+                custo_por_servico = float(custo) / ativos
+            except (ValueError, TypeError):
+                custo_por_servico = 0.0
+        for nome, valor in zip(SERVICOS, valores):
+            quantidade = parse_service_value(valor)
+            if quantidade == 0 or not IDS[nome]:
+                continue
+            vinculos.append(
+                montar_vinculo(
+                    contract_id, IDS[nome], quantidade, TENANT, custo_por_servico if nome == "Gestao" else 0.0, AGORA
+                )
+            )
+    return vinculos
+
+
+def _matriz(linhas):
+    quantidades = np.column_stack(
+        [_por_valor([l[2][j] for l in linhas], parse_service_value, np.int64) for j in range(len(SERVICOS))]
+    )
+    custos = ratear_custos(quantidades, _por_valor([l[1] for l in linhas], _custo, np.float64))
+    com_id = np.array([IDS[nome] is not None for nome in SERVICOS], dtype=bool)
+    quantidades[:, ~com_id] = 0
+    vinculos = montar_vinculos(
+        [l[0] for l in linhas], quantidades, custos, [IDS[nome] for nome in SERVICOS], SERVICOS.index("Gestao"), TENANT
+    )
+    for v in vinculos:
+        v["updated_at"] = AGORA
+    return vinculos
+
+
+def test_matriz_produz_os_mesmos_vinculos_do_laco_por_linha():
+    assert _matriz(LINHAS) == _laco_antigo(LINHAS)
+
+
+def test_rateio_divide_so_pelos_servicos_ativos():
+    quantidades = np.array([[1, 0, 2], [0, 0, 0], [1, 1, 1]], dtype=np.int64)
+    custos = np.array([90.0, 50.0, 10.0])
+    np.testing.assert_array_equal(ratear_custos(quantidades, custos), [45.0, 0.0, 10.0 / 3])
+
+
+@pytest.mark.parametrize(
+    "valor, esperado",
+    [("SIM", 1), ("não", 0), ("NAO", 0), (None, 0), ("", 0), ("3", 3), ("2.7", 2), (4, 4), ("-1", 0), ("x", 0)],
+)
+def test_parse_service_value(valor, esperado):
+    assert parse_service_value(valor) == esperado
@@ -0,0 +1,37 @@
+from import_contracts_from_excel import TENANT_ID_DEFAULT, upsert_contracts
+from src.outbox import Outbox
+from src.registros import ContratoLinha
+
+
+def _contrato(numero, status="ativo"):
+    return ContratoLinha(
+        customer_id="0b7e3d2a-4c1f-4e5a-8d9b-1a2b3c4d5e6f",
+        contract_number=numero,
+        status=status,
+        initial_date="2025-01-01",
+        final_date=None,
+        billing_type="mensal",
+        billing_day=10,
+    )
+
+
+def _contratos(servidor):
+    linhas = servidor.banco.selecionar(
+        "contracts", "contract_number,status", [("tenant_id", f"eq.{TENANT_ID_DEFAULT}")], "contract_number", 0, 100, False
+    )
+    linhas = linhas[0] if isinstance(linhas, tuple) else linhas
+    return [(linha["contract_number"], linha["status"]) for linha in linhas]
+
+
+def test_reimportar_pela_outbox_nao_duplica_contratos(tmp_path, servidor, supabase):
+    with Outbox(str(tmp_path / "outbox.sqlite3")) as outbox:
+        assert upsert_contracts(supabase, [_contrato("1"), _contrato("2")], outbox=outbox) == (2, 0, [])
+        outbox.drenar(supabase)
+
+        inseridos, atualizados, erros = upsert_contracts(
+            supabase, [_contrato("1", "cancelado"), _contrato("2"), _contrato("3")], outbox=outbox
+        )
+        assert (inseridos, atualizados, erros) == (1, 2, [])
+        assert outbox.drenar(supabase)["falhas"] == 0
+
+    assert _contratos(servidor) == [("1", "cancelado"), ("2", "ativo"), ("3", "ativo")]
@@ -0,0 +1,65 @@
+import sys
+
+from openpyxl import Workbook
+
+import link_contracts_services_corrigido as link
+from conftest import CHAVE_LOCAL
+from src.catalogo import limpar_cache
+from src.servidor_local import semear
+from src.vinculos import DESATIVAR
+
+
+def _linhas(banco, tabela, select):
+    linhas = banco.selecionar(tabela, select, [], "id", 0, 100, False)
+    return linhas[0] if isinstance(linhas, tuple) else linhas
+
+
+def _planilha(caminho, servicos, linhas):
+    wb = Workbook()
+    ws = wb.active
+    primeira_servico = link.COST_COL + 1
+    ws.append(["ID Contrato", "contract_id"] + [None] * (link.COST_COL - 3) + ["Custo"] + [s["name"] for s in servicos])
+    ws.append([None] * link.COST_COL + [s["id"] for s in servicos])
+    for contract_id, marcas in linhas:
+        linha = [None] * (primeira_servico - 1 + len(servicos))
+        linha[link.CONTRACT_ID_COL - 1] = contract_id
+        linha[primeira_servico - 1:] = marcas
+        ws.append(linha)
+    wb.save(caminho)
+
+
+def test_reconciliar_desativa_contrato_com_todos_os_servicos_em_nao(tmp_path, monkeypatch, servidor):
+    banco = servidor.banco
+    semear(banco, clientes=2, servicos=3, vinculos_por_contrato=2)
+    servicos = _linhas(banco, "services", "id,name")
+    vinculos = _linhas(banco, "contract_services", "contract_id,service_id")
+    contratos = sorted({v["contract_id"] for v in vinculos})
+    marcados = {c: {v["service_id"] for v in vinculos if v["contract_id"] == c} for c in contratos}
+    _planilha(
+        tmp_path / "contratos_prontos_with_ids.xlsx",
+        servicos,
+        [
+            (contratos[0], ["NÃO"] * len(servicos)),  # todos os serviços desmarcados
+            (contratos[1], ["SIM" if s["id"] in marcados[contratos[1]] else "NÃO" for s in servicos]),
+        ],
+    )
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(sys, "argv", ["link_contracts_services_corrigido.py"])
+    monkeypatch.setenv("SUPABASE_URL", servidor.url)
+    monkeypatch.setenv("SUPABASE_KEY", CHAVE_LOCAL)
+    monkeypatch.delenv("SUPABASE_SHARD", raising=False)
+    monkeypatch.delenv("SUPABASE_OUTBOX", raising=False)
+    monkeypatch.setattr(link, "RECONCILIAR", DESATIVAR)
+    monkeypatch.setattr(link, "DRY_RUN", False)
+    monkeypatch.setattr(link, "RECALCULAR_TOTAIS", False)
+    limpar_cache()
+
+    link.process_contract_services()
+
+    ativos = {
+        (v["contract_id"], v["service_id"]): v["is_active"]
+        for v in _linhas(banco, "contract_services", "contract_id,service_id,is_active")
+    }
+    assert all(not ativo for (c, _), ativo in ativos.items() if c == contratos[0])
+    assert all(ativo for (c, _), ativo in ativos.items() if c == contratos[1])
+    assert len(ativos) == 4
@@ -0,0 +1,34 @@
+from datetime import datetime
+
+from openpyxl import Workbook, load_workbook
+
+from src.excel_template import gerar_template
+from src.lote import ler_lote
+
+
+def _template_preenchido(caminho):
+    gerar_template(str(caminho), rows=5)
+    wb = load_workbook(caminho)
+    wb["Contratos"].append(["1001", "Cliente A", "12345678000190", datetime(2025, 1, 1), None, 10.0, "ativo", None])
+    wb.save(caminho)
+    return caminho
+
+
+def test_arquivo_corrompido_e_aba_fora_do_formato_viram_erros(tmp_path):
+    valido = _template_preenchido(tmp_path / "a_valido.xlsx")
+    corrompido = tmp_path / "b_corrompido.xlsx"
+    corrompido.write_bytes(b"isto nao e um zip")
+    outro = tmp_path / "c_outro.xlsx"
+    wb = Workbook()
+    wb.active.append(["coluna", "qualquer"])
+    wb.save(outro)
+
+    registros, erros, por_arquivo = ler_lote([valido, corrompido, outro], workers=2)
+
+    assert [r["id_contrato"] for r in registros] == ["1001"]
+    assert por_arquivo == {str(valido): 1, str(corrompido): 0, str(outro): 0}
+    assert any("b_corrompido.xlsx: não foi possível abrir" in e for e in erros)
+    assert any("c_outro.xlsx" in e and "ignorada" in e for e in erros)
+    assert any("c_outro.xlsx: nenhuma aba no formato do template" in e for e in erros)
+    # a aba Dicionario do template é esperada e não gera erro
+    assert not any("a_valido.xlsx" in e for e in erros)
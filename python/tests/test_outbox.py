@@ -0,0 +1,41 @@
+from src.outbox import ENVIADO, PENDENTE, Outbox
+
+
+def _status(servidor, contrato_id):
+    linhas = servidor.banco.selecionar("contracts", "status", [("id", f"eq.{contrato_id}")], None, 0, 10, False)
+    linhas = linhas[0] if isinstance(linhas, tuple) else linhas
+    return [linha["status"] for linha in linhas]
+
+
+def test_mesma_escrita_volta_a_fila_depois_de_outra(tmp_path, servidor, supabase):
+    contrato = {
+        "id": "6a3f4c1e-0d2b-4e8a-9b7c-5f1e2d3c4b5a",
+        "tenant_id": "8d2888f1-64a5-445f-84f5-2614d5160251",
+        "contract_number": "1001",
+    }
+    a = {**contrato, "status": "ativo"}
+    b = {**contrato, "status": "cancelado"}
+    with Outbox(str(tmp_path / "outbox.sqlite3")) as outbox:
+        assert outbox.enfileirar("contracts", "upsert", a, on_conflict="id")
+        assert not outbox.enfileirar("contracts", "upsert", a, on_conflict="id")  # já pendente
+        assert outbox.drenar(supabase)["enviados"] == 1
+        assert outbox.enfileirar("contracts", "upsert", b, on_conflict="id")
+        assert outbox.drenar(supabase)["enviados"] == 1
+        assert _status(servidor, contrato["id"]) == ["cancelado"]
+
+        # A -> B -> A: a última escrita precisa ser reenviada, senão o banco fica com B
+        assert outbox.enfileirar("contracts", "upsert", a, on_conflict="id")
+        assert outbox.contar() == {PENDENTE: 1, ENVIADO: 2, "falha": 0}
+        assert outbox.drenar(supabase) == {"enviados": 1, "falhas": 0, "pendentes": 0}
+        assert _status(servidor, contrato["id"]) == ["ativo"]
+
+
+def test_insert_reenviado_nao_duplica(tmp_path, servidor, supabase):
+    registro = {"tenant_id": "8d2888f1-64a5-445f-84f5-2614d5160251", "contract_number": "2002", "status": "ativo"}
+    with Outbox(str(tmp_path / "outbox.sqlite3")) as outbox:
+        assert outbox.enfileirar("contracts", "insert", registro)
+        outbox.drenar(supabase)
+        # a mesma escrita enfileirada de novo depois de enviada (ex.: resposta perdida)
+        assert outbox.enfileirar("contracts", "insert", registro)
+        outbox.drenar(supabase)
+    assert servidor.banco.contar("contracts") == 1
@@ -0,0 +1,92 @@
+from datetime import date, datetime
+
+import pytest
+
+from src.parsing import FORMATO_BR, FORMATO_ISO, ColunaData, detectar_formato_data, parse_date, parse_number
+
+
+@pytest.mark.parametrize(
+    "valor, esperado",
+    [
+        ("31/01/2025", "2025-01-31"),
+        ("1/2/2025", "2025-02-01"),
+        (" 05/03/2024 ", "2024-03-05"),
+        ("2025-01-31", "2025-01-31"),
+        ("2025-01-31T13:45:00", "2025-01-31"),
+        ("2025-01-31 13:45:00", "2025-01-31"),
+        ("20250131", "2025-01-31"),
+        (datetime(2025, 1, 31, 13, 45), "2025-01-31"),
+        (date(2025, 1, 31), "2025-01-31"),
+        ("31/02/2025", None),
+        ("2025-13-01", None),
+        ("amanhã", None),
+        ("", None),
+        ("   ", None),
+        (None, None),
+    ],
+)
+def test_parse_date(valor, esperado):
+    assert parse_date(valor) == esperado
+
+
+@pytest.mark.parametrize(
+    "valor, formato, esperado",
+    [
+        # o formato só define a ordem das tentativas: os dois são aceitos em qualquer coluna
+        ("02/03/2025", FORMATO_ISO, "2025-03-02"),
+        ("2025-03-02", FORMATO_BR, "2025-03-02"),
+    ],
+)
+def test_parse_date_aceita_o_outro_formato(valor, formato, esperado):
+    assert parse_date(valor, formato) == esperado
+
+
+@pytest.mark.parametrize(
+    "valores, esperado",
+    [
+        (["01/01/2025", "02/01/2025", "2025-01-03"], FORMATO_BR),
+        (["2025-01-01", "2025-01-02", "03/01/2025"], FORMATO_ISO),
+        ([None, "", 45000, "x"], FORMATO_BR),
+    ],
+)
+def test_detectar_formato_data(valores, esperado):
+    assert detectar_formato_data(valores) == esperado
+
+
+def test_coluna_data_fixa_o_formato_dominante_e_converte_a_coluna_mista():
+    coluna = ColunaData(amostra=3)
+    valores = ["2025-01-01", "2025-01-02", "03/01/2025", "04/01/2025", datetime(2025, 1, 5), "", "texto"]
+    convertidos = [coluna(v) for v in valores]
+    assert coluna.formato == FORMATO_ISO
+    assert convertidos == ["2025-01-01", "2025-01-02", "2025-01-03", "2025-01-04", "2025-01-05", None, None]
+
+
+def test_coluna_data_sem_amostra_suficiente_usa_o_formato_parcial():
+    coluna = ColunaData(amostra=50)
+    assert coluna("2025-06-01") == "2025-06-01"
+    assert coluna.formato is None
+    assert coluna("07/06/2025") == "2025-06-07"
+
+
+@pytest.mark.parametrize(
+    "valor, esperado",
+    [
+        ("1.234,56", 1234.56),
+        ("R$ 1.234,56", 1234.56),
+        ("-1.234,5", -1234.5),
+        ("0,5", 0.5),
+        ("1.234.567", 1234567.0),
+        ("1234.56", 1234.56),
+        ("12.5", 12.5),
+        (" 42 ", 42.0),
+        (10, 10.0),
+        (2.75, 2.75),
+        (True, 1.0),
+        ("abc", None),
+        ("1,2,3", None),
+        ("", None),
+        (None, None),
+    ],
+)
+def test_parse_number(valor, esperado):
+    assert parse_number(valor) == esperado
@@ -0,0 +1,20 @@
+from src.servidor_local import BancoLocal, semear
+
+
+def test_patch_ignora_colunas_geradas():
+    db = BancoLocal()
+    semear(db, clientes=3, vinculos_por_contrato=1)
+    vinculo = db.selecionar("contract_services", "id,unit_price", [], None, 0, 1, False)
+    vinculo = (vinculo[0] if isinstance(vinculo, tuple) else vinculo)[0]
+
+    linhas = db.atualizar(
+        "contract_services",
+        {"quantity": 3, "total_amount": 999, "is_active": False},
+        [("id", f"eq.{vinculo['id']}")],
+        retornar=True,
+    )
+
+    assert len(linhas) == 1
+    assert linhas[0]["is_active"] in (False, 0)
+    # total_amount continua sendo calculado pelo banco, não o valor enviado
+    assert linhas[0]["total_amount"] == round(vinculo["unit_price"] * 3, 2)
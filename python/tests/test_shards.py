@@ -0,0 +1,40 @@
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+from src.shards import Shard, chave_shard, indice_shard
+
+CHAVES = [chave_shard(n) for n in range(1, 2001)] + ["CT-001", "ação", ""]
+
+
+def test_indice_shard_e_o_mesmo_em_outro_processo():
+    codigo = (
+        "import json, sys\n"
+        "from src.shards import indice_shard\n"
+        "print(json.dumps([indice_shard(c, 7) for c in json.load(sys.stdin)]))\n"
+    )
+    saida = subprocess.run(
+        [sys.executable, "-c", codigo],
+        input=json.dumps(CHAVES),
+        capture_output=True,
+        text=True,
+        check=True,
+        cwd=Path(__file__).resolve().parent.parent,
+        env={"PYTHONHASHSEED": "123"},
+    ).stdout
+    assert json.loads(saida) == [indice_shard(c, 7) for c in CHAVES]
+
+
+def test_shards_particionam_as_chaves():
+    total = 4
+    shards = [Shard(i, total) for i in range(1, total + 1)]
+    for chave in CHAVES:
+        assert sum(s.contem(chave) for s in shards) == 1
+    tamanhos = [sum(s.contem(c) for c in CHAVES) for s in shards]
+    assert sum(tamanhos) == len(CHAVES)
+    assert min(tamanhos) > len(CHAVES) // total // 2  # nenhum shard vazio ou muito desbalanceado
+
+
+def test_chave_normaliza_o_numero_do_contrato():
+    assert chave_shard(123.0) == chave_shard(123) == chave_shard(" 123 ")
@@ -0,0 +1,23 @@
+import time
+
+from src.tarefas import CONCLUIDA, TOTAIS, FilaTarefas, shards_por_tenant
+
+
+def test_lease_vencido_e_reassumido_e_conclusao_antiga_e_rejeitada(tmp_path):
+    with FilaTarefas(str(tmp_path / "tarefas.sqlite3")) as fila:
+        job = fila.criar_job(TOTAIS, shards_por_tenant(["t1"]))
+        antiga = fila.reivindicar("w1", lease=0.05)
+        assert antiga is not None
+        assert fila.reivindicar("w2") is None  # lease ainda vale
+
+        time.sleep(0.1)
+        nova = fila.reivindicar("w2")
+        assert nova is not None and nova.id == antiga.id and nova.tentativas == antiga.tentativas + 1
+
+        assert not fila.renovar(antiga)
+        assert not fila.concluir(antiga, {"contratos": 1})
+        assert fila.concluir(nova, {"contratos": 2})
+        assert not fila.concluir(antiga, {"contratos": 1})
+
+        assert fila.contar(job) == {job: {CONCLUIDA: 1}}
+        assert fila.resultados(job) == {"contratos": 2}
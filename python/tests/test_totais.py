@@ -0,0 +1,86 @@
+from decimal import Decimal
+
+import pytest
+
+from src.servidor_local import semear
+from src.totais import agregar_totais, contratos_com_totais_alterados, recalcular_totais, totais_vinculo
+
+
+@pytest.mark.parametrize(
+    "vinculo, esperado",
+    [
+        ({"unit_price": 35, "quantity": 2}, ("70.00", "0.00", "0.00")),
+        # metades arredondam para longe do zero, como round(numeric, 2); float/round() daria 0.12
+        ({"unit_price": "0.125", "quantity": 1}, ("0.13", "0.00", "0.00")),
+        ({"unit_price": "10.05", "quantity": 1, "discount_percentage": "0.5"}, ("5.03", "5.03", "0.00")),
+        # desconto e imposto saem do valor sem arredondar antes (colunas geradas independentes)
+        (
+            {"unit_price": "33.33", "quantity": 3, "discount_percentage": "0.1", "tax_rate": 10},
+            ("89.99", "10.00", "9.00"),
+        ),
+        ({"unit_price": "19.9", "quantity": "1.5", "tax_rate": "5"}, ("29.85", "0.00", "1.49")),
+        ({"unit_price": None, "quantity": 3}, ("0.00", "0.00", "0.00")),
+        ({"unit_price": 12.5}, ("12.50", "0.00", "0.00")),  # quantity ausente vale 1
+    ],
+)
+def test_totais_vinculo_segue_as_formulas_das_colunas_geradas(vinculo, esperado):
+    assert totais_vinculo(vinculo) == tuple(Decimal(v) for v in esperado)
+
+
+def test_agregar_ignora_vinculos_inativos():
+    vinculos = [
+        {"contract_id": "a", "unit_price": "10.005", "quantity": 1},
+        {"contract_id": "a", "unit_price": "10.005", "quantity": 1},
+        {"contract_id": "a", "unit_price": 100, "quantity": 1, "is_active": False},
+        {"contract_id": "b", "unit_price": 1, "quantity": 1, "tax_rate": 10},
+    ]
+    assert agregar_totais(vinculos) == {
+        # cada vínculo é arredondado antes da soma: 10.01 + 10.01
+        "a": {"total_amount": Decimal("20.02"), "total_discount": Decimal("0.00"), "total_tax": Decimal("0.00")},
+        "b": {"total_amount": Decimal("1.00"), "total_discount": Decimal("0.00"), "total_tax": Decimal("0.10")},
+    }
+
+
+def test_so_contratos_com_totais_diferentes_sao_alterados():
+    totais = agregar_totais([{"contract_id": "a", "unit_price": 35, "quantity": 2}])
+    contratos = [
+        {"id": "a", "total_amount": 70.0, "total_discount": 0, "total_tax": 0},  # já correto
+        {"id": "b", "total_amount": 35.0, "total_discount": 0, "total_tax": 0},  # sem vínculo ativo: zera
+        {"id": "c", "total_amount": 0, "total_discount": None, "total_tax": 0},  # None conta como 0
+    ]
+    assert contratos_com_totais_alterados(contratos, totais) == [
+        {"id": "b", "total_amount": 0.0, "total_discount": 0.0, "total_tax": 0.0}
+    ]
+
+
+def _contratos(banco):
+    linhas = banco.selecionar("contracts", "id,total_amount,status", [], "id", 0, 1000, False)
+    linhas = linhas[0] if isinstance(linhas, tuple) else linhas
+    return {c["id"]: c for c in linhas}
+
+
+def test_recalcular_grava_em_lote_so_os_alterados(servidor, supabase):
+    banco = servidor.banco
+    tenant = semear(banco, clientes=30, servicos=4, vinculos_por_contrato=2)["tenants"][0]
+
+    primeira = recalcular_totais(supabase, tenant_id=tenant, tamanho_lote=10)
+    assert primeira["alterados"] == primeira["gravados"] == 30
+    soma = banco.conn.execute(
+        "SELECT contract_id, round(sum(total_amount), 2) FROM contract_services GROUP BY contract_id"
+    ).fetchall()
+    contratos = _contratos(banco)
+    assert {c: contratos[c]["total_amount"] for c, _ in soma} == dict(soma)
+
+    requisicoes = servidor.requisicoes
+    assert recalcular_totais(supabase, tenant_id=tenant)["gravados"] == 0
+    assert servidor.requisicoes - requisicoes == 2  # só as leituras de contratos e vínculos
+
+    vinculo = banco.selecionar("contract_services", "id,contract_id,quantity", [], "id", 0, 1, False)
+    vinculo = (vinculo[0] if isinstance(vinculo, tuple) else vinculo)[0]
+    banco.atualizar("contract_services", {"quantity": vinculo["quantity"] + 1}, [("id", f"eq.{vinculo['id']}")])
+    banco.atualizar("contracts", {"status": "CANCELED"}, [("id", f"eq.{vinculo['contract_id']}")])
+    terceira = recalcular_totais(supabase, tenant_id=tenant)
+    assert (terceira["alterados"], terceira["gravados"]) == (1, 1)
+    depois = _contratos(banco)[vinculo["contract_id"]]
+    assert depois["total_amount"] == contratos[vinculo["contract_id"]]["total_amount"] + 35.0
+    assert depois["status"] == "CANCELED"  # só os totais são reenviados
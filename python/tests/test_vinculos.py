@@ -0,0 +1,37 @@
+from link_contracts_services_corrigido import CAMPOS_ATUALIZADOS, build_link_record
+from src.servidor_local import semear
+from src.vinculos import gravar_vinculos
+
+
+def _linhas(banco, tabela, select, filtros=()):
+    linhas = banco.selecionar(tabela, select, list(filtros), "id", 0, 100, False)
+    return linhas[0] if isinstance(linhas, tuple) else linhas
+
+
+def test_vinculo_existente_so_recebe_os_campos_atualizaveis(servidor, supabase):
+    banco = servidor.banco
+    semear(banco, clientes=1, servicos=3, vinculos_por_contrato=1)
+    contrato = _linhas(banco, "contracts", "id,tenant_id")[0]
+    existente = _linhas(banco, "contract_services", "id,service_id")[0]
+    novo = next(s for s in _linhas(banco, "services", "id,default_price") if s["id"] != existente["service_id"])
+    # ajustes feitos pelo usuário depois da criação
+    banco.atualizar(
+        "contract_services", {"is_active": False, "due_value": 15, "installments": 6}, [("id", f"eq.{existente['id']}")]
+    )
+
+    vinculos = [
+        build_link_record(
+            contrato["id"], contrato["tenant_id"], {"id": servico_id, "value": 2}, {"default_price": 50.0}, None
+        )
+        for servico_id in (existente["service_id"], novo["id"])
+    ]
+    resumo = gravar_vinculos(supabase, vinculos, campos_atualizaveis=CAMPOS_ATUALIZADOS)
+
+    assert resumo["registros"] == 2
+    campos = "service_id,quantity,unit_price,is_active,due_value,installments,generate_billing"
+    por_servico = {v["service_id"]: v for v in _linhas(banco, "contract_services", campos)}
+    atualizado = por_servico[existente["service_id"]]
+    assert (atualizado["quantity"], atualizado["unit_price"]) == (2, 50.0)
+    assert (atualizado["is_active"], atualizado["due_value"], atualizado["installments"]) == (False, 15, 6)
+    criado = por_servico[novo["id"]]
+    assert (criado["quantity"], criado["is_active"], criado["due_value"], criado["generate_billing"]) == (2, True, 5, False)